@@ -0,0 +1,263 @@
+"""
+BidSync AI - Addendum Re-analysis
+Matches the sheets of a revised drawing set against an earlier job and only
+sends new or changed sheets to the model
+"""
+
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from documents import upload_path
+from engine import analyze_pdf, pdf_page_count
+from job_store import JobStore, file_sha256
+from pdf_render import iter_pdf_pages
+from pipeline import DEFAULT_MAX_IN_FLIGHT, plan_render_ranges
+from trades import resolve_trade_config
+from triage import read_sheet_infos
+
+# Sheets are compared on small renders; enough to see a moved wall or a
+# revision cloud, cheap enough to do for the whole set
+THUMBNAIL_DPI = 36
+# 16x16 difference hash = 256 bits per sheet
+DHASH_SIZE = 16
+# A matched sheet with the same title block and at most this many differing
+# bits is unchanged and keeps its earlier counts
+UNCHANGED_MAX_BITS = 4
+# A sheet without a readable drawing number matches the most similar earlier
+# sheet, if it is at least this close
+MATCH_MAX_BITS = 48
+
+
+def dhash(img: Image.Image) -> int:
+    """Difference hash: one bit per pair of horizontally adjacent cells, set if the left is brighter."""
+    gray = img.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE), Image.LANCZOS)
+    pixels = list(gray.getdata())
+    bits = 0
+    for row in range(DHASH_SIZE):
+        offset = row * (DHASH_SIZE + 1)
+        for col in range(DHASH_SIZE):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def hash_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def sheet_signatures(pdf_path: str, pages: List[int]) -> Dict[int, Dict]:
+    """Drawing number, title-block text and image hash of each page."""
+    sheet_infos = read_sheet_infos(pdf_path, pages)
+    signatures = {
+        page_num: {
+            "drawing_number": sheet_infos[page_num]["drawing_number"],
+            "title_text": sheet_infos[page_num]["title_text"],
+        }
+        for page_num in pages
+    }
+    for first_page, last_page in plan_render_ranges(pages, 1):
+        for page_num, page_hash in iter_pdf_pages(pdf_path, first_page, last_page, dpi=THUMBNAIL_DPI, encode=dhash):
+            if page_num in signatures:
+                signatures[page_num]["dhash"] = page_hash
+    return signatures
+
+
+def match_sheets(previous: Dict[int, Dict], current: Dict[int, Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Pair each current page with a previous one.
+
+    Sheets are paired by drawing number (the closest image wins if a number
+    repeats); sheets without a number pair with the most similar unpaired
+    sheet that has no number either. Returns one entry per current page,
+    with status "unchanged", "changed" or "new", and the previous sheets
+    that no longer appear.
+    """
+    unused = set(previous)
+
+    def closest(page_hash: int, candidates: List[int]) -> Tuple[Optional[int], Optional[int]]:
+        best_page, best_distance = None, None
+        for candidate in candidates:
+            distance = hash_distance(page_hash, previous[candidate]["dhash"])
+            if best_distance is None or distance < best_distance:
+                best_page, best_distance = candidate, distance
+        return best_page, best_distance
+
+    sheets = []
+    # Numbered sheets first, so a number-less sheet cannot take their partner
+    for page_num in sorted(current, key=lambda p: current[p]["drawing_number"] is None):
+        signature = current[page_num]
+        number = signature["drawing_number"]
+        candidates = [p for p in unused if previous[p]["drawing_number"] == number]
+        previous_page, distance = closest(signature["dhash"], candidates)
+        if number is None and (distance is None or distance > MATCH_MAX_BITS):
+            previous_page = None
+
+        if previous_page is None:
+            status = "new"
+        else:
+            unused.discard(previous_page)
+            unchanged = (distance <= UNCHANGED_MAX_BITS
+                         and signature["title_text"] == previous[previous_page]["title_text"])
+            status = "unchanged" if unchanged else "changed"
+        sheets.append({
+            "page": page_num,
+            "drawing_number": number,
+            "status": status,
+            "previous_page": previous_page,
+            "distance": distance if previous_page is not None else None,
+        })
+
+    sheets.sort(key=lambda sheet: sheet["page"])
+    removed = [
+        {"previous_page": page_num, "drawing_number": previous[page_num]["drawing_number"]}
+        for page_num in sorted(unused)
+    ]
+    return sheets, removed
+
+
+def device_deltas(trade_config: dict, previous_totals: Dict[str, int], totals: Dict[str, int]) -> List[Dict]:
+    """Per-device count change against the earlier job, for devices found in either."""
+    deltas = []
+    for key, (display_name, _) in trade_config["devices"].items():
+        before, after = previous_totals.get(key, 0), totals.get(key, 0)
+        if before or after:
+            deltas.append({
+                "device": key,
+                "name": display_name,
+                "previous": before,
+                "current": after,
+                "delta": after - before,
+            })
+    return deltas
+
+
+def previous_set_path(previous_job: Dict, previous_pdf: Optional[str] = None) -> str:
+    """The PDF the earlier job analyzed: previous_pdf, or the job's stored upload."""
+    previous_pdf = previous_pdf or upload_path(previous_job["file_sha256"])
+    if not os.path.exists(previous_pdf) or file_sha256(previous_pdf) != previous_job["file_sha256"]:
+        raise ValueError(f"The PDF analyzed by job {previous_job['id']} is no longer stored; pass it as previous_pdf")
+    return previous_pdf
+
+
+def addendum_scope(previous_job: Dict, previous_pdf: str, pdf_path: str) -> Dict:
+    """
+    Match the revised set against the earlier one and keep the sheets the
+    earlier job covered.
+
+    A sheet matched to an earlier sheet is in scope if that sheet was
+    analyzed; a new sheet is in scope if its page falls within the earlier
+    job's page range. Returns {"pages": in-scope pages, "sheets": their
+    matches (see match_sheets), "removed_sheets": earlier in-scope sheets
+    that no longer appear, "out_of_scope_sheets": the rest of the revised set}.
+    """
+    scope = set(previous_job["options"]["pages"])
+    sheets, removed = match_sheets(
+        sheet_signatures(previous_pdf, list(range(1, pdf_page_count(previous_pdf) + 1))),
+        sheet_signatures(pdf_path, list(range(1, pdf_page_count(pdf_path) + 1)))
+    )
+    in_scope, out_of_scope = [], []
+    for sheet in sheets:
+        if sheet["previous_page"] is not None:
+            covered = sheet["previous_page"] in scope
+        else:
+            covered = bool(scope) and min(scope) <= sheet["page"] <= max(scope)
+        (in_scope if covered else out_of_scope).append(sheet)
+    return {
+        "pages": [sheet["page"] for sheet in in_scope],
+        "sheets": in_scope,
+        "removed_sheets": [sheet for sheet in removed if sheet["previous_page"] in scope],
+        "out_of_scope_sheets": out_of_scope,
+    }
+
+
+def addendum_options(previous_job: Dict, pages: List[int]) -> Dict:
+    """The earlier job's analysis options, applied to the in-scope pages of the revised set."""
+    return {**previous_job["options"], "pages": pages}
+
+
+def analyze_addendum(pdf_path: str, previous_job_id: str, api_key: str, store: JobStore,
+                     previous_pdf: Optional[str] = None,
+                     max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                     filename: Optional[str] = None,
+                     client_kwargs: Optional[Dict] = None,
+                     job_id: Optional[str] = None,
+                     call_gate=None,
+                     on_page: Optional[Callable[[int, int, int, Optional[str]], None]] = None) -> Dict:
+    """
+    Re-analyze a revised drawing set against an earlier job.
+
+    Every sheet of the new PDF is matched to the earlier set. Sheets
+    outside the earlier job's scope (see addendum_scope) are left out of
+    the analysis and the deltas; of the rest, unchanged sheets keep their
+    stored counts and only new or changed sheets are analyzed, using the
+    earlier job's trade and options. The result is a new stored job with
+    the full results dict, plus the sheet matches ("sheets",
+    "removed_sheets", "out_of_scope_sheets") and "device_deltas" against
+    the earlier totals. previous_pdf defaults to the earlier job's stored
+    upload. With job_id, that queued job is run and its pages set to the
+    in-scope ones.
+    """
+    previous_job = store.get_job(previous_job_id)
+    if previous_job is None:
+        raise ValueError(f"No job {previous_job_id}")
+    previous_pdf = previous_set_path(previous_job, previous_pdf)
+
+    trade_key, trade_keys = previous_job["trade"], previous_job["trades"]
+    scope = addendum_scope(previous_job, previous_pdf, pdf_path)
+    sheets = scope["sheets"]
+    options = addendum_options(previous_job, scope["pages"])
+    filename = filename or os.path.basename(pdf_path)
+    if job_id is None:
+        job_id = store.create_job(filename, file_sha256(pdf_path), trade_key, trade_keys, options,
+                                  previous_job_id=previous_job_id)
+    else:
+        # A queued job only knows the earlier job's pages until its sheets are matched here
+        store.set_options(job_id, options)
+    # Unchanged sheets are recorded as already done, so the run below
+    # resumes past them and only analyzes the rest
+    previous_results = store.page_results(previous_job_id, include_failed=False)
+    done_pages = store.page_results(job_id, include_failed=False)
+    for sheet in sheets:
+        if sheet["status"] == "unchanged" and sheet["page"] not in done_pages:
+            result = previous_results.get(sheet["previous_page"])
+            if result is not None:
+                # The earlier run's tokens and timings are not spent again
+                result = {k: v for k, v in result.items() if k not in ("usage", "retries", "reasks", "metrics")}
+                store.record_page(job_id, sheet["page"], {
+                    **result,
+                    "carried_from": sheet["previous_page"],
+                    "metrics": {"outcome": "carried"},
+                })
+
+    results = analyze_pdf(
+        pdf_path,
+        trade_key,
+        api_key,
+        pages=options["pages"],
+        trade_keys=trade_keys,
+        max_in_flight=max_in_flight,
+        use_triage=options["use_triage"],
+        use_vector=options["use_vector"],
+        use_legend=options["use_legend"],
+        tiled=options["tiled"],
+        ensemble=options["ensemble"],
+        render_profile=options["render_profile"],
+        filename=filename,
+        client_kwargs=client_kwargs,
+        store=store,
+        job_id=job_id,
+        call_gate=call_gate,
+        on_page=on_page
+    )
+
+    previous_totals = store.load_results(previous_job_id)["total_devices"]
+    return {
+        **results,
+        "previous_job_id": previous_job_id,
+        "sheets": sheets,
+        "removed_sheets": scope["removed_sheets"],
+        "out_of_scope_sheets": scope["out_of_scope_sheets"],
+        "device_deltas": device_deltas(resolve_trade_config(trade_key, trade_keys), previous_totals,
+                                       results["total_devices"]),
+    }
@@ -0,0 +1,529 @@
+"""
+BidSync AI - Blueprint Page Analysis
+Prompt construction, model calls and response parsing shared by every analysis path
+"""
+
+import base64
+import json
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import elapsed_ms, page_metrics
+from model_client import AsyncModelClient, TransientAPIError
+from pdf_render import image_media_type
+from result_cache import ResultCache, cache_key
+
+# Vision model used for every page analysis
+MODEL_NAME = "claude-sonnet-4-5-20250929"
+MAX_TOKENS = 2000
+
+# Token counters reported in each response's usage block
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+# The only text sent with each page image; the rest of the prompt is cached
+PAGE_INSTRUCTION = "Count the devices on this page."
+
+# Appended to the prompt when the image is one tile of a larger sheet
+TILE_INSTRUCTIONS = """This image is ONE TILE of a larger sheet, cut with overlapping edges.
+Count only devices whose symbol is visible in this tile, including symbols cut by the tile edge.
+For every device you count, also give the center of its symbol as [x, y], where x and y run
+from 0 to 1000 across this tile's width and height, measured from the top-left corner.
+Put these in the tool's "locations" field: {"<device_key>": [[x, y], ...]}"""
+
+# Counts come back as the input of a forced tool call instead of free text
+TOOL_NAME = "record_device_counts"
+PAGE_TYPES = ["floor plan", "riser diagram", "schedule", "detail", "legend", "other"]
+
+# Malformed answers get one targeted follow-up before the page is failed
+MAX_REASKS = 1
+REASK_MESSAGE = """Your {tool} call could not be used:
+{problems}
+Call {tool} again for the same page with every device key present and a whole-number count for each."""
+
+# Uncertain legend matches are confirmed one grid image per page: numbered
+# cells with one candidate symbol each, below the legend's symbols
+CONFIRM_TOOL_NAME = "record_symbol_labels"
+NO_DEVICE = "none"
+CONFIRM_PROMPT = """This image is NOT a blueprint page. It is a grid of candidate symbols cut out of
+one construction drawing, each enlarged in its own numbered cell.
+
+{prompt_focus}
+
+The row(s) under "LEGEND" at the top show the drawing set's legend symbol for each device,
+captioned with its device key. They are for reference only and are not candidates.
+
+For every numbered cell, decide which device the symbol in the middle of the cell is, comparing
+it with the legend. Answer "{none}" if it is not one of these devices (text, a wall, a fixture,
+another trade's symbol). Symbols already counted elsewhere have been blanked out; ignore
+anything cut off at a cell's edge.
+
+Record your answer by calling the {tool} tool with exactly one label per numbered cell, in
+order of cell number. Use only these labels: {labels}"""
+CONFIRM_INSTRUCTION = "Label each of the {cells} numbered cells in this grid."
+CONFIRM_REASK_MESSAGE = """Your {tool} call could not be used:
+{problems}
+Call {tool} again for the same grid with exactly one label per numbered cell."""
+
+
+def build_analysis_prompt(trade_config: dict, tile: bool = False) -> str:
+    """Prompt asking for the trade's device counts through the counts tool."""
+    device_keys = list(trade_config["devices"].keys())
+
+    prompt = f"""Analyze this construction blueprint and count devices.
+
+{trade_config["prompt_focus"]}
+
+Record your answer by calling the {TOOL_NAME} tool. Use these EXACT device keys and give
+every one of them a count, 0 if the device does not appear on the page:
+{", ".join(device_keys)}
+
+Do not rename keys or add new ones."""
+    if tile:
+        prompt += "\n\n" + TILE_INSTRUCTIONS
+    return prompt
+
+
+def build_analysis_tool(trade_config: dict, tile: bool = False) -> Dict:
+    """Tool whose input schema is the trade's device counts."""
+    device_keys = list(trade_config["devices"].keys())
+    properties = {
+        "page_type": {"type": "string", "enum": PAGE_TYPES},
+        "description": {"type": "string", "description": "Brief description of what this page shows"},
+        "devices": {
+            "type": "object",
+            "properties": {
+                key: {"type": "integer", "minimum": 0, "description": trade_config["devices"][key][0]}
+                for key in device_keys
+            },
+            "required": device_keys,
+            "additionalProperties": False,
+        },
+        "notes": {"type": "string", "description": "Any relevant notes"},
+    }
+    if tile:
+        properties["locations"] = {
+            "type": "object",
+            "description": "Symbol centers per device key on a 0-1000 grid over this tile",
+            "additionalProperties": {
+                "type": "array",
+                "items": {"type": "array", "items": {"type": "number"}, "minItems": 2, "maxItems": 2},
+            },
+        }
+    return {
+        "name": TOOL_NAME,
+        "description": "Record the device counts for one blueprint page.",
+        "input_schema": {
+            "type": "object",
+            "properties": properties,
+            "required": ["page_type", "description", "devices", "notes"],
+        },
+    }
+
+
+def _image_block(image_data: bytes) -> Dict:
+    return {
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": image_media_type(image_data),
+            "data": base64.b64encode(image_data).decode('utf-8')
+        }
+    }
+
+
+def build_analysis_request(image_data: bytes, trade_config: dict, tile: bool = False) -> Dict:
+    """
+    Keyword arguments for messages.create for one page.
+
+    The trade prompt and device schema are identical for every page of a
+    job, so they go in a system block marked for prompt caching; the page
+    image is the only content that changes between calls. The model must
+    answer through the counts tool.
+    """
+    return {
+        "model": MODEL_NAME,
+        "max_tokens": MAX_TOKENS,
+        "tools": [build_analysis_tool(trade_config, tile)],
+        "tool_choice": {"type": "tool", "name": TOOL_NAME},
+        "system": [{
+            "type": "text",
+            "text": build_analysis_prompt(trade_config, tile),
+            "cache_control": {"type": "ephemeral"}
+        }],
+        "messages": [{
+            "role": "user",
+            "content": [_image_block(image_data), {"type": "text", "text": PAGE_INSTRUCTION}]
+        }]
+    }
+
+
+def build_confirmation_tool(trade_config: dict) -> Dict:
+    """Tool taking one device key (or NO_DEVICE) per cell of a candidate symbol grid."""
+    return {
+        "name": CONFIRM_TOOL_NAME,
+        "description": "Record which device each numbered cell of a candidate symbol grid shows.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "labels": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": list(trade_config["devices"].keys()) + [NO_DEVICE]},
+                    "description": "One label per numbered cell, in order of cell number",
+                },
+            },
+            "required": ["labels"],
+        },
+    }
+
+
+def build_confirmation_request(image_data: bytes, cells: int, trade_config: dict) -> Dict:
+    """
+    Keyword arguments for messages.create for one grid of uncertain legend
+    matches. Prompt and tool are the same for every grid of a trade, so
+    they are cached like the page prompt; only the image and the cell
+    count change.
+    """
+    labels = ", ".join(list(trade_config["devices"].keys()) + [NO_DEVICE])
+    return {
+        "model": MODEL_NAME,
+        "max_tokens": MAX_TOKENS,
+        "tools": [build_confirmation_tool(trade_config)],
+        "tool_choice": {"type": "tool", "name": CONFIRM_TOOL_NAME},
+        "system": [{
+            "type": "text",
+            "text": CONFIRM_PROMPT.format(prompt_focus=trade_config["prompt_focus"], none=NO_DEVICE,
+                                          tool=CONFIRM_TOOL_NAME, labels=labels),
+            "cache_control": {"type": "ephemeral"}
+        }],
+        "messages": [{
+            "role": "user",
+            "content": [_image_block(image_data), {"type": "text", "text": CONFIRM_INSTRUCTION.format(cells=cells)}]
+        }]
+    }
+
+
+def usage_from_message(message) -> Dict:
+    """Token counts of one response, including prompt cache reads and writes."""
+    usage = getattr(message, "usage", None)
+    return {field: getattr(usage, field, None) or 0 for field in USAGE_FIELDS}
+
+
+def add_usage(total: Dict, usage: Dict) -> Dict:
+    for field in USAGE_FIELDS:
+        total[field] = total.get(field, 0) + usage.get(field, 0)
+    return total
+
+
+def tool_call_from_message(message) -> Dict:
+    """The counts tool call of a complete (non-streamed) message, shaped like a streamed one."""
+    call = {"id": None, "name": None, "input_json": "", "text": "",
+            "stop_reason": getattr(message, "stop_reason", None), "usage": usage_from_message(message)}
+    for block in message.content:
+        if block.type == "tool_use" and call["id"] is None:
+            call["id"] = block.id
+            call["name"] = block.name
+            call["input_json"] = json.dumps(block.input)
+        elif block.type == "text":
+            call["text"] += block.text
+    return call
+
+
+def _device_key(key: str, device_keys: List[str]) -> Optional[str]:
+    """Map a returned key onto the trade's keys, tolerating case and separators."""
+    if key in device_keys:
+        return key
+    normalized = re.sub(r"[\s\-]+", "_", str(key).strip().lower())
+    return normalized if normalized in device_keys else None
+
+
+def _whole_number(value) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not value.isdigit():
+            return None
+        return int(value)
+    if isinstance(value, (int, float)) and value >= 0 and float(value).is_integer():
+        return int(value)
+    return None
+
+
+def validate_tool_call(call: Dict, device_keys: List[str], tile: bool = False) -> Tuple[Optional[Dict], Dict, List[str]]:
+    """
+    Check a tool call against the trade's device keys.
+
+    Returns (tool_input, result, problems). tool_input is the decoded call
+    input (None if it never became a JSON object), result the cleaned page
+    result, and problems what a re-ask needs to fix. An empty problems
+    list means the result can be used as-is.
+    """
+    if call["stop_reason"] == "max_tokens":
+        return None, {}, [f"the response was cut off at {MAX_TOKENS} tokens before the tool input was complete"]
+    if call["id"] is None:
+        return None, {}, [f"no {TOOL_NAME} call was made"]
+    try:
+        tool_input = json.loads(call["input_json"] or "{}")
+    except ValueError as e:
+        return None, {}, [f"the tool input was not valid JSON ({e})"]
+    if not isinstance(tool_input, dict):
+        return None, {}, ["the tool input was not a JSON object"]
+
+    problems = []
+    devices = {}
+    raw_devices = tool_input.get("devices")
+    if not isinstance(raw_devices, dict):
+        problems.append('"devices" is missing or is not an object')
+        raw_devices = {}
+    for key, value in raw_devices.items():
+        device_key = _device_key(key, device_keys)
+        if device_key is None:
+            problems.append(f'unknown device key "{key}"')
+            continue
+        count = _whole_number(value)
+        if count is None:
+            problems.append(f'count for "{key}" is not a whole number: {value!r}')
+            continue
+        devices[device_key] = count
+    missing = [key for key in device_keys if key not in devices and key not in raw_devices]
+    if missing:
+        problems.append(f"missing device keys: {', '.join(missing)}")
+
+    result = {
+        "page_type": tool_input.get("page_type") or "unknown",
+        "description": tool_input.get("description") or "",
+        "devices": devices,
+        "notes": tool_input.get("notes") or "",
+    }
+    if tile:
+        result["locations"] = tool_input.get("locations") or {}
+    return tool_input, result, problems
+
+
+def validate_confirmation_call(call: Dict, cells: int,
+                               device_keys: List[str]) -> Tuple[Optional[Dict], Dict, List[str]]:
+    """
+    Check a confirmation tool call: one known label per cell. Returns
+    (tool_input, result, problems) like validate_tool_call; result holds
+    the labels and the device counts they add up to.
+    """
+    if call["stop_reason"] == "max_tokens":
+        return None, {}, [f"the response was cut off at {MAX_TOKENS} tokens before the tool input was complete"]
+    if call["id"] is None:
+        return None, {}, [f"no {CONFIRM_TOOL_NAME} call was made"]
+    try:
+        tool_input = json.loads(call["input_json"] or "{}")
+    except ValueError as e:
+        return None, {}, [f"the tool input was not valid JSON ({e})"]
+    labels = tool_input.get("labels") if isinstance(tool_input, dict) else None
+    if not isinstance(labels, list):
+        return tool_input if isinstance(tool_input, dict) else None, {}, ['"labels" is missing or is not a list']
+
+    problems = []
+    if len(labels) != cells:
+        problems.append(f"{len(labels)} labels were given for {cells} cells")
+    devices = {key: 0 for key in device_keys}
+    for cell, label in enumerate(labels, start=1):
+        device_key = NO_DEVICE if str(label).strip().lower() == NO_DEVICE else _device_key(label, device_keys)
+        if device_key is None:
+            problems.append(f'unknown label "{label}" for cell {cell}')
+        elif device_key != NO_DEVICE:
+            devices[device_key] += 1
+    return tool_input, {"devices": devices, "labels": labels}, problems
+
+
+def build_reask_request(request: Dict, call: Dict, tool_input: Optional[Dict], problems: List[str],
+                        tool: str = TOOL_NAME, message: str = REASK_MESSAGE) -> Dict:
+    """Follow-up request telling the model exactly what was wrong with its answer."""
+    feedback = message.format(tool=tool, problems="\n".join(f"- {problem}" for problem in problems))
+    if call["id"] is not None and tool_input is not None:
+        messages = request["messages"] + [
+            {"role": "assistant", "content": [
+                {"type": "tool_use", "id": call["id"], "name": tool, "input": tool_input}
+            ]},
+            {"role": "user", "content": [
+                {"type": "tool_result", "tool_use_id": call["id"], "is_error": True, "content": feedback}
+            ]},
+        ]
+    else:
+        # Nothing valid to reply to: repeat the page with the feedback attached
+        first = request["messages"][0]
+        messages = [{"role": "user", "content": first["content"] + [{"type": "text", "text": feedback}]}]
+    return {**request, "messages": messages}
+
+
+def _malformed_error(problems: List[str]) -> str:
+    return f"Malformed response after {MAX_REASKS} re-ask(s): {'; '.join(problems)}"
+
+
+def analyze_blueprint_page(client, image_data: bytes, trade_config: dict, page_num: int = 1) -> Dict:
+    """Analyze a blueprint page for specific trade."""
+    device_keys = list(trade_config["devices"].keys())
+    started = time.perf_counter()
+    request = build_analysis_request(image_data, trade_config)
+    metrics = {"base64_ms": elapsed_ms(started), "model_ms": 0.0}
+    usage = {}
+    for reasks in range(MAX_REASKS + 1):
+        started = time.perf_counter()
+        try:
+            call = tool_call_from_message(client.messages.create(**request))
+        except Exception as e:
+            metrics["model_ms"] += elapsed_ms(started)
+            return {"error": str(e), "usage": usage, "metrics": {**metrics, "outcome": "error"}}
+        metrics["model_ms"] += elapsed_ms(started)
+        add_usage(usage, call["usage"])
+        tool_input, result, problems = validate_tool_call(call, device_keys)
+        if not problems:
+            outcome = "reasked" if reasks else "ok"
+            return {**result, "reasks": reasks, "usage": usage, "metrics": {**metrics, "outcome": outcome}}
+        request = build_reask_request(request, call, tool_input, problems)
+    return {"error": _malformed_error(problems), "usage": usage, "metrics": {**metrics, "outcome": "malformed"}}
+
+
+async def analyze_blueprint_page_async(client: AsyncModelClient, image_data: bytes,
+                                       trade_config: dict, page_num: int = 1, tile: bool = False) -> Dict:
+    """
+    Async version of analyze_blueprint_page.
+
+    The tool call is streamed and reading stops once its input is complete.
+    Transient failures (rate limits, overload, timeouts) are retried by the
+    client; if they persist the result is marked retryable so the pipeline
+    can queue the page for another round instead of dropping it.
+    """
+    device_keys = list(trade_config["devices"].keys())
+    started = time.perf_counter()
+    request = build_analysis_request(image_data, trade_config, tile)
+    return await _forced_tool_call_async(client, request, started,
+                                         lambda call: validate_tool_call(call, device_keys, tile))
+
+
+async def confirm_symbols_async(client: AsyncModelClient, image_data: bytes, cells: int, trade_config: dict,
+                                page_num: int = 1) -> Dict:
+    """Label the cells of a grid of uncertain legend matches; the result's devices count the labels."""
+    device_keys = list(trade_config["devices"].keys())
+    started = time.perf_counter()
+    request = build_confirmation_request(image_data, cells, trade_config)
+    return await _forced_tool_call_async(client, request, started,
+                                         lambda call: validate_confirmation_call(call, cells, device_keys),
+                                         CONFIRM_TOOL_NAME, CONFIRM_REASK_MESSAGE)
+
+
+async def _forced_tool_call_async(client: AsyncModelClient, request: Dict, started: float,
+                                  validate: Callable[[Dict], Tuple[Optional[Dict], Dict, List[str]]],
+                                  tool: str = TOOL_NAME, reask_message: str = REASK_MESSAGE) -> Dict:
+    """Stream the request's tool call, re-asking once if validate finds problems."""
+    # model_ms covers every attempt, including backoff between retries
+    metrics = {"base64_ms": elapsed_ms(started), "model_ms": 0.0}
+    usage = {}
+    retries = 0
+    for reasks in range(MAX_REASKS + 1):
+        started = time.perf_counter()
+        try:
+            call, info = await client.stream_tool_call(**request)
+        except TransientAPIError as e:
+            metrics["model_ms"] += elapsed_ms(started)
+            return {"error": str(e), "retryable": True, "retries": retries, "usage": usage,
+                    "metrics": {**metrics, "outcome": "error"}}
+        except Exception as e:
+            metrics["model_ms"] += elapsed_ms(started)
+            return {"error": str(e), "retries": retries, "usage": usage, "metrics": {**metrics, "outcome": "error"}}
+        metrics["model_ms"] += elapsed_ms(started)
+        retries += info["retries"]
+        add_usage(usage, call["usage"])
+        tool_input, result, problems = validate(call)
+        if not problems:
+            outcome = "reasked" if reasks else "ok"
+            return {**result, "reasks": reasks, "retries": retries, "usage": usage,
+                    "metrics": {**metrics, "outcome": outcome}}
+        request = build_reask_request(request, call, tool_input, problems, tool, reask_message)
+    return {"error": _malformed_error(problems), "retries": retries, "usage": usage,
+            "metrics": {**metrics, "outcome": "malformed"}}
+
+
+def _cacheable(result: Dict) -> Dict:
+    """Drop per-call bookkeeping that must not be replayed on a cache hit."""
+    return {k: v for k, v in result.items() if k not in ("retries", "reasks", "usage", "metrics")}
+
+
+def analyze_blueprint_page_cached(cache: ResultCache, client, image_data: bytes, trade_key: str,
+                                  trade_config: dict, page_num: int = 1) -> Dict:
+    """Analyze a page, reusing a cached result when the same image was already analyzed."""
+    key = cache_key(image_data, trade_key, trade_config["prompt_focus"], MODEL_NAME)
+    cached = cache.get(key)
+    if cached is not None:
+        return {**cached, "metrics": {"outcome": "cached"}}
+
+    result = analyze_blueprint_page(client, image_data, trade_config, page_num)
+    if "error" not in result:
+        cache.put(key, _cacheable(result))
+    return result
+
+
+async def analyze_blueprint_page_cached_async(cache: ResultCache, client: AsyncModelClient, image_data: bytes,
+                                              trade_key: str, trade_config: dict, page_num: int = 1,
+                                              tile: bool = False) -> Dict:
+    """Async version of analyze_blueprint_page_cached."""
+    key = cache_key(image_data, f"{trade_key}:tile" if tile else trade_key, trade_config["prompt_focus"], MODEL_NAME)
+    cached = cache.get(key)
+    if cached is not None:
+        return {**cached, "metrics": {"outcome": "cached"}}
+
+    result = await analyze_blueprint_page_async(client, image_data, trade_config, page_num, tile)
+    if "error" not in result:
+        cache.put(key, _cacheable(result))
+    return result
+
+
+async def confirm_symbols_cached_async(cache: ResultCache, client: AsyncModelClient, image_data: bytes, cells: int,
+                                       trade_key: str, trade_config: dict, page_num: int = 1) -> Dict:
+    """confirm_symbols_async, reusing a cached answer for the same grid image."""
+    key = cache_key(image_data, f"{trade_key}:confirm", trade_config["prompt_focus"], MODEL_NAME)
+    cached = cache.get(key)
+    if cached is not None:
+        return {**cached, "metrics": {"outcome": "cached"}}
+
+    result = await confirm_symbols_async(client, image_data, cells, trade_config, page_num)
+    if "error" not in result:
+        cache.put(key, _cacheable(result))
+    return result
+
+
+def new_aggregate(trade_config: dict) -> Dict:
+    """Empty job totals: per-device counts, per-page results, failed pages and per-page metrics."""
+    return {
+        "total_devices": {key: 0 for key in trade_config["devices"].keys()},
+        "page_results": [],
+        "failed_pages": {},
+        "usage": {field: 0 for field in USAGE_FIELDS},
+        "page_metrics": [],
+    }
+
+
+def add_page_result(aggregate: Dict, page_num: int, result: Dict) -> Optional[str]:
+    """Fold one page result into the job totals; returns the error if the page failed."""
+    add_usage(aggregate["usage"], result.get("usage", {}))
+    aggregate["page_metrics"].append(page_metrics(page_num, result))
+    if "error" in result:
+        aggregate["failed_pages"][page_num] = result.get("error", "Unknown error")
+        return aggregate["failed_pages"][page_num]
+
+    page_result = {
+        "page": page_num,
+        "type": result.get("page_type", "unknown"),
+        "description": result.get("description", ""),
+        "devices": result.get("devices", {}),
+        "notes": result.get("notes", "")
+    }
+    if "carried_from" in result:
+        # Unchanged sheet of an addendum, counted on this page of the earlier set
+        page_result["carried_from"] = result["carried_from"]
+    if "ensemble" in result:
+        # Sample ranges of an ensemble page, and whether it was re-counted tiled
+        page_result["ensemble"] = result["ensemble"]
+    aggregate["page_results"].append(page_result)
+    total_devices = aggregate["total_devices"]
+    for device_type, count in result.get("devices", {}).items():
+        if device_type in total_devices:
+            total_devices[device_type] += count
+    return None
@@ -4,17 +4,42 @@ Built for ASAP Security
 v18 - Fix JSON key matching for device counts
 """
 
+import os
+import time
 import streamlit as st
 import anthropic
-import base64
-import json
-from PIL import Image
-import io
-import pandas as pd
 from typing import Dict, List
-import re
-from pdf2image import convert_from_bytes
-import PyPDF2
+from addendum import device_deltas
+from analysis import analyze_blueprint_page_cached
+from batch_mode import collect_results, list_jobs, refresh_job, submit_batch
+from documents import document_info, store_upload, upload_path
+from ensemble import DEFAULT_ENSEMBLE_SIZE, MAX_ENSEMBLE_SIZE
+from exports import (
+    DEFAULT_MISC_COST,
+    DEFAULT_OVERHEAD_PCT,
+    DEFAULT_PROFIT_PCT,
+    calculate_bid,
+    export_csv,
+    export_filename,
+    export_json,
+    export_metrics_csv,
+    export_metrics_json,
+    export_summary,
+    metrics_filename,
+)
+from job_store import ACTIVE_STATUSES, JobStore
+from metrics import METRIC_FIELDS, page_metrics
+from pdf_render import DEFAULT_RENDER_PROFILE, RENDER_PROFILES, encode_image_file
+from pipeline import DEFAULT_MAX_IN_FLIGHT, MAX_IN_FLIGHT_LIMIT
+from result_cache import ResultCache
+from trades import MULTI_TRADE_KEY, TRADE_CONFIG, resolve_trade_config
+from triage import read_sheet_infos, triage_pages
+from workers import WorkerPool
+
+# Seconds between progress checks on a background job
+JOB_POLL_SECONDS = 2
+# Minimum seconds between full reruns that show a running job's counts so far
+PARTIAL_RESULTS_SECONDS = 10
 
 # Page config
 st.set_page_config(
@@ -23,512 +48,6 @@ st.set_page_config(
     layout="wide"
 )
 
-# ============================================
-# TRADE CONFIGURATIONS
-# ============================================
-TRADE_CONFIG = {
-    "all": {
-        "name": "All Trades",
-        "icon": "📋",
-        "description": "Show everything - fire alarm, sprinkler, electrical, security",
-        "devices": {
-            # Fire alarm
-            "smoke_detectors": ("Smoke Detectors (FA)", 0),
-            "heat_detectors": ("Heat Detectors", 0),
-            "pull_stations": ("Pull Stations", 0),
-            "horn_strobes": ("Horn/Strobes", 0),
-            "strobes_only": ("Strobes Only", 0),
-            "horns_speakers": ("Horns/Speakers", 0),
-            "duct_detectors": ("Duct Detectors", 0),
-            "facp": ("Fire Alarm Control Panel", 0),
-            "annunciator": ("Annunciator Panel", 0),
-            "monitor_modules": ("Monitor Modules", 0),
-            "relay_modules": ("Relay Modules", 0),
-            # Sprinkler
-            "sprinkler_heads": ("Sprinkler Heads", 0),
-            "risers": ("Risers", 0),
-            "fdc": ("Fire Dept Connection", 0),
-            "flow_switch": ("Flow Switch", 0),
-            "tamper_switch": ("Tamper Switch", 0),
-            # Electrical
-            "smoke_detectors_120v": ("Smoke Detectors (120VAC)", 0),
-            "exit_signs": ("Exit Signs", 0),
-            "emergency_lights": ("Emergency Lights", 0),
-            # Security
-            "cameras": ("Security Cameras", 0),
-            "card_readers": ("Card Readers", 0),
-            "door_contacts": ("Door Contacts", 0),
-            "access_panel": ("Access Control Panel", 0),
-        },
-        "prompt_focus": """Count ALL fire protection and life safety devices across all trades.
-
-=== SPRINKLER SYSTEM ===
-SPRINKLER HEADS:
-- Circles connected to piping lines on ceiling plans
-- On pages labeled "FP-", "Sprinkler", or "Fire Protection"
-- Count as sprinkler_heads ONLY - never as smoke detectors
-- Look for pendant, upright, sidewall types
-
-OTHER SPRINKLER:
-- Risers: Vertical pipe assemblies
-- FDC: Fire Department Connection (exterior)
-- Flow switches: On risers, monitors water flow
-- Tamper switches: On valves
-
-=== FIRE ALARM SYSTEM (24VDC Addressable) ===
-Found in corridors, common areas, lobbies - NOT in dwelling units.
-
-DETECTION:
-- Smoke detectors: Circle with "S" or "SD", labeled "Addressable"
-- Heat detectors: Circle with "H" or "HD", or triangle symbol
-- Pull stations: "PS" or "MPS" near exits/stairwells
-- Duct detectors: "DD" in HVAC ductwork
-
-NOTIFICATION:
-- Horn/strobes: "HS" or "H/S" - count as ONE device
-- Strobes: "S" on walls (visual only)
-- Horns/speakers: Speaker symbol
-
-PANELS - COUNT CAREFULLY:
-- FACP: Main Fire Alarm Control Panel - typically ONE per building
-- FARA/Annunciator: Remote display at entrance - count as annunciator NOT facp
-- If you see FACP + FARA = 1 facp + 1 annunciator
-
-MODULES - CHECK RISER DIAGRAMS:
-- Monitor modules (MM): For inputs (flow, tamper, elevator)
-- Relay modules (RM): For outputs (door holders, HVAC)
-- "ER" = Elevator Relay = count as relay_modules
-
-=== ELECTRICAL (120VAC) ===
-RESIDENTIAL SMOKE/CO - IN DWELLING UNITS ONLY:
-- Hardwired to electrical circuits
-- Found in bedrooms, unit hallways
-- NOT labeled "addressable"
-- Count as smoke_detectors_120v
-
-OTHER ELECTRICAL:
-- Exit signs: Illuminated exit signs
-- Emergency lights: Battery backup lights in egress paths
-
-=== SECURITY ===
-- Cameras: Security/surveillance cameras
-- Card readers: Access control at doors
-- Door contacts: Magnetic contacts on doors
-- Access panel: Security control panel (different from FACP)
-
-=== KEY RULES ===
-1. Sprinkler circles ≠ Smoke detectors
-2. Fire alarm smokes (addressable, corridors) ≠ Electrical smokes (120VAC, bedrooms)
-3. FARA = annunciator, NOT a second FACP
-4. Check riser diagrams for module counts
-5. Pull stations at EVERY stairwell on EVERY floor
-6. Count annunciator separately from FACP"""
-    },
-    
-    "fire_alarm": {
-        "name": "Fire Alarm",
-        "icon": "🚨",
-        "description": "Smoke detectors, pull stations, horn/strobes, panels",
-        "devices": {
-            "smoke_detectors": ("Smoke Detectors", 0),
-            "heat_detectors": ("Heat Detectors", 0),
-            "pull_stations": ("Pull Stations", 0),
-            "horn_strobes": ("Horn/Strobes", 0),
-            "strobes_only": ("Strobes Only", 0),
-            "horns_speakers": ("Horns/Speakers", 0),
-            "duct_detectors": ("Duct Detectors", 0),
-            "beam_detectors": ("Beam Detectors", 0),
-            "facp": ("Fire Alarm Control Panel", 0),
-            "annunciator": ("Annunciator Panel", 0),
-            "monitor_modules": ("Monitor Modules", 0),
-            "relay_modules": ("Relay Modules", 0),
-            "door_holders": ("Magnetic Door Holders", 0),
-        },
-        "prompt_focus": """Focus ONLY on FIRE ALARM devices. 
-
-CRITICAL: DO NOT count sprinkler heads! Sprinkler heads appear as:
-- Simple circles on ceiling/sprinkler plans
-- Connected to sprinkler piping lines
-- Pages labeled "FP-" or "Sprinkler" or "Fire Protection"
-- No letter designation inside the circle
-
-FIRE ALARM devices have these symbols (count ONLY these):
-
-DETECTION DEVICES:
-- Smoke detectors: Circle with "S" or "SD" inside, or diamond shape. May say "Addressable Smoke Detector". NOTE: Combo devices with built-in horn/strobe still count as ONE smoke detector.
-- Heat detectors: Circle with "H" or "HD" inside, or triangle shape
-- Pull stations: Square/rectangle near exits, labeled "PS" or "MPS" or "Manual Pull Station"
-- Duct detectors: Rectangle with "DD", mounted in ductwork
-- CO detectors: Circle with "CO" inside
-
-NOTIFICATION DEVICES:
-- Horn/strobes: "HS" or "H/S" symbol - counts as ONE device even if combo unit
-- Strobes only: "S" or strobe symbol on walls (visual only, no horn)
-- Horns/speakers: Speaker symbol or "SPK"
-- IMPORTANT: If smoke detectors have BUILT-IN horn/strobes (combo units), do NOT double count. The horn/strobe is part of the smoke detector.
-
-PANELS - COUNT VERY CAREFULLY:
-- FACP (Fire Alarm Control Panel): The MAIN control panel. Typically ONE per building. Located in electrical room, fire command center, or mechanical room. Symbol shows "FACP". This is where all circuits originate.
-- FARA or Annunciator: REMOTE display panel, usually at main entrance, lobby, or fire command. Shows "FARA" or "ANN" or "Remote Annunciator" or "Graphic Annunciator". COUNT THESE AS annunciator, NOT as facp!
-- RULE: If riser diagram shows FACP and FARA, count = 1 facp + 1 annunciator (NOT 2 facp)
-
-MODULES - CHECK RISER DIAGRAMS CAREFULLY:
-- Monitor modules (MM): Used to monitor input signals. Look for connections to:
-  * Sprinkler flow switches
-  * Tamper switches  
-  * Elevator equipment
-  * HVAC systems
-- Relay modules (RM): Used to control output devices. Look for:
-  * Door holder releases
-  * Elevator recall
-  * HVAC shutdown
-  * Stairwell pressurization
-- "ER" symbols = Elevator Relay modules - count these as relay_modules
-- Look at EACH FLOOR on riser diagram - count modules at interface points
-- Typical: 2-4 modules per elevator, 1-2 per floor for door holders, 1-2 for fire pump/sprinkler monitoring
-
-RISER DIAGRAM ANALYSIS - CRITICAL FOR ACCURATE COUNTS:
-- Riser diagrams show the SYSTEM ARCHITECTURE
-- MUST count these from riser diagram:
-
-ANNUNCIATOR (FARA):
-- Look for "FARA" or "Remote Annunciator" box - usually near FACP or at building entry
-- This is SEPARATE from FACP - count as annunciator, NOT as facp
-- Typical: 1 per building at main entrance
-
-PULL STATIONS:
-- Count pull stations at EACH stairwell on EACH floor
-- Riser shows "P" or pull station symbol at stairs
-- Formula: (number of stairs) x (number of floors) = minimum pull stations
-- Example: 2 stairs x 4 floors = 8 pull stations minimum
-
-MONITOR MODULES (MM):
-- Count at each interface point on riser
-- Elevator equipment: 1-2 MM per elevator
-- Fire pump/sprinkler: 1-2 MM for flow/tamper switches
-- HVAC interface: 1 MM per air handler with dampers
-
-RELAY MODULES (RM) / ELEVATOR RELAY (ER):
-- Count at each output interface
-- Elevator recall: 1-2 RM per elevator
-- Door holders: 1 RM per floor with fire doors
-- HVAC shutdown: 1 RM per air handler
-- "ER" symbols = Elevator Relay = count as relay_modules
-
-TYPICAL COUNTS FOR MULTI-STORY RESIDENTIAL:
-- 1 FACP
-- 1 Annunciator (FARA)
-- 8-12 pull stations (2 per floor x 4 floors)
-- 4-8 monitor modules
-- 4-8 relay modules
-
-DOOR HOLDERS:
-- Magnetic door holders keep fire doors open
-- Release on alarm - connected via relay module
-- Symbol may show door with magnet or "DH"
-
-Look at the LEGEND on each page to identify correct symbols.
-If a page is labeled "Sprinkler" or shows piping with circles, those are SPRINKLER HEADS - do NOT count them.
-If you're unsure about a symbol, count 0 rather than guessing."""
-    },
-    
-    "sprinkler": {
-        "name": "Sprinkler",
-        "icon": "💧",
-        "description": "Sprinkler heads, risers, valves, FDC",
-        "devices": {
-            "sprinkler_heads": ("Sprinkler Heads", 0),
-            "risers": ("Risers", 0),
-            "piv": ("PIV (Post Indicator Valve)", 0),
-            "osny": ("OS&Y Valve", 0),
-            "fdc": ("Fire Dept Connection", 0),
-            "flow_switch": ("Flow Switch", 0),
-            "tamper_switch": ("Tamper Switch", 0),
-            "inspectors_test": ("Inspector's Test", 0),
-            "fire_pump": ("Fire Pump", 0),
-        },
-        "prompt_focus": """STEP 1: CHECK THE DRAWING NUMBER IN THE TITLE BLOCK (bottom right corner).
-
-RETURN ALL ZEROS IF THE DRAWING NUMBER STARTS WITH:
-- "E" or "E-" (Electrical drawing - NOT sprinkler)
-- "FA" or "FA-" (Fire Alarm - NOT sprinkler)
-- "A" or "A-" (Architectural - NOT sprinkler)
-- "M" or "M-" (Mechanical - NOT sprinkler)
-- "P" or "P-" (Plumbing - may have some overlap but usually NOT sprinkler)
-
-ONLY COUNT SPRINKLERS IF DRAWING NUMBER STARTS WITH:
-- "FP" or "FP-" (Fire Protection)
-- "SP" or "SP-" (Sprinkler)
-- "FS" or "FS-" (Fire Suppression)
-
-ALSO RETURN ALL ZEROS IF:
-- Page title contains "Matrix", "Schedule", "Riser Detail", "Notes"
-- Page shows HVAC equipment (condensers, RTUs) - these are NOT sprinkler heads
-- Page shows smoke detectors or fire alarm devices
-- You see electrical symbols, conduit, panels
-- No actual sprinkler piping is visible
-
-STEP 2: IF AND ONLY IF THIS IS A SPRINKLER DRAWING (FP-, SP-, FS-):
-
-SPRINKLER HEADS: Small circles connected to piping lines running across ceiling
-- Must see actual PIPING (lines with pipe sizes like 1", 1-1/4", 2")
-- Heads are circles attached to the piping
-- No piping = 0 heads
-
-THESE ARE NOT SPRINKLER HEADS:
-- HVAC condensers/equipment on roof plans (rectangles with fans)
-- Smoke detectors (circles with "S" or "SD")
-- Any electrical symbol
-- Circles without piping connections
-
-OTHER DEVICES (count conservatively):
-- Risers: 1-2 per building typically
-- FDC: 1-2 per building
-- Flow/Tamper switches: 1-2 each per building
-- Fire Pump: Usually 0 unless dedicated pump room shown
-
-When in doubt, count 0."""
-    },
-    
-    "electrical": {
-        "name": "Electrical",
-        "icon": "⚡",
-        "description": "120VAC devices, panels, receptacles, lighting",
-        "devices": {
-            "smoke_detectors_120v": ("Smoke Detectors (120VAC)", 0),
-            "co_detectors_120v": ("CO Detectors (120VAC)", 0),
-            "combo_smoke_co": ("Combo Smoke/CO (120VAC)", 0),
-            "receptacles": ("Receptacles", 0),
-            "switches": ("Switches", 0),
-            "junction_boxes": ("Junction Boxes", 0),
-            "panels": ("Electrical Panels", 0),
-            "disconnects": ("Disconnects", 0),
-            "lighting_fixtures": ("Lighting Fixtures", 0),
-            "emergency_lights": ("Emergency Lights", 0),
-            "exit_signs": ("Exit Signs", 0),
-        },
-        "prompt_focus": """Focus ONLY on ELECTRICAL (120VAC line voltage) devices.
-
-CRITICAL - SMOKE DETECTOR DISTINCTION:
-DO NOT count fire alarm smoke detectors! Only count 120VAC residential type.
-
-120VAC SMOKE/CO (COUNT THESE):
-- Found in DWELLING UNITS (apartments, condos, bedrooms)
-- Hardwired to electrical circuits (shown on electrical branch circuits)
-- Symbol typically a simple circle with wire connection to circuit
-- Listed in electrical panel schedules
-- Usually 1-3 per dwelling unit in bedrooms/hallways
-- NOT labeled "addressable" or "SD"
-
-FIRE ALARM SMOKES (DO NOT COUNT - wrong trade):
-- Labeled "Addressable Smoke Detector" or "SD" or "S"
-- Connected to fire alarm SLC (signaling line circuit)
-- Found in corridors, common areas, lobbies
-- Part of building fire alarm system
-- Has horn/strobe or connects to notification devices
-- On pages labeled "Fire Alarm" or referenced to FACP
-
-RULE: If legend says "Addressable" = FIRE ALARM = DO NOT COUNT
-RULE: If in common corridor/lobby = likely FIRE ALARM = DO NOT COUNT
-RULE: If in bedroom/unit interior = likely 120VAC = COUNT
-
-RECEPTACLES:
-- Duplex outlets, GFI outlets
-- Count each outlet location (not each plug slot)
-
-SWITCHES:
-- Light switches, dimmers, 3-way switches
-- Count each switch location
-
-ELECTRICAL PANELS:
-- Main panels, sub-panels, load centers
-- Count panels shown in panel schedules or single-line diagrams
-
-DISCONNECTS:
-- HVAC disconnects at condensers/equipment (check ROOF PLANS)
-- Motor disconnects
-- Each piece of HVAC equipment needs a disconnect - count them on roof plans
-
-LIGHTING FIXTURES:
-- All light fixtures shown on reflected ceiling plans
-- Count symbols in fixture schedule
-
-EMERGENCY LIGHTS & EXIT SIGNS:
-- Battery backup lights
-- Illuminated exit signs (often have battery backup)
-- Found at exits, stairwells, corridors
-
-IGNORE: Fire alarm devices (24VDC), sprinkler, security, low voltage"""
-    },
-    
-    "security": {
-        "name": "Security/Access",
-        "icon": "🔐",
-        "description": "Cameras, card readers, door contacts, access control",
-        "devices": {
-            "cameras": ("Security Cameras", 0),
-            "card_readers": ("Card Readers", 0),
-            "door_contacts": ("Door Contacts", 0),
-            "motion_sensors": ("Motion Sensors", 0),
-            "glass_break": ("Glass Break Sensors", 0),
-            "access_panel": ("Access Control Panel", 0),
-            "electric_strike": ("Electric Strikes", 0),
-            "mag_locks": ("Magnetic Locks", 0),
-            "rex": ("REX (Request to Exit)", 0),
-            "keypad": ("Keypads", 0),
-            "intercom": ("Intercom Stations", 0),
-        },
-        "prompt_focus": """Focus ONLY on SECURITY and ACCESS CONTROL devices.
-
-=== WHAT TO COUNT ===
-
-CAMERAS:
-- Security/surveillance cameras
-- Symbols: Camera icon, "CAM", "CCTV"
-- Types: Fixed, PTZ, dome, bullet
-- Located at entrances, parking, corridors
-
-CARD READERS:
-- Access control readers at doors
-- Symbols: Rectangle at door with "CR" or "RDR"
-- May show proximity, smart card, or multi-tech
-
-DOOR CONTACTS:
-- Magnetic contacts that detect door open/close
-- Symbol: Small rectangle on door frame
-- Used for security monitoring
-
-MOTION SENSORS:
-- PIR (Passive Infrared) motion detectors
-- For intrusion detection
-- NOT the same as fire alarm heat detectors
-
-GLASS BREAK SENSORS:
-- Detect breaking glass
-- Usually near windows/storefronts
-
-ACCESS CONTROL PANEL:
-- Main security panel (like DSC, Honeywell, Lenel)
-- Different from FACP (fire alarm panel)
-- Usually in IT room or security office
-
-ELECTRIC STRIKES & MAG LOCKS:
-- Electric strike: Releases door latch
-- Mag lock: Electromagnetic lock on door
-- Located at secured doors
-
-REX (Request to Exit):
-- Motion sensor or button to exit
-- Located inside secured doors
-
-KEYPADS:
-- PIN entry devices
-- At secured entrances
-
-INTERCOM:
-- Audio/video stations at entries
-- Lobby panels, unit stations
-
-=== WHAT NOT TO COUNT ===
-DO NOT count these as security:
-- Smoke detectors (fire alarm)
-- Heat detectors (fire alarm)
-- Pull stations (fire alarm)
-- Horn/strobes (fire alarm)
-- FACP (fire alarm panel - different from access panel)
-- Sprinkler heads
-- Exit signs, emergency lights (electrical)
-- Magnetic door HOLDERS (fire alarm - releases doors on alarm)
-
-=== KEY DISTINCTION ===
-- Mag LOCK = Security (holds door locked) ✓ COUNT
-- Mag door HOLDER = Fire alarm (holds door open, releases on alarm) ✗ DON'T COUNT
-
-Look for pages labeled "Security", "Access Control", or "S-" drawings."""
-    },
-    
-    "low_voltage": {
-        "name": "Low Voltage",
-        "icon": "🔌",
-        "description": "All low voltage: fire alarm + security combined",
-        "devices": {
-            # Fire alarm
-            "smoke_detectors": ("Smoke Detectors", 0),
-            "heat_detectors": ("Heat Detectors", 0),
-            "pull_stations": ("Pull Stations", 0),
-            "horn_strobes": ("Horn/Strobes", 0),
-            "strobes_only": ("Strobes Only", 0),
-            "duct_detectors": ("Duct Detectors", 0),
-            "facp": ("Fire Alarm Control Panel", 0),
-            "annunciator": ("Annunciator Panel", 0),
-            "monitor_modules": ("Monitor Modules", 0),
-            "relay_modules": ("Relay Modules", 0),
-            "door_holders": ("Magnetic Door Holders", 0),
-            # Security
-            "cameras": ("Security Cameras", 0),
-            "card_readers": ("Card Readers", 0),
-            "door_contacts": ("Door Contacts", 0),
-            "motion_sensors": ("Motion Sensors", 0),
-            "access_panel": ("Access Control Panel", 0),
-        },
-        "prompt_focus": """Focus on ALL LOW VOLTAGE devices (Fire Alarm + Security).
-
-=== FIRE ALARM (24VDC Addressable) ===
-Found in corridors, common areas, lobbies.
-
-DETECTION:
-- Smoke detectors: Circle with "S" or "SD", "Addressable Smoke Detector"
-- Heat detectors: Circle with "H" or "HD", triangle shape
-- Pull stations: "PS" or "MPS" near exits
-- Duct detectors: "DD" in HVAC ductwork
-
-NOTIFICATION:
-- Horn/strobes: "HS" - count as ONE device even if combo
-- Strobes only: "S" on walls
-
-PANELS - CRITICAL:
-- FACP: Main Fire Alarm Control Panel - typically ONE per building
-- FARA/Annunciator: Remote display panel - COUNT AS annunciator NOT facp
-- RULE: FACP + FARA = 1 facp + 1 annunciator (NOT 2 facp)
-
-MODULES - CHECK RISER DIAGRAMS:
-- Monitor modules (MM): Inputs from flow switches, tamper, elevator
-- Relay modules (RM): Outputs to door holders, HVAC shutdown
-- "ER" = Elevator Relay = count as relay_modules
-- Look at each floor on riser - count interface points
-
-DOOR HOLDERS:
-- Magnetic holders keep fire doors open
-- Release on alarm
-- Connected via relay module
-
-=== SECURITY ===
-CAMERAS:
-- Security cameras: "CAM", camera icon
-
-ACCESS CONTROL:
-- Card readers: "CR" or "RDR" at doors
-- Door contacts: Magnetic sensors on doors
-- Motion sensors: PIR for intrusion (not fire alarm heat detectors)
-
-PANELS:
-- Access control panel: Security panel (different from FACP)
-
-=== WHAT NOT TO COUNT ===
-DO NOT count:
-- Sprinkler heads (suppression, not low voltage)
-- 120VAC smoke detectors (electrical, not low voltage)
-- Exit signs, emergency lights (electrical)
-- Receptacles, switches (electrical)
-
-=== KEY RULES ===
-1. Fire alarm smokes (addressable) ≠ Electrical smokes (120VAC)
-2. FARA = annunciator, NOT second FACP
-3. Check riser diagrams for module counts
-4. Mag LOCK (security) ≠ Mag door HOLDER (fire alarm)"""
-    }
-}
-
 # ============================================
 # CUSTOM CSS - Dark theme
 # ============================================
@@ -827,126 +346,131 @@ def check_password():
         return True
 
 # ============================================
-# ANALYSIS FUNCTION
+# PDF HELPERS
 # ============================================
-def analyze_blueprint_page(client, image_data: bytes, trade_config: dict, page_num: int = 1) -> Dict:
-    """Analyze a blueprint page for specific trade."""
-    
-    base64_image = base64.b64encode(image_data).decode('utf-8')
-    
-    # Build device list for JSON response
-    device_keys = list(trade_config["devices"].keys())
-    device_json = {key: 0 for key in device_keys}
-    
-    prompt = f"""Analyze this construction blueprint and count devices.
-
-{trade_config["prompt_focus"]}
-
-CRITICAL: Return ONLY valid JSON with these EXACT device keys (use these exact names):
-{json.dumps(device_json, indent=2)}
-
-Full response format:
-{{
-    "page_type": "floor plan/riser diagram/schedule/detail/legend/other",
-    "description": "Brief description of what this page shows",
-    "devices": {json.dumps(device_json)},
-    "notes": "Any relevant notes"
-}}
-
-Use the EXACT device key names shown above. Do not rename keys.
-Return ONLY the JSON object, nothing else."""
-
-    try:
-        response = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=2000,
-            messages=[{
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/jpeg",
-                            "data": base64_image
-                        }
-                    },
-                    {"type": "text", "text": prompt}
-                ]
-            }]
+def get_upload(uploaded_file) -> Dict:
+    """Spool an uploaded PDF to disk once; later reruns reuse the stored copy without reading the upload."""
+    upload = st.session_state.get('upload')
+    if upload is None or upload['file_id'] != uploaded_file.file_id:
+        uploaded_file.seek(0)
+        upload = {
+            "file_id": uploaded_file.file_id,
+            "path": store_upload(uploaded_file),
+        }
+        st.session_state['upload'] = upload
+    return upload
+
+@st.cache_data(max_entries=16, show_spinner="Reading PDF...")
+def get_document_info(path: str) -> Dict:
+    """Page count and sizes, cached by the content-addressed upload path."""
+    return document_info(path)
+
+@st.cache_data(max_entries=16, show_spinner="Reading sheet numbers...")
+def get_sheet_infos(path: str, page_count: int) -> Dict[int, Dict]:
+    """Text-layer sheet info for every page, cached by the content-addressed upload path."""
+    return read_sheet_infos(path, list(range(1, page_count + 1)))
+
+@st.cache_resource
+def get_job_store() -> JobStore:
+    """One job store connection shared by every session."""
+    return JobStore()
+
+@st.cache_resource
+def get_worker_pool() -> WorkerPool:
+    """Background analysis workers shared by every session, started on first use."""
+    return WorkerPool()
+
+def load_job_results(job_id: str) -> Dict:
+    """A stored job's results, with the device changes if it is an addendum."""
+    store = get_job_store()
+    results = store.load_results(job_id)
+    previous = store.load_results(results['previous_job_id']) if results.get('previous_job_id') else None
+    if previous is not None:
+        results['device_deltas'] = device_deltas(
+            resolve_trade_config(results['trade'], results['trades']),
+            previous['total_devices'],
+            results['total_devices']
         )
-        
-        response_text = response.content[0].text.strip()
-        
-        # Try to parse JSON - handle markdown code blocks
-        if "```json" in response_text:
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```', response_text)
-            if json_match:
-                response_text = json_match.group(1)
-        elif "```" in response_text:
-            json_match = re.search(r'```\s*([\s\S]*?)\s*```', response_text)
-            if json_match:
-                response_text = json_match.group(1)
-        
-        # Find JSON object - use non-greedy matching for nested braces
-        json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response_text)
-        if json_match:
-            try:
-                result = json.loads(json_match.group())
-                # Ensure devices dict has integer values
-                if "devices" in result:
-                    for key in result["devices"]:
-                        try:
-                            result["devices"][key] = int(result["devices"][key])
-                        except (ValueError, TypeError):
-                            result["devices"][key] = 0
-                return result
-            except json.JSONDecodeError as e:
-                return {"error": f"JSON parse error: {e}", "raw": response_text}
+        # Revised sheets outside the earlier job's pages are not part of the comparison
+        job = store.get_job(job_id)
+        revised_pdf = upload_path(job['file_sha256'])
+        if os.path.exists(revised_pdf):
+            analyzed = set(job['options']['pages'])
+            results['out_of_scope_pages'] = [
+                page_num for page_num in range(1, get_document_info(revised_pdf)['page_count'] + 1)
+                if page_num not in analyzed
+            ]
+    return results
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress(job_id: str):
+    """Poll a background job; once it stops, load its results and rerun the page."""
+    progress = get_worker_pool().progress(job_id)
+    if progress is None:
+        st.session_state.pop('active_job_id', None)
+        return
+    
+    status = progress["status"]
+    if status in ACTIVE_STATUSES:
+        pages_done, pages_total = progress["pages_done"], progress["pages_total"]
+        st.progress(min(pages_done / pages_total, 1.0) if pages_total else 0.0)
+        if status == "queued":
+            st.text("Waiting for a free worker...")
+        elif status == "cancelling":
+            st.text("Cancelling after the pages in progress...")
         else:
-            # Last resort - try parsing the whole response
-            try:
-                return json.loads(response_text)
-            except:
-                return {"error": "Could not find JSON in response", "raw": response_text[:500]}
-            
-    except Exception as e:
-        return {"error": str(e)}
-
-def convert_pdf_page_to_image(pdf_bytes: bytes, page_num: int) -> bytes:
-    """Convert a specific PDF page to image."""
-    try:
-        images = convert_from_bytes(
-            pdf_bytes,
-            first_page=page_num,
-            last_page=page_num,
-            dpi=150
-        )
-        
-        if images:
-            img = images[0]
-            max_dim = 2000
-            if max(img.size) > max_dim:
-                ratio = max_dim / max(img.size)
-                new_size = tuple(int(dim * ratio) for dim in img.size)
-                img = img.resize(new_size, Image.LANCZOS)
-            
-            img_byte_arr = io.BytesIO()
-            if img.mode == 'RGBA':
-                img = img.convert('RGB')
-            img.save(img_byte_arr, format='JPEG', quality=75, optimize=True)
-            return img_byte_arr.getvalue()
-    except Exception as e:
-        st.error(f"Error converting page {page_num}: {str(e)}")
-    return None
-
-def get_pdf_page_count(pdf_bytes: bytes) -> int:
-    """Get total number of pages in PDF."""
-    try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
-        return len(pdf_reader.pages)
-    except:
-        return 0
+            st.text(f"Analyzed {pages_done} of {pages_total} pages...")
+        if progress["pages_skipped"]:
+            st.caption(f"⏭️ {progress['pages_skipped']} pages skipped by triage")
+        if progress["pages_failed"]:
+            st.caption(f"⚠️ {progress['pages_failed']} pages failed so far")
+        if st.button("✖ Cancel", key=f"cancel_{job_id}", disabled=status == "cancelling",
+                     help="Stops after the pages in progress; the counts so far stay available to bid on"):
+            get_worker_pool().cancel(job_id)
+        # Show the counts so far, rerunning the whole page only when pages have
+        # finished since the last update and no more than every few seconds
+        shown = st.session_state.get('partial_results', {})
+        if pages_done > shown.get('pages_done', 0) and \
+                time.monotonic() - shown.get('loaded_at', 0.0) >= PARTIAL_RESULTS_SECONDS:
+            st.session_state['partial_results'] = {"pages_done": pages_done, "loaded_at": time.monotonic()}
+            st.session_state['analysis_results'] = load_job_results(job_id)
+            st.rerun()
+        return
+    
+    st.session_state.pop('active_job_id', None)
+    st.session_state.pop('partial_results', None)
+    if status == "failed":
+        st.error(f"Analysis failed: {progress['error']}")
+        return
+    st.session_state['analysis_results'] = load_job_results(job_id)
+    st.session_state.pop('editable_counts', None)
+    st.session_state.pop('editable_prices', None)
+    st.rerun()
+
+def follow_streamed_counts(trade_config: dict, total_devices: Dict):
+    """
+    Move the count inputs along with counts streamed from a running job,
+    leaving any count the user has edited alone.
+    """
+    streamed = st.session_state.setdefault('streamed_counts', {})
+    for key in trade_config["devices"]:
+        count = total_devices.get(key, 0)
+        previous = streamed.get(key)
+        current = st.session_state.get(f"c_{key}", st.session_state['editable_counts'].get(key, previous))
+        if previous is not None and count != previous and current == previous:
+            # Without its widget state the input starts again from the new count
+            st.session_state.pop(f"c_{key}", None)
+            st.session_state['editable_counts'][key] = count
+        streamed[key] = count
+
+def format_token_usage(usage: Dict) -> str:
+    """One-line summary of a job's token usage, including prompt cache reads and writes."""
+    cache_read = usage.get("cache_read_input_tokens", 0)
+    cache_write = usage.get("cache_creation_input_tokens", 0)
+    prompt_tokens = usage.get("input_tokens", 0) + cache_read + cache_write
+    hit_rate = f" ({cache_read / prompt_tokens:.0%} of prompt tokens)" if prompt_tokens else ""
+    return (f"🪙 Tokens: {prompt_tokens:,} in · {usage.get('output_tokens', 0):,} out · "
+            f"prompt cache {cache_read:,} read{hit_rate} / {cache_write:,} written")
 
 # ============================================
 # MAIN APPLICATION
@@ -991,6 +515,20 @@ def main():
                 
                 st.caption(trade_info['description'])
         
+        # Multi-trade: one pass over the drawings, then switch views freely
+        st.markdown("---")
+        st.markdown("#### 🧩 Multi-Trade Pass")
+        multi_trades = st.multiselect(
+            "Analyze several trades with one pass over the drawings",
+            options=list(TRADE_CONFIG.keys()),
+            format_func=lambda key: f"{TRADE_CONFIG[key]['icon']} {TRADE_CONFIG[key]['name']}",
+            help="Each page is rendered and analyzed once; switch between trade views afterwards"
+        )
+        if st.button("Analyze Selected Trades", disabled=len(multi_trades) < 2):
+            st.session_state['selected_trade'] = MULTI_TRADE_KEY
+            st.session_state['selected_trades'] = multi_trades
+            st.rerun()
+        
         # Settings at bottom
         st.markdown("---")
         with st.expander("⚙️ Settings"):
@@ -1008,7 +546,7 @@ def main():
         # STEP 2: ANALYSIS (Trade Selected)
         # ========================================
         trade_key = st.session_state['selected_trade']
-        trade_config = TRADE_CONFIG[trade_key]
+        trade_config = resolve_trade_config(trade_key, st.session_state.get('selected_trades'))
         
         # Show selected trade with change option
         col1, col2 = st.columns([4, 1])
@@ -1020,7 +558,12 @@ def main():
         with col2:
             if st.button("Change", use_container_width=True):
                 st.session_state['selected_trade'] = None
+                st.session_state.pop('selected_trades', None)
+                st.session_state.pop('trade_view', None)
                 st.session_state.pop('analysis_results', None)
+                st.session_state.pop('active_job_id', None)
+                st.session_state.pop('partial_results', None)
+                st.session_state.pop('streamed_counts', None)
                 st.session_state.pop('editable_counts', None)
                 st.session_state.pop('editable_prices', None)
                 st.rerun()
@@ -1034,6 +577,14 @@ def main():
             )
             if api_key:
                 st.session_state['api_key'] = api_key
+            
+            st.session_state['max_in_flight'] = st.number_input(
+                "Concurrent model calls",
+                min_value=1,
+                max_value=MAX_IN_FLIGHT_LIMIT,
+                value=st.session_state.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT),
+                help="Pages analyzed in parallel. Lower this if you hit API rate limits."
+            )
         
         st.markdown("---")
         
@@ -1046,14 +597,22 @@ def main():
         )
         
         if uploaded_file and st.session_state.get('api_key'):
-            file_bytes = uploaded_file.read()
-            uploaded_file.seek(0)
-            
             # Handle PDF
             if uploaded_file.type == "application/pdf":
-                total_pages = get_pdf_page_count(file_bytes)
-                st.success(f"✓ {uploaded_file.name} ({len(file_bytes)/1_000_000:.1f} MB)")
-                st.info(f"📄 {total_pages} pages detected")
+                pdf_path = get_upload(uploaded_file)['path']
+                try:
+                    document = get_document_info(pdf_path)
+                except Exception as e:
+                    st.error(f"Could not read {uploaded_file.name}: {e}")
+                    return
+                total_pages = document['page_count']
+                if not total_pages:
+                    st.error(f"{uploaded_file.name} has no pages")
+                    return
+                largest_sheet = max(document['page_sizes'], key=lambda size: size[0] * size[1])
+                st.success(f"✓ {uploaded_file.name} ({document['size_bytes']/1_000_000:.1f} MB)")
+                st.info(f"📄 {total_pages} pages detected, largest sheet "
+                        f"{largest_sheet[0]:g} × {largest_sheet[1]:g} in")
                 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -1061,83 +620,161 @@ def main():
                 with col2:
                     end_page = st.number_input("End page", min_value=1, max_value=total_pages, value=total_pages)
                 
+                use_triage = st.checkbox(
+                    "⏭️ Skip sheets that can't contain these devices",
+                    value=True,
+                    help="Reads drawing numbers and sheet titles from the PDF text layer "
+                         "(e.g. E- sheets for Sprinkler) and skips those pages before any model call"
+                )
+                
+                use_vector = st.checkbox(
+                    "📐 Count tagged symbols from CAD vector data",
+                    value=True,
+                    help="Sheets exported from Revit/AutoCAD carry device tags (SD, PS, FDC ...) as text inside "
+                         "vector symbols. Those pages are counted locally in milliseconds; scans and sheets with "
+                         "legends, untagged or ambiguous symbols still go to the model"
+                )
+                
+                use_legend = st.checkbox(
+                    "🔣 Match symbols against the set's legend",
+                    value=True,
+                    help="Finds the symbol legend in the set, cuts out each device's symbol and matches it "
+                         "on every plan sheet locally. Only uncertain matches are shown to the model, as one "
+                         "small image per page; devices missing from the legend are counted by the model on "
+                         "the sheet, and sheets without matches are analyzed as usual"
+                )
+                
+                tiled_mode = st.checkbox(
+                    "🔬 Tiled high-resolution mode",
+                    value=False,
+                    help="For dense E-size sheets: renders at higher DPI and analyzes overlapping tiles. "
+                         "More accurate on small symbols, but makes many more model calls per page"
+                )
+                
+                ensemble_size = st.number_input(
+                    "🎲 Samples per page",
+                    min_value=1,
+                    max_value=MAX_ENSEMBLE_SIZE,
+                    value=1,
+                    disabled=tiled_mode,
+                    help=f"Analyzes every page this many times at once (try {DEFAULT_ENSEMBLE_SIZE}), each image "
+                         "shifted by a few pixels, and keeps the median count per device. Pages the samples disagree "
+                         "on are re-counted in tiled mode. Costs one model call per sample"
+                )
+                
+                render_profile = st.selectbox(
+                    "🖨️ Render profile",
+                    list(RENDER_PROFILES),
+                    index=list(RENDER_PROFILES).index(DEFAULT_RENDER_PROFILE),
+                    format_func=lambda profile: {
+                        "color": "Color",
+                        "gray": "Grayscale, cropped",
+                        "mono": "Black & white, cropped",
+                    }[profile],
+                    help="Grayscale and black & white render plain line-art sheets faster and in less memory, "
+                         "cropped to the sheet border. Keep color for sheets with colored markups"
+                )
+                
+                completed_jobs = {
+                    job["id"]: job for job in get_job_store().list_jobs(trade_key)
+                    if job["status"] == "completed" and job["trades"] == trade_config.get("trades")
+                }
+                previous_job_id = None
+                if completed_jobs:
+                    previous_job_id = st.selectbox(
+                        "📑 Addendum to",
+                        [None, *completed_jobs],
+                        format_func=lambda job_id: "Nothing - analyze as a new set" if job_id is None else
+                            f"{completed_jobs[job_id]['filename']} ({completed_jobs[job_id]['created_at'].replace('T', ' ')})",
+                        help="Matches sheets to the earlier job by drawing number and image, and only analyzes "
+                             "new or changed sheets. Uses the earlier job's page settings"
+                    )
+                
                 if st.button(f"🔍 Analyze {trade_config['name']} Devices", type="primary", use_container_width=True):
                     if start_page > end_page:
                         st.error("Start page must be ≤ end page")
                         return
                     
-                    client = anthropic.Anthropic(api_key=st.session_state['api_key'])
-                    
-                    # Initialize totals for this trade's devices
-                    total_devices = {key: 0 for key in trade_config["devices"].keys()}
-                    page_results = []
-                    
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
+                    # The analysis runs in a background worker; this page only polls it
+                    st.session_state['active_job_id'] = get_worker_pool().submit(
+                        pdf_path,
+                        trade_key,
+                        st.session_state['api_key'],
+                        list(range(start_page, end_page + 1)),
+                        trade_keys=trade_config.get("trades"),
+                        max_in_flight=st.session_state.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT),
+                        use_triage=use_triage,
+                        use_vector=use_vector,
+                        use_legend=use_legend,
+                        tiled=tiled_mode,
+                        ensemble=1 if tiled_mode else ensemble_size,
+                        render_profile=render_profile,
+                        filename=uploaded_file.name,
+                        previous_job_id=previous_job_id
+                    )
+                    st.session_state.pop('analysis_results', None)
+                    st.session_state.pop('partial_results', None)
+                    st.session_state.pop('streamed_counts', None)
+                
+                if st.session_state.get('active_job_id'):
+                    show_job_progress(st.session_state['active_job_id'])
+                
+                if st.button("🌙 Submit as Overnight Batch", use_container_width=True,
+                             help="Sends every page as one Message Batch at half the cost. "
+                                  "Results are usually ready within a few hours; collect them under Batch Jobs"):
+                    if start_page > end_page:
+                        st.error("Start page must be ≤ end page")
+                        return
+                    if tiled_mode:
+                        st.info("Batches are submitted as full pages; tiled mode only applies to interactive analysis")
                     
+                    client = anthropic.Anthropic(api_key=st.session_state['api_key'])
                     pages_to_analyze = list(range(start_page, end_page + 1))
+                    skipped_pages = {}
                     
-                    for idx, page_num in enumerate(pages_to_analyze):
-                        status_text.text(f"Analyzing page {page_num}...")
-                        progress_bar.progress((idx + 1) / len(pages_to_analyze))
-                        
-                        image_data = convert_pdf_page_to_image(file_bytes, page_num)
-                        
-                        if image_data:
-                            result = analyze_blueprint_page(client, image_data, trade_config, page_num)
-                            
-                            if "error" not in result:
-                                page_results.append({
-                                    "page": page_num,
-                                    "type": result.get("page_type", "unknown"),
-                                    "description": result.get("description", ""),
-                                    "devices": result.get("devices", {}),
-                                    "notes": result.get("notes", "")
-                                })
-                                
-                                for device_type, count in result.get("devices", {}).items():
-                                    if device_type in total_devices:
-                                        total_devices[device_type] += count
-                            else:
-                                # Show error but continue
-                                st.warning(f"Page {page_num}: {result.get('error', 'Unknown error')}")
-                    
-                    status_text.text("✅ Analysis complete!")
-                    progress_bar.progress(1.0)
+                    if use_triage:
+                        triage = triage_pages(
+                            pdf_path, pages_to_analyze, trade_config.get("trades", [trade_key]),
+                            sheet_infos=get_sheet_infos(pdf_path, total_pages)
+                        )
+                        pages_to_analyze = triage["analyze"]
+                        skipped_pages = triage["skipped"]
                     
-                    # Show quick summary
-                    total_found = sum(total_devices.values())
-                    if total_found > 0:
-                        st.success(f"Found {total_found} total devices across {len(page_results)} pages")
-                    else:
-                        st.warning("No devices detected. Try checking the Page-by-Page Breakdown for details.")
+                    with st.spinner("Rendering pages and submitting batch..."):
+                        try:
+                            job = submit_batch(
+                                client, pdf_path, pages_to_analyze, trade_key, trade_config,
+                                uploaded_file.name, ResultCache(), skipped_pages
+                            )
+                        except Exception as e:
+                            st.error(f"Batch submission failed: {e}")
+                            return
                     
-                    st.session_state['analysis_results'] = {
-                        "total_devices": total_devices,
-                        "page_results": page_results,
-                        "filename": uploaded_file.name,
-                        "trade": trade_key
-                    }
-                    # Clear previous edits
-                    st.session_state.pop('editable_counts', None)
-                    st.session_state.pop('editable_prices', None)
+                    st.success(f"🌙 Submitted {len(job['pages'])} pages as batch job {job['job_id']} "
+                               f"({len(job['cached'])} already cached, {len(skipped_pages)} skipped). "
+                               f"Collect the results under Batch Jobs once it has finished.")
             
             else:
                 # Single image
-                st.image(file_bytes, caption="Blueprint Preview", use_column_width=True)
+                st.image(uploaded_file, caption="Blueprint Preview", use_column_width=True)
                 
                 if st.button(f"🔍 Analyze {trade_config['name']} Devices", type="primary", use_container_width=True):
                     client = anthropic.Anthropic(api_key=st.session_state['api_key'])
                     
                     with st.spinner("Analyzing..."):
-                        result = analyze_blueprint_page(client, file_bytes, trade_config)
+                        result = analyze_blueprint_page_cached(
+                            ResultCache(), client, encode_image_file(uploaded_file.getvalue()), trade_key, trade_config
+                        )
                         
                         if "error" not in result:
                             st.session_state['analysis_results'] = {
                                 "total_devices": result.get("devices", {}),
                                 "page_results": [{"page": 1, **result}],
                                 "filename": uploaded_file.name,
-                                "trade": trade_key
+                                "trade": trade_key,
+                                "trades": trade_config.get("trades"),
+                                "usage": result.get("usage"),
+                                "page_metrics": [page_metrics(1, result)]
                             }
                             st.session_state.pop('editable_counts', None)
                             st.session_state.pop('editable_prices', None)
@@ -1147,6 +784,74 @@ def main():
         elif uploaded_file and not st.session_state.get('api_key'):
             st.warning("⚠️ Enter your API key in Settings above")
         
+        # ========================================
+        # PAST JOBS
+        # ========================================
+        past_jobs = [
+            job for job in get_job_store().list_jobs(trade_key)
+            if job["trades"] == trade_config.get("trades")
+        ]
+        if past_jobs:
+            with st.expander(f"🗂️ Past Jobs ({len(past_jobs)})"):
+                for job in past_jobs:
+                    col1, col2 = st.columns([4, 1])
+                    with col1:
+                        st.markdown(f"**{job['filename']}** · {job['pages_done']} pages analyzed · "
+                                    f"{job['created_at'].replace('T', ' ')} · _{job['status']}_ · `{job['id']}`")
+                        if job["status"] != "completed":
+                            st.caption("Upload the same PDF with the same settings and click Analyze to resume")
+                    with col2:
+                        if st.button("Open", key=f"job_open_{job['id']}", use_container_width=True,
+                                     disabled=not job["pages_done"]):
+                            st.session_state['analysis_results'] = load_job_results(job["id"])
+                            st.session_state.pop('editable_counts', None)
+                            st.session_state.pop('editable_prices', None)
+                            st.rerun()
+        
+        # ========================================
+        # BATCH JOBS
+        # ========================================
+        batch_jobs = [
+            job for job in list_jobs()
+            if job.get("trade") == trade_key and job.get("trades") == trade_config.get("trades")
+        ]
+        if batch_jobs:
+            with st.expander(f"🌙 Batch Jobs ({len(batch_jobs)})"):
+                for job in batch_jobs:
+                    col1, col2, col3 = st.columns([3, 1, 1])
+                    with col1:
+                        counts = job.get("request_counts")
+                        progress = f" · {counts['succeeded']} done, {counts['processing']} processing" if counts else ""
+                        st.markdown(f"**{job['filename']}** · {len(job['pages'])} pages · "
+                                    f"submitted {job['submitted_at']} · _{job['status']}_{progress}")
+                    with col2:
+                        check = st.button("Check Status", key=f"batch_check_{job['job_id']}",
+                                          use_container_width=True, disabled=job["status"] != "submitted")
+                    with col3:
+                        load = st.button("Load Results", key=f"batch_load_{job['job_id']}",
+                                         use_container_width=True, disabled=job["status"] == "submitted")
+                    
+                    if (check or load) and not st.session_state.get('api_key'):
+                        st.warning("⚠️ Enter your API key in Settings above")
+                    elif check:
+                        client = anthropic.Anthropic(api_key=st.session_state['api_key'])
+                        refresh_job(client, job)
+                        st.rerun()
+                    elif load:
+                        client = anthropic.Anthropic(api_key=st.session_state['api_key'])
+                        with st.spinner("Downloading batch results..."):
+                            aggregate = collect_results(client, job, ResultCache())
+                        st.session_state['analysis_results'] = {
+                            **aggregate,
+                            "filename": job["filename"],
+                            "trade": job["trade"],
+                            "trades": job.get("trades"),
+                            "skipped_pages": {int(page): reason for page, reason in job["skipped_pages"].items()}
+                        }
+                        st.session_state.pop('editable_counts', None)
+                        st.session_state.pop('editable_prices', None)
+                        st.rerun()
+        
         # ========================================
         # RESULTS DISPLAY
         # ========================================
@@ -1160,15 +865,41 @@ def main():
                 
                 st.markdown("---")
                 
+                # Multi-trade results hold every trade's counts; show one trade at a time
+                if results.get('trades'):
+                    view_trade = st.radio(
+                        "Trade view",
+                        results['trades'],
+                        format_func=lambda key: f"{TRADE_CONFIG[key]['icon']} {TRADE_CONFIG[key]['name']}",
+                        horizontal=True,
+                        key='trade_view'
+                    )
+                    trade_config = TRADE_CONFIG[view_trade]
+                
                 # Device Count - Editable
                 st.markdown(f"### {trade_config['icon']} Device Count")
                 st.caption("✏️ Edit counts and prices as needed")
+                if results.get('cache_stats'):
+                    cache_stats = results['cache_stats']
+                    st.caption(f"⚡ Cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+                if results.get('usage'):
+                    st.caption(format_token_usage(results['usage']))
+                if results.get('failed_pages'):
+                    st.warning(f"⚠️ Pages missing from these counts (analysis failed): "
+                               f"{', '.join(str(p) for p in sorted(results['failed_pages']))}")
+                if results.get('status') in ACTIVE_STATUSES:
+                    st.info(f"⏳ Counts so far from {len(page_results)} analyzed pages; they update as pages "
+                            f"finish. Cancel the job to bid on these pages only")
+                elif results.get('status') in ("cancelled", "interrupted"):
+                    st.warning(f"✋ Stopped early: these counts cover only the {len(page_results)} pages "
+                               f"analyzed before the job stopped")
                 
                 # Initialize editable values
                 if 'editable_counts' not in st.session_state:
                     st.session_state['editable_counts'] = {}
                 if 'editable_prices' not in st.session_state:
                     st.session_state['editable_prices'] = {}
+                follow_streamed_counts(trade_config, total_devices)
                 
                 edited_counts = {}
                 edited_prices = {}
@@ -1213,8 +944,9 @@ def main():
                         line_total = edited_counts[key] * edited_prices[key]
                         st.markdown(f"**${line_total:,.2f}**")
                 
-                st.session_state['editable_counts'] = edited_counts
-                st.session_state['editable_prices'] = edited_prices
+                # Merge rather than replace so edits survive switching trade views
+                st.session_state['editable_counts'].update(edited_counts)
+                st.session_state['editable_prices'].update(edited_prices)
                 
                 # Bid Calculation
                 st.markdown("---")
@@ -1222,21 +954,18 @@ def main():
                 
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    overhead_pct = st.number_input("Overhead %", min_value=0, max_value=50, value=10)
+                    overhead_pct = st.number_input("Overhead %", min_value=0, max_value=50, value=DEFAULT_OVERHEAD_PCT)
                 with col2:
-                    profit_pct = st.number_input("Profit %", min_value=0, max_value=50, value=15)
+                    profit_pct = st.number_input("Profit %", min_value=0, max_value=50, value=DEFAULT_PROFIT_PCT)
                 with col3:
-                    misc_cost = st.number_input("Misc $", min_value=0, value=0)
+                    misc_cost = st.number_input("Misc $", min_value=0, value=DEFAULT_MISC_COST)
                 
                 # Calculate
-                material_cost = sum(
-                    edited_counts.get(key, 0) * edited_prices.get(key, dp)
-                    for key, (_, dp) in trade_config["devices"].items()
-                )
-                
-                overhead_amount = material_cost * (overhead_pct / 100)
-                profit_amount = (material_cost + overhead_amount) * (profit_pct / 100)
-                total_bid = material_cost + overhead_amount + profit_amount + misc_cost
+                bid = calculate_bid(trade_config, edited_counts, edited_prices, overhead_pct, profit_pct, misc_cost)
+                material_cost = bid["material_cost"]
+                overhead_amount = bid["overhead_amount"]
+                profit_amount = bid["profit_amount"]
+                total_bid = bid["total_bid"]
                 
                 # Summary table
                 st.markdown(f"""
@@ -1255,62 +984,67 @@ def main():
                 </div>
                 """, unsafe_allow_html=True)
                 
+                # Addendum changes against the earlier job's counts
+                deltas = [
+                    delta for delta in results.get('device_deltas') or []
+                    if delta['device'] in trade_config["devices"]
+                ]
+                if deltas:
+                    carried = sum(1 for pr in page_results if 'carried_from' in pr)
+                    st.markdown("### 📑 Changes Since Previous Bid")
+                    st.caption(f"{carried} unchanged sheets kept their earlier counts; "
+                               f"{len(page_results) - carried} new or changed sheets were analyzed")
+                    if results.get('out_of_scope_pages'):
+                        st.caption(f"Pages {', '.join(str(p) for p in results['out_of_scope_pages'])} are outside "
+                                   f"the earlier job's pages and were not analyzed or compared")
+                    st.dataframe(
+                        [{"Device": delta['name'], "Previous": delta['previous'], "Current": delta['current'],
+                          "Change": delta['delta']} for delta in deltas],
+                        hide_index=True,
+                        use_container_width=True
+                    )
+                
                 # Export
                 st.markdown("### 📤 Export")
                 
-                col1, col2 = st.columns(2)
+                col1, col2, col3 = st.columns(3)
                 
                 with col1:
-                    export_data = []
-                    for key, (display_name, default_price) in trade_config["devices"].items():
-                        count = edited_counts.get(key, 0)
-                        price = edited_prices.get(key, default_price)
-                        if count > 0:
-                            export_data.append({
-                                "Device": display_name,
-                                "Count": count,
-                                "Unit Price": price,
-                                "Total": count * price
-                            })
-                    export_df = pd.DataFrame(export_data)
-                    csv = export_df.to_csv(index=False)
+                    csv = export_csv(trade_config, edited_counts, edited_prices)
                     st.download_button("📊 Download CSV", csv,
-                        f"bidsync_{trade_config['name'].lower()}_{results['filename'].split('.')[0]}.csv",
+                        export_filename(trade_config, results['filename'], "csv"),
                         "text/csv", use_container_width=True)
                 
                 with col2:
-                    summary = f"""BidSync AI - {trade_config['name']} Analysis
-File: {results['filename']}
-Pages: {len(page_results)}
-
-DEVICES:
-"""
-                    for key, (display_name, dp) in trade_config["devices"].items():
-                        count = edited_counts.get(key, 0)
-                        price = edited_prices.get(key, dp)
-                        if count > 0:
-                            summary += f"- {display_name}: {count} @ ${price} = ${count * price:,.2f}\n"
-                    
-                    summary += f"""
-BID:
-- Material: ${material_cost:,.2f}
-- Overhead ({overhead_pct}%): ${overhead_amount:,.2f}
-- Profit ({profit_pct}%): ${profit_amount:,.2f}
-- Misc: ${misc_cost:,.2f}
-- TOTAL: ${total_bid:,.2f}
-"""
+                    summary = export_summary(trade_config, results, edited_counts, edited_prices, bid)
                     st.download_button("📝 Download Summary", summary,
-                        f"bidsync_{trade_config['name'].lower()}_{results['filename'].split('.')[0]}.txt",
+                        export_filename(trade_config, results['filename'], "txt"),
                         "text/plain", use_container_width=True)
                 
+                with col3:
+                    export = export_json(trade_config, results, edited_counts, edited_prices, bid)
+                    st.download_button("📦 Download JSON", export,
+                        export_filename(trade_config, results['filename'], "json"),
+                        "application/json", use_container_width=True)
+                
                 # Page breakdown
                 with st.expander("📄 Page-by-Page Breakdown"):
+                    skipped_pages = results.get('skipped_pages', {})
+                    if skipped_pages:
+                        st.caption(f"⏭️ {len(skipped_pages)} pages skipped by triage")
+                        for page_num, reason in sorted(skipped_pages.items()):
+                            st.caption(f"Page {page_num}: {reason}")
+                        st.markdown("---")
+                    
                     for pr in page_results:
-                        st.markdown(f"**Page {pr['page']}** *{pr.get('type', '')}*")
+                        carried = f" · unchanged from page {pr['carried_from']} of the earlier set" if 'carried_from' in pr else ""
+                        st.markdown(f"**Page {pr['page']}** *{pr.get('type', '')}*{carried}")
                         st.write(pr.get('description', ''))
                         
                         raw_devices = pr.get('devices', {})
                         devices_found = {k: v for k, v in raw_devices.items() if v > 0}
+                        if results.get('trades'):
+                            devices_found = {k: v for k, v in devices_found.items() if k in trade_config["devices"]}
                         if devices_found:
                             for dk, dv in devices_found.items():
                                 display = trade_config["devices"].get(dk, (dk.replace('_', ' ').title(), 0))[0]
@@ -1321,6 +1055,21 @@ BID:
                         if pr.get('notes'):
                             st.caption(f"Notes: {pr['notes']}")
                         st.markdown("---")
+                    
+                    # Where the time and tokens went, per page
+                    if results.get('page_metrics'):
+                        st.markdown("**⏱️ Page Metrics**")
+                        st.dataframe(results['page_metrics'], column_order=METRIC_FIELDS,
+                                     hide_index=True, use_container_width=True)
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            st.download_button("⏱️ Metrics CSV", export_metrics_csv(results),
+                                metrics_filename(results['filename'], "csv"),
+                                "text/csv", use_container_width=True)
+                        with col2:
+                            st.download_button("⏱️ Metrics JSON", export_metrics_json(results),
+                                metrics_filename(results['filename'], "json"),
+                                "application/json", use_container_width=True)
     
     # Footer
     st.markdown("---")
@@ -0,0 +1,225 @@
+"""
+BidSync AI - Overnight Batch Mode
+Submits every page of a job as a Message Batch and assembles the results later
+"""
+
+import contextlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from analysis import (
+    MODEL_NAME,
+    add_page_result,
+    build_analysis_request,
+    new_aggregate,
+    tool_call_from_message,
+    validate_tool_call,
+)
+from pdf_render import iter_pdf_pages
+from pipeline import plan_render_ranges
+from result_cache import ResultCache, cache_key
+
+DEFAULT_BATCH_DIR = os.environ.get(
+    "BIDSYNC_BATCH_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "bidsync", "batches"),
+)
+# The API caps a batch at 256 MB / 100,000 requests; stay well under the size limit
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+MAX_BATCH_REQUESTS = 100_000
+DEFAULT_POLL_INTERVAL = 60.0
+
+
+def _custom_id(page_num: int) -> str:
+    return f"page-{page_num}"
+
+
+def _page_from_custom_id(custom_id: str) -> Optional[int]:
+    try:
+        return int(custom_id.rsplit("-", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _job_path(job_id: str, batch_dir: str) -> str:
+    return os.path.join(batch_dir, f"{job_id}.json")
+
+
+def save_job(job: Dict, batch_dir: str = DEFAULT_BATCH_DIR):
+    """Write the job record atomically so a crash never leaves half a file."""
+    os.makedirs(batch_dir, exist_ok=True)
+    path = _job_path(job["job_id"], batch_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(job, f)
+    os.replace(tmp_path, path)
+
+
+def load_job(job_id: str, batch_dir: str = DEFAULT_BATCH_DIR) -> Dict:
+    with open(_job_path(job_id, batch_dir)) as f:
+        return json.load(f)
+
+
+def list_jobs(batch_dir: str = DEFAULT_BATCH_DIR) -> List[Dict]:
+    """Every saved batch job, newest first."""
+    jobs = []
+    if not os.path.isdir(batch_dir):
+        return jobs
+    for name in os.listdir(batch_dir):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(batch_dir, name)) as f:
+                jobs.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    jobs.sort(key=lambda job: job.get("submitted_at", ""), reverse=True)
+    return jobs
+
+
+def submit_batch(client, pdf_path: str, pages: List[int], trade_key: str, trade_config: dict,
+                 filename: str, cache: Optional[ResultCache] = None,
+                 skipped_pages: Optional[Dict] = None, batch_dir: str = DEFAULT_BATCH_DIR) -> Dict:
+    """
+    Render the pages and submit them as one or more Message Batches.
+
+    Requests are built by build_analysis_request, the same prompt the
+    interactive path sends. Pages already in the result cache are not
+    submitted again. Returns the job record, which is persisted under
+    batch_dir so results can be collected after a restart.
+    """
+    job = {
+        "job_id": uuid.uuid4().hex[:12],
+        "batch_ids": [],
+        "filename": filename,
+        "trade": trade_key,
+        "trades": trade_config.get("trades"),
+        "trade_config": trade_config,
+        "pages": sorted(set(pages)),
+        "skipped_pages": skipped_pages or {},
+        "cache_keys": {},
+        "cached": {},
+        "status": "submitting",
+        "submitted_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+    requests = []
+    request_bytes = 0
+
+    def flush():
+        nonlocal requests, request_bytes
+        if requests:
+            batch = client.messages.batches.create(requests=requests)
+            job["batch_ids"].append(batch.id)
+            save_job(job, batch_dir)
+        requests = []
+        request_bytes = 0
+
+    wanted = set(job["pages"])
+    for first_page, last_page in plan_render_ranges(job["pages"], 1):
+        with contextlib.closing(iter_pdf_pages(pdf_path, first_page, last_page)) as page_images:
+            for page_num, image_data in page_images:
+                if page_num not in wanted:
+                    continue
+                key = cache_key(image_data, trade_key, trade_config["prompt_focus"], MODEL_NAME)
+                job["cache_keys"][str(page_num)] = key
+                cached = cache.get(key) if cache is not None else None
+                if cached is not None:
+                    job["cached"][str(page_num)] = cached
+                    continue
+
+                request = {"custom_id": _custom_id(page_num), "params": build_analysis_request(image_data, trade_config)}
+                size = len(json.dumps(request))
+                if requests and (request_bytes + size > MAX_BATCH_BYTES or len(requests) >= MAX_BATCH_REQUESTS):
+                    flush()
+                requests.append(request)
+                request_bytes += size
+    flush()
+
+    job["status"] = "submitted" if job["batch_ids"] else "ended"
+    save_job(job, batch_dir)
+    return job
+
+
+def refresh_job(client, job: Dict, batch_dir: str = DEFAULT_BATCH_DIR) -> Dict:
+    """
+    Poll every batch of the job and return the combined request counts.
+
+    The job's status becomes "ended" once all of its batches have ended.
+    """
+    counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+    all_ended = True
+    for batch_id in job["batch_ids"]:
+        batch = client.messages.batches.retrieve(batch_id)
+        for name in counts:
+            counts[name] += getattr(batch.request_counts, name, 0)
+        if batch.processing_status != "ended":
+            all_ended = False
+
+    if all_ended and job["status"] == "submitted":
+        job["status"] = "ended"
+    job["request_counts"] = counts
+    save_job(job, batch_dir)
+    return counts
+
+
+def wait_for_job(client, job: Dict, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 timeout: Optional[float] = None, batch_dir: str = DEFAULT_BATCH_DIR) -> bool:
+    """Block until every batch has ended; returns False if the timeout ran out first."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        refresh_job(client, job, batch_dir)
+        if job["status"] != "submitted":
+            return True
+        if deadline is not None and time.monotonic() + poll_interval > deadline:
+            return False
+        time.sleep(poll_interval)
+
+
+def _batch_item_result(item, device_keys: List[str]) -> Dict:
+    result = item.result
+    if result.type == "succeeded":
+        call = tool_call_from_message(result.message)
+        _, parsed, problems = validate_tool_call(call, device_keys)
+        if problems:
+            # A batch can't hold a conversation; the page is reported, not zeroed
+            return {"error": f"Malformed response: {'; '.join(problems)}", "usage": call["usage"]}
+        return {**parsed, "usage": call["usage"]}
+    if result.type == "errored":
+        error = getattr(result.error, "error", None)
+        return {"error": getattr(error, "message", None) or f"Batch request errored: {result.error}"}
+    return {"error": f"Batch request {result.type}"}
+
+
+def collect_results(client, job: Dict, cache: Optional[ResultCache] = None,
+                    batch_dir: str = DEFAULT_BATCH_DIR) -> Dict:
+    """
+    Download an ended job's results and total them like the interactive path.
+
+    Returns the same total_devices / page_results / failed_pages structure,
+    with pages served from the cache folded in. Successful results are
+    added to the cache so a re-run of the same drawings costs nothing.
+    """
+    device_keys = list(job["trade_config"]["devices"].keys())
+    page_results = {int(page): result for page, result in job["cached"].items()}
+    for batch_id in job["batch_ids"]:
+        for item in client.messages.batches.results(batch_id):
+            page_num = _page_from_custom_id(item.custom_id)
+            if page_num is None:
+                continue
+            result = _batch_item_result(item, device_keys)
+            page_results[page_num] = result
+            key = job["cache_keys"].get(str(page_num))
+            if cache is not None and key and "error" not in result:
+                cache.put(key, {k: v for k, v in result.items() if k != "usage"})
+
+    aggregate = new_aggregate(job["trade_config"])
+    for page_num in job["pages"]:
+        add_page_result(aggregate, page_num, page_results.get(page_num, {"error": "No batch result for page"}))
+
+    job["status"] = "collected"
+    save_job(job, batch_dir)
+    return aggregate
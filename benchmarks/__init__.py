@@ -0,0 +1 @@
+"""BidSync AI - performance and accuracy benchmarks for the blueprint pipeline."""
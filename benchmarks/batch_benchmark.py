@@ -0,0 +1,162 @@
+"""
+BidSync AI - Batch Benchmark
+Runs overnight batch mode (submit -> poll -> collect -> resubmit) on a
+synthetic drawing set against the local stub model server, checks that
+every page is accounted for and reports how long each step took
+
+Usage (from the repo root):
+    python -m benchmarks.batch_benchmark --pages 20 --error-rate 0.1 --expired-rate 0.1 --malformed-rate 0.1
+    python -m benchmarks.batch_benchmark --pages 200 --density dense --max-batch-requests 50
+
+Errored, expired and malformed items must come back as failed pages with
+their reason, and a second submission of the same pages must only send the
+failed ones (the rest come from the result cache). The exit status is 1 if
+any check fails.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import anthropic
+
+import batch_mode
+from batch_mode import collect_results, load_job, submit_batch, wait_for_job
+from benchmarks.synthetic import DENSITIES, SHEET_SIZES, make_blueprint_pdf
+from result_cache import ResultCache
+from stub_server import StubAnthropicServer
+from trades import TRADE_CONFIG
+
+ERRORED_MESSAGE = "Stub overloaded"
+EXPIRED_MESSAGE = "Batch request expired"
+MALFORMED_PREFIX = "Malformed response"
+
+
+def run_batch(client, pdf_path: str, pages: List[int], trade_key: str, cache: ResultCache, batch_dir: str,
+              poll_interval: float, timeout: float) -> Dict:
+    """Submit, wait for and collect one batch job; returns the job, its results and each step's seconds."""
+    trade_config = TRADE_CONFIG[trade_key]
+    started = time.perf_counter()
+    job = submit_batch(client, pdf_path, pages, trade_key, trade_config, os.path.basename(pdf_path), cache,
+                       batch_dir=batch_dir)
+    submitted = time.perf_counter()
+    ended = wait_for_job(client, job, poll_interval, timeout, batch_dir)
+    waited = time.perf_counter()
+    results = collect_results(client, job, cache, batch_dir) if ended else None
+    return {
+        "job": job,
+        "ended": ended,
+        "results": results,
+        "submit_s": round(submitted - started, 2),
+        "wait_s": round(waited - submitted, 2),
+        "collect_s": round(time.perf_counter() - waited, 2),
+    }
+
+
+def check_run(run: Dict, pages: List[int], batch_dir: str) -> List[str]:
+    """Problems with a finished run: pages missing or miscounted against the batches' request counts."""
+    if not run["ended"]:
+        return ["batch did not end before the timeout"]
+    job, results = run["job"], run["results"]
+    counts = job.get("request_counts", {})
+    failed = results["failed_pages"]
+    problems = []
+
+    accounted = {row["page"] for row in results["page_results"]} | set(failed)
+    if accounted != set(pages):
+        problems.append(f"pages without a result: {sorted(set(pages) - accounted)}")
+    submitted = len(pages) - len(job["cached"])
+    if sum(counts.values()) != submitted or counts.get("processing"):
+        problems.append(f"request counts {counts} don't add up to the {submitted} pages submitted")
+
+    missing = [page for page, error in failed.items() if error == "No batch result for page"]
+    if missing:
+        problems.append(f"no batch result for pages {missing}")
+    for name, message in (("errored", ERRORED_MESSAGE), ("expired", EXPIRED_MESSAGE)):
+        reported = sum(1 for error in failed.values() if error == message)
+        if reported != counts.get(name, 0):
+            problems.append(f"{counts.get(name, 0)} {name} requests but {reported} pages failed with {message!r}")
+    malformed = sum(1 for error in failed.values() if error.startswith(MALFORMED_PREFIX))
+    if len(results["page_results"]) + malformed != counts.get("succeeded", 0) + len(job["cached"]):
+        problems.append(f"{counts.get('succeeded', 0)} succeeded and {len(job['cached'])} cached requests but "
+                        f"{len(results['page_results'])} page results and {malformed} malformed")
+
+    if load_job(job["job_id"], batch_dir)["status"] != "collected":
+        problems.append(f"job {job['job_id']} was not saved as collected")
+    return problems
+
+
+def print_run(name: str, run: Dict):
+    job, results = run["job"], run["results"]
+    counts = job.get("request_counts", {})
+    print(f"{name}: {len(job['pages'])} pages, {len(job['cached'])} cached, {len(job['batch_ids'])} batches; "
+          f"submit {run['submit_s']}s, wait {run['wait_s']}s, collect {run['collect_s']}s")
+    if results is not None:
+        print(f"  {counts.get('succeeded', 0)} succeeded, {counts.get('errored', 0)} errored, "
+              f"{counts.get('expired', 0)} expired; {len(results['page_results'])} pages counted, "
+              f"{len(results['failed_pages'])} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check overnight batch mode against the stub model server")
+    parser.add_argument("--pages", type=int, default=20, help="pages in the synthetic set")
+    parser.add_argument("--density", default="sparse", choices=list(DENSITIES))
+    parser.add_argument("--sheet-size", default="D", choices=list(SHEET_SIZES))
+    parser.add_argument("--trade", default="fire_alarm", choices=list(TRADE_CONFIG.keys()))
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="stub seconds until a batch ends")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="share of batch requests that error")
+    parser.add_argument("--expired-rate", type=float, default=0.1, help="share of batch requests that expire")
+    parser.add_argument("--malformed-rate", type=float, default=0.1, help="share of answers with a bad tool call")
+    parser.add_argument("--max-batch-requests", type=int, default=batch_mode.MAX_BATCH_REQUESTS,
+                        help="requests per batch, to exercise jobs split over several batches")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="seconds between status checks")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for a batch to end")
+    parser.add_argument("--seed", type=int, default=0, help="stub seed for which requests fail")
+    parser.add_argument("--workdir", help="keep the generated PDF, batch jobs and cache here (default: a temp dir)")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bidsync_batch_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    pdf_path = os.path.join(workdir, f"{args.pages}p-{args.density}-{args.sheet_size}.pdf")
+    if not os.path.exists(pdf_path):
+        make_blueprint_pdf(pdf_path, args.pages, args.density, args.sheet_size)
+    # Every run starts from an empty cache and job directory
+    run_dir = tempfile.mkdtemp(prefix="run_", dir=workdir)
+    batch_dir = os.path.join(run_dir, "batches")
+    cache = ResultCache(os.path.join(run_dir, "cache"))
+    batch_mode.MAX_BATCH_REQUESTS = args.max_batch_requests
+    pages = list(range(1, args.pages + 1))
+
+    problems = []
+    with StubAnthropicServer(batch_delay=args.batch_delay, error_rate=args.error_rate,
+                             expired_rate=args.expired_rate, malformed_rate=args.malformed_rate,
+                             seed=args.seed) as server:
+        client = anthropic.Anthropic(api_key="benchmark", base_url=server.url)
+        first = run_batch(client, pdf_path, pages, args.trade, cache, batch_dir, args.poll_interval, args.timeout)
+        print_run("first submission", first)
+        problems += [f"first submission: {problem}" for problem in check_run(first, pages, batch_dir)]
+
+        # Only the pages that failed are sent again
+        if first["ended"]:
+            second = run_batch(client, pdf_path, pages, args.trade, cache, batch_dir, args.poll_interval,
+                               args.timeout)
+            print_run("resubmission", second)
+            problems += [f"resubmission: {problem}" for problem in check_run(second, pages, batch_dir)]
+            expected = len(first["results"]["page_results"])
+            if len(second["job"]["cached"]) != expected:
+                problems.append(f"resubmission: {len(second['job']['cached'])} pages came from the cache, "
+                                f"expected the {expected} counted the first time")
+
+    if problems:
+        print("\nProblems:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("\nBatch mode OK")
+
+
+if __name__ == "__main__":
+    main()
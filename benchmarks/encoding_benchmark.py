@@ -0,0 +1,127 @@
+"""
+BidSync AI - Encoding Benchmark
+Compares the adaptive page encoder with the previous fixed settings (RGB JPEG
+at quality 75, long edge capped at 2000 px) on bytes sent and image tokens
+
+Usage (from the repo root):
+    python -m benchmarks.encoding_benchmark plans.pdf --pages 1-20
+    python -m benchmarks.encoding_benchmark --synthetic 10 --density dense
+
+Tokens are estimated after the API's own downscaling, which is what is
+billed; bytes are the encoded image before base64.
+"""
+
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from PIL import Image
+
+from benchmarks.synthetic import DENSITIES, SHEET_SIZES, make_blueprint_pdf
+from engine import parse_pages, pdf_page_count
+from pdf_render import DEFAULT_DPI, encode_page_image, estimate_image_tokens, image_media_type, iter_pdf_pages
+from pipeline import plan_render_ranges
+
+LEGACY_MAX_DIMENSION = 2000
+LEGACY_JPEG_QUALITY = 75
+
+
+def encode_legacy(img: Image.Image) -> bytes:
+    """The encoder as it was before adaptive encoding, for comparison."""
+    if max(img.size) > LEGACY_MAX_DIMENSION:
+        ratio = LEGACY_MAX_DIMENSION / max(img.size)
+        img = img.resize(tuple(int(dim * ratio) for dim in img.size), Image.LANCZOS)
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format='JPEG', quality=LEGACY_JPEG_QUALITY, optimize=True)
+    return img_byte_arr.getvalue()
+
+
+def _measure(encode, img: Image.Image) -> Dict:
+    started = time.perf_counter()
+    data = encode(img)
+    encode_ms = (time.perf_counter() - started) * 1000
+    with Image.open(io.BytesIO(data)) as encoded:
+        size = encoded.size
+    return {
+        "bytes": len(data),
+        "tokens": estimate_image_tokens(*size),
+        "format": image_media_type(data).split("/")[1],
+        "encode_ms": round(encode_ms, 1),
+    }
+
+
+def compare_page(img: Image.Image) -> Dict:
+    return {"legacy": _measure(encode_legacy, img), "adaptive": _measure(encode_page_image, img)}
+
+
+def run(pdf_path: str, pages: List[int], dpi: int) -> Dict[int, Dict]:
+    rows = {}
+    for first_page, last_page in plan_render_ranges(pages, 1):
+        for page_num, row in iter_pdf_pages(pdf_path, first_page, last_page, dpi=dpi, encode=compare_page):
+            if page_num in pages:
+                rows[page_num] = row
+    return rows
+
+
+def summarize(rows: Dict[int, Dict]) -> Dict:
+    summary = {}
+    for encoder in ("legacy", "adaptive"):
+        summary[encoder] = {
+            field: sum(row[encoder][field] for row in rows.values()) for field in ("bytes", "tokens", "encode_ms")
+        }
+    legacy, adaptive = summary["legacy"], summary["adaptive"]
+    summary["saved"] = {
+        "bytes_pct": round(100 * (1 - adaptive["bytes"] / legacy["bytes"]), 1) if legacy["bytes"] else 0.0,
+        "tokens_pct": round(100 * (1 - adaptive["tokens"] / legacy["tokens"]), 1) if legacy["tokens"] else 0.0,
+    }
+    summary["adaptive_formats"] = {
+        fmt: sum(1 for row in rows.values() if row["adaptive"]["format"] == fmt)
+        for fmt in sorted({row["adaptive"]["format"] for row in rows.values()})
+    }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare adaptive page encoding with the previous fixed JPEG settings")
+    parser.add_argument("pdf", nargs="?", help="PDF to encode (default: a synthetic set)")
+    parser.add_argument("--pages", help='e.g. "1-20" (default: all pages)')
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI)
+    parser.add_argument("--synthetic", type=int, default=6, help="pages of the synthetic set, without a PDF")
+    parser.add_argument("--density", default="typical", choices=list(DENSITIES))
+    parser.add_argument("--sheet-size", default="D", choices=list(SHEET_SIZES))
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    pdf_path = args.pdf
+    if pdf_path is None:
+        pdf_path = os.path.join(tempfile.mkdtemp(prefix="bidsync_bench_"), "synthetic.pdf")
+        make_blueprint_pdf(pdf_path, args.synthetic, args.density, args.sheet_size)
+    pages = parse_pages(args.pages) if args.pages else list(range(1, pdf_page_count(pdf_path) + 1))
+
+    rows = run(pdf_path, pages, args.dpi)
+    summary = summarize(rows)
+    if args.json:
+        print(json.dumps({"pages": {str(page): row for page, row in sorted(rows.items())}, "summary": summary},
+                         indent=2))
+        return
+
+    print(f"{'page':>6} | {'legacy bytes':>12} | {'bytes':>10} | {'format':>6} | {'legacy tok':>10} | {'tokens':>6}")
+    for page_num, row in sorted(rows.items()):
+        legacy, adaptive = row["legacy"], row["adaptive"]
+        print(f"{page_num:>6} | {legacy['bytes']:>12,} | {adaptive['bytes']:>10,} | {adaptive['format']:>6} | "
+              f"{legacy['tokens']:>10,} | {adaptive['tokens']:>6,}")
+    legacy, adaptive = summary["legacy"], summary["adaptive"]
+    print(f"\nBytes: {legacy['bytes']:,} -> {adaptive['bytes']:,} ({summary['saved']['bytes_pct']}% saved)")
+    print(f"Image tokens: {legacy['tokens']:,} -> {adaptive['tokens']:,} ({summary['saved']['tokens_pct']}% saved)")
+    print(f"Encode time: {legacy['encode_ms'] / 1000:.1f}s -> {adaptive['encode_ms'] / 1000:.1f}s")
+    print(f"Formats: {', '.join(f'{count} {fmt}' for fmt, count in summary['adaptive_formats'].items())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+BidSync AI - Pipeline Benchmark
+Runs the full render -> analyze -> aggregate path on synthetic drawing sets
+against the local stub model server and reports throughput, page latency,
+per-stage time and peak memory
+
+Usage (from the repo root):
+    python -m benchmarks.pipeline_benchmark --pages 20,80 --density sparse,dense \
+        --latency 1.5 --error-rate 0.05 --save baseline.json
+    python -m benchmarks.pipeline_benchmark --pages 20,80 --density sparse,dense \
+        --latency 1.5 --error-rate 0.05 --baseline baseline.json
+    python -m benchmarks.pipeline_benchmark --pages 20 --density dense --profile color,gray,mono
+
+Each scenario runs in a fresh process, so peak RSS is that scenario's own;
+poppler runs as its child, so its memory shows under peak_child_rss_mb.
+With --baseline, the exit status is 1 if any scenario's pages/minute fell
+or its p95 page latency rose by more than --tolerance.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from benchmarks.synthetic import DENSITIES, SHEET_SIZES, make_blueprint_pdf
+from engine import analyze_pdf
+from metrics import TIMING_FIELDS, percentile, summarize_metrics
+from pdf_render import DEFAULT_RENDER_PROFILE, RENDER_PROFILES
+from pipeline import DEFAULT_MAX_IN_FLIGHT, MAX_IN_FLIGHT_LIMIT
+from result_cache import ResultCache
+from stub_server import StubAnthropicServer
+from trades import TRADE_CONFIG
+
+DEFAULT_TOLERANCE = 0.15
+
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_scenario(pdf_path: str, trade_key: str, base_url: str, max_in_flight: int,
+                 render_profile: str = DEFAULT_RENDER_PROFILE) -> Dict:
+    """Analyze every page of the PDF once, with an empty result cache; runs in its own process."""
+    with tempfile.TemporaryDirectory(prefix="bidsync_bench_cache_") as cache_dir:
+        started = time.perf_counter()
+        results = analyze_pdf(
+            pdf_path,
+            trade_key,
+            "benchmark",
+            max_in_flight=max_in_flight,
+            use_triage=False,
+            render_profile=render_profile,
+            cache=ResultCache(cache_dir),
+            client_kwargs={"base_url": base_url}
+        )
+        seconds = time.perf_counter() - started
+
+    rows = results["page_metrics"]
+    # A page's latency is the time spent on it in every stage, excluding queueing
+    latencies = [sum(row.get(field) or 0 for field in TIMING_FIELDS) for row in rows]
+    summary = summarize_metrics(rows)
+    return {
+        "seconds": round(seconds, 2),
+        "pages_per_min": round(60 * len(rows) / seconds, 1) if seconds else 0.0,
+        "p50_page_ms": round(percentile(latencies, 50), 1),
+        "p95_page_ms": round(percentile(latencies, 95), 1),
+        "stage_ms": {field: summary[field]["total"] for field in TIMING_FIELDS if field in summary},
+        "image_mb": round(sum(row.get("image_bytes") or 0 for row in rows) / 1_000_000, 2),
+        "failed_pages": len(results["failed_pages"]),
+        "input_tokens": results["usage"]["input_tokens"],
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        "peak_child_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def compare(report: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """Scenarios that got slower than the baseline by more than the tolerance."""
+    previous = {row["scenario"]: row for row in baseline}
+    regressions = []
+    for row in report:
+        before = previous.get(row["scenario"])
+        if before is None:
+            continue
+        if row["pages_per_min"] < before["pages_per_min"] * (1 - tolerance):
+            regressions.append(f"{row['scenario']}: {before['pages_per_min']} -> {row['pages_per_min']} pages/min")
+        if row["p95_page_ms"] > before["p95_page_ms"] * (1 + tolerance):
+            regressions.append(f"{row['scenario']}: p95 {before['p95_page_ms']} -> {row['p95_page_ms']} ms")
+    return regressions
+
+
+def print_table(report: List[Dict]):
+    columns = ["scenario", "pages_per_min", "p50_page_ms", "p95_page_ms", "image_mb", "failed_pages",
+               "peak_rss_mb", "peak_child_rss_mb"]
+    print(" | ".join(f"{c:>18}" for c in columns))
+    for row in report:
+        print(" | ".join(f"{str(row[c]):>18}" for c in columns))
+    print()
+    for row in report:
+        stages = ", ".join(f"{field} {ms / 1000:.1f}s" for field, ms in row["stage_ms"].items())
+        print(f"{row['scenario']}: {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the blueprint pipeline against the stub model server")
+    parser.add_argument("--pages", default="10,40", help="comma-separated set sizes")
+    parser.add_argument("--density", default="sparse,dense", help=f"comma-separated: {', '.join(DENSITIES)}")
+    parser.add_argument("--sheet-size", default="D", choices=list(SHEET_SIZES))
+    parser.add_argument("--profile", default=DEFAULT_RENDER_PROFILE,
+                        help=f"comma-separated render profiles: {', '.join(RENDER_PROFILES)}")
+    parser.add_argument("--trade", default="fire_alarm", choices=list(TRADE_CONFIG.keys()))
+    parser.add_argument("--jobs", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        choices=range(1, MAX_IN_FLIGHT_LIMIT + 1), metavar=f"1-{MAX_IN_FLIGHT_LIMIT}",
+                        help="concurrent model calls")
+    parser.add_argument("--latency", type=float, default=1.0, help="stub seconds per model call")
+    parser.add_argument("--latency-jitter", type=float, default=0.3, help="stub latency +/- seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered 429/529")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of calls with a bad tool call")
+    parser.add_argument("--workdir", help="keep the generated PDFs here (default: a temp dir)")
+    parser.add_argument("--save", help="write the report as JSON, e.g. as a baseline")
+    parser.add_argument("--baseline", help="earlier --save output to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown against the baseline, as a fraction")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.pages.split(",")]
+    densities = [density.strip() for density in args.density.split(",")]
+    unknown = [density for density in densities if density not in DENSITIES]
+    if unknown:
+        parser.error(f"unknown density {', '.join(unknown)}; choose from {', '.join(DENSITIES)}")
+    profiles = [profile.strip() for profile in args.profile.split(",")]
+    unknown = [profile for profile in profiles if profile not in RENDER_PROFILES]
+    if unknown:
+        parser.error(f"unknown render profile {', '.join(unknown)}; choose from {', '.join(RENDER_PROFILES)}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bidsync_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    report = []
+    with StubAnthropicServer(latency=args.latency, latency_jitter=args.latency_jitter,
+                             error_rate=args.error_rate, malformed_rate=args.malformed_rate) as server:
+        for density in densities:
+            for size in sizes:
+                pdf_name = f"{size}p-{density}-{args.sheet_size}"
+                pdf_path = os.path.join(workdir, f"{pdf_name}.pdf")
+                if not os.path.exists(pdf_path):
+                    make_blueprint_pdf(pdf_path, size, density, args.sheet_size)
+                for profile in profiles:
+                    # Color keeps the scenario names of earlier baselines
+                    scenario = pdf_name if profile == "color" else f"{pdf_name}-{profile}"
+                    print(f"Running {scenario}...", file=sys.stderr)
+                    # A fresh process per scenario keeps peak RSS figures independent
+                    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+                        row = pool.submit(run_scenario, pdf_path, args.trade, server.url, args.jobs,
+                                          profile).result()
+                    report.append({"scenario": scenario, "pages": size, "density": density,
+                                   "profile": profile, **row})
+
+    print_table(report)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
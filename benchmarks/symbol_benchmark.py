@@ -0,0 +1,140 @@
+"""
+BidSync AI - Symbol Counter Benchmark
+Measures local template matching (pages/s and megapixels/s per page) on
+synthetic drawing sets, or on a real set against its own legend, through
+the same render -> scale -> process pool path the analysis pipeline uses
+
+Usage (from the repo root):
+    python -m benchmarks.symbol_benchmark --synthetic 8 --density dense --workers 1,4
+    python -m benchmarks.symbol_benchmark plans.pdf --trade fire_alarm --pages 1-20
+
+Synthetic sets are matched against their two symbol outlines and report
+how many of the drawn symbols were found; real sets report the locally
+certain and uncertain matches per page.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from functools import partial
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from benchmarks.synthetic import DENSITIES, SHEET_SIZES, SOURCE_DPI, SYMBOL_RADIUS, make_blueprint_pdf
+from engine import parse_pages, pdf_page_count
+from legend_index import build_legend_index, legend_takeoff
+from page_pool import pool_workers, process_pool
+from pdf_render import DEFAULT_DPI
+from pipeline import DEFAULT_RENDER_WORKERS, run_page_pipeline
+from symbol_counter import MATCH_DPI, find_symbols, match_encode
+from trades import TRADE_CONFIG
+
+
+def synthetic_templates() -> List[Dict]:
+    """The synthetic sets' circle and square symbols, without their letter, at MATCH_DPI."""
+    templates = []
+    size = 2 * SYMBOL_RADIUS + 5
+    for shape in ("ellipse", "rectangle"):
+        img = Image.new("L", (size, size), 255)
+        getattr(ImageDraw.Draw(img), shape)([2, 2, 2 + 2 * SYMBOL_RADIUS, 2 + 2 * SYMBOL_RADIUS], outline=0, width=2)
+        scaled = img.resize((round(size * MATCH_DPI / SOURCE_DPI),) * 2, Image.LANCZOS)
+        templates.append({"device": shape, "label": shape.upper(), "image": np.asarray(scaled, np.float32) / 255})
+    return templates
+
+
+def _count_synthetic(page: np.ndarray, templates: List[Dict]) -> Dict:
+    return {"found": len(find_symbols(page, templates)), "megapixels": round(page.size / 1e6, 2)}
+
+
+def _count_legend(page: np.ndarray, index: Dict, device_keys: List[str]) -> Dict:
+    takeoff = legend_takeoff(page, index, device_keys)
+    if "fallback" in takeoff:
+        return {"fallback": takeoff["fallback"], "megapixels": round(page.size / 1e6, 2)}
+    return {"certain": sum(takeoff["result"]["devices"].values()), "confirm": takeoff["confirm"] is not None,
+            "megapixels": round(page.size / 1e6, 2)}
+
+
+def run(pdf_path: str, pages: List[int], count, workers: int) -> Dict:
+    """
+    Count the pages the way the analysis pipeline does: rendered for the
+    model, scaled down to MATCH_DPI and matched on a pool of `workers`
+    processes (inline for one), with a render worker feeding each.
+    """
+    pool = process_pool(workers) if workers > 1 else None
+    encode = partial(match_encode, dpi=DEFAULT_DPI, count=count, pool=pool)
+    try:
+        started = time.perf_counter()
+        rows = dict(run_page_pipeline(pdf_path, pages, lambda page_num, counted: counted,
+                                      render_workers=max(DEFAULT_RENDER_WORKERS, workers), encode=encode))
+        wall = time.perf_counter() - started
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    failed = {page_num: row["error"] for page_num, row in rows.items() if "error" in row}
+    if failed:
+        raise RuntimeError(f"pages failed: {failed}")
+    return {
+        "workers": workers,
+        "wall_s": round(wall, 2),
+        "pages_per_s": round(len(rows) / wall, 2) if wall else 0.0,
+        "mean_match_ms": round(sum(row["match_ms"] for row in rows.values()) / len(rows), 1) if rows else 0.0,
+        "mean_mpx_per_s": round(sum(row["match_mpx_per_s"] or 0 for row in rows.values()) / len(rows), 2)
+        if rows else 0.0,
+        "pages": {str(page_num): {k: v for k, v in row.items() if k != "metrics"}
+                  for page_num, row in sorted(rows.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local symbol counting on the CPU")
+    parser.add_argument("pdf", nargs="?", help="PDF with a symbol legend (default: a synthetic set)")
+    parser.add_argument("--pages", help='e.g. "1-20" (default: all pages)')
+    parser.add_argument("--trade", default="fire_alarm", choices=list(TRADE_CONFIG.keys()))
+    parser.add_argument("--synthetic", type=int, default=6, help="pages of the synthetic set, without a PDF")
+    parser.add_argument("--density", default="typical", choices=list(DENSITIES))
+    parser.add_argument("--sheet-size", default="D", choices=list(SHEET_SIZES))
+    parser.add_argument("--workers", default=str(pool_workers()), help="comma-separated pool sizes")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.pdf is None:
+        pdf_path = os.path.join(tempfile.mkdtemp(prefix="bidsync_bench_"), "synthetic.pdf")
+        make_blueprint_pdf(pdf_path, args.synthetic, args.density, args.sheet_size)
+        pages = list(range(1, args.synthetic + 1))
+        count = partial(_count_synthetic, templates=synthetic_templates())
+        expected = DENSITIES[args.density]
+    else:
+        pdf_path = args.pdf
+        pages = parse_pages(args.pages) if args.pages else list(range(1, pdf_page_count(pdf_path) + 1))
+        trade_config = TRADE_CONFIG[args.trade]
+        index = build_legend_index(pdf_path, trade_config)
+        if not index["templates"]:
+            parser.error(f"no {trade_config['name']} legend found in {pdf_path}")
+        pages = [page_num for page_num in pages if page_num not in index["legend_pages"]]
+        count = partial(_count_legend, index=index, device_keys=list(trade_config["devices"].keys()))
+        expected = None
+
+    runs = [run(pdf_path, pages, count, int(workers)) for workers in args.workers.split(",")]
+    if args.json:
+        print(json.dumps({"expected_per_page": expected, "runs": runs}, indent=2))
+        return
+
+    for report in runs:
+        print(f"\n{report['workers']} worker(s): {report['pages_per_s']} pages/s, "
+              f"{report['mean_match_ms']:.0f} ms and {report['mean_mpx_per_s']} Mpx/s per page")
+        for page_num, row in report["pages"].items():
+            if expected is not None:
+                found = f"{row['found']:>5} of {expected} symbols"
+            elif "fallback" in row:
+                found = f"model ({row['fallback']})"
+            else:
+                found = f"{row['certain']:>5} certain" + (", uncertain to confirm" if row["confirm"] else "")
+            print(f"{page_num:>6} | {row['megapixels']:>5} Mpx | {row['match_ms']:>8,.0f} ms | {found}")
+
+
+if __name__ == "__main__":
+    main()
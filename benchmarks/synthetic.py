@@ -0,0 +1,88 @@
+"""
+BidSync AI - Synthetic Blueprints
+Generates multi-page drawing sets with walls, rooms and device symbols, so
+benchmarks run on reproducible input of any size and density
+"""
+
+import random
+from typing import Iterator, Tuple
+
+from PIL import Image, ImageDraw
+
+# Sheet sizes in inches (landscape), by common drawing size name
+SHEET_SIZES = {
+    "B": (17, 11),
+    "D": (36, 24),
+    "E": (48, 36),
+}
+# Device symbols per sheet
+DENSITIES = {
+    "sparse": 40,
+    "typical": 150,
+    "dense": 500,
+}
+# Pixels per inch of the generated raster; poppler re-renders at its own DPI
+SOURCE_DPI = 100
+SYMBOL_RADIUS = 9
+TITLE_BLOCK_WIDTH = 0.15
+
+
+def _draw_sheet(rng: random.Random, size: Tuple[int, int], symbols: int, sheet_num: int) -> Image.Image:
+    width, height = size
+    img = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(img)
+    plan_right = int(width * (1 - TITLE_BLOCK_WIDTH))
+
+    # Border and title block strip along the right edge
+    draw.rectangle([20, 20, width - 20, height - 20], outline=0, width=4)
+    draw.rectangle([plan_right, 20, width - 20, height - 20], outline=0, width=3)
+    for row in range(6):
+        y = height - 40 - row * 60
+        draw.line([plan_right, y, width - 20, y], fill=0, width=1)
+        draw.text((plan_right + 15, y - 45), f"SHEET FA-{100 + sheet_num} REV {row}", fill=0)
+
+    # Rooms: a grid of walls with random splits and door gaps
+    columns, rows = rng.randint(4, 8), rng.randint(3, 6)
+    cell_w, cell_h = (plan_right - 80) // columns, (height - 120) // rows
+    for col in range(columns + 1):
+        x = 60 + col * cell_w
+        draw.line([x, 60, x, 60 + rows * cell_h], fill=0, width=6)
+    for row in range(rows + 1):
+        y = 60 + row * cell_h
+        draw.line([60, y, 60 + columns * cell_w, y], fill=0, width=6)
+    for _ in range(columns * rows):
+        x, y = 60 + rng.randrange(columns) * cell_w, 60 + rng.randrange(rows) * cell_h
+        draw.rectangle([x + cell_w // 3, y - 4, x + cell_w // 3 + 40, y + 4], fill=255)
+
+    # Dimension strings and room tags
+    for _ in range(columns * rows):
+        x, y = rng.randint(80, plan_right - 120), rng.randint(80, height - 80)
+        draw.text((x, y), f"{rng.randint(8, 40)}'-{rng.randint(0, 11)}\"", fill=60)
+
+    # Device symbols: circles and squares with a letter code
+    for _ in range(symbols):
+        x, y = rng.randint(80, plan_right - 40), rng.randint(80, height - 60)
+        box = [x - SYMBOL_RADIUS, y - SYMBOL_RADIUS, x + SYMBOL_RADIUS, y + SYMBOL_RADIUS]
+        if rng.random() < 0.5:
+            draw.ellipse(box, outline=0, width=2)
+        else:
+            draw.rectangle(box, outline=0, width=2)
+        draw.text((x - 4, y - 6), rng.choice("SHFMR"), fill=0)
+    return img
+
+
+def iter_sheets(pages: int, density: str = "typical", sheet_size: str = "D", seed: int = 0) -> Iterator[Image.Image]:
+    """Yield one grayscale sheet at a time, so large sets never sit in memory at once."""
+    width_in, height_in = SHEET_SIZES[sheet_size]
+    size = (width_in * SOURCE_DPI, height_in * SOURCE_DPI)
+    for sheet_num in range(1, pages + 1):
+        rng = random.Random(f"{seed}:{density}:{sheet_size}:{sheet_num}")
+        yield _draw_sheet(rng, size, DENSITIES[density], sheet_num)
+
+
+def make_blueprint_pdf(path: str, pages: int, density: str = "typical", sheet_size: str = "D", seed: int = 0) -> str:
+    """Write a synthetic drawing set; the same arguments always give the same pages."""
+    sheets = iter_sheets(pages, density, sheet_size, seed)
+    first = next(sheets)
+    first.save(path, "PDF", resolution=SOURCE_DPI, save_all=True, append_images=sheets)
+    return path
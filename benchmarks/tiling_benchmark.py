@@ -0,0 +1,133 @@
+"""
+BidSync AI - Tiling Benchmark
+Compares the single-image and tiled analysis paths on the same pages for
+counting accuracy and wall-clock time
+
+Usage (from the repo root):
+    ANTHROPIC_API_KEY=... python -m benchmarks.tiling_benchmark plans.pdf \
+        --trade sprinkler --pages 12-18 --truth truth.json
+
+truth.json holds hand counts per page: {"12": {"sprinkler_heads": 214}, ...}
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from functools import partial
+from typing import Dict, List
+
+from analysis import analyze_blueprint_page_async
+from engine import parse_pages
+from model_client import AsyncModelClient
+from pipeline import DEFAULT_MAX_IN_FLIGHT, run_page_pipeline
+from tiling import analyze_tiled_page, split_into_tiles
+from trades import TRADE_CONFIG
+
+
+def run_mode(mode: str, pdf_path: str, pages: List[int], trade_config: dict,
+             api_key: str, base_url: str, max_in_flight: int) -> Dict:
+    """Analyze the pages once in the given mode and time it."""
+    client_kwargs = {"base_url": base_url} if base_url else {}
+    client = AsyncModelClient(api_key, **client_kwargs)
+    device_keys = list(trade_config["devices"].keys())
+    tiling = trade_config["tiling"]
+    call_slots = asyncio.Semaphore(max_in_flight)
+    calls = {"count": 0}
+
+    async def analyze_image(image_data: bytes, page_num: int, tile: bool) -> Dict:
+        async with call_slots:
+            calls["count"] += 1
+            return await analyze_blueprint_page_async(client, image_data, trade_config, page_num, tile)
+
+    async def analyze_single(page_num: int, image_data: bytes) -> Dict:
+        return await analyze_image(image_data, page_num, False)
+
+    async def analyze_tiled(page_num: int, tiles: List[Dict]) -> Dict:
+        return await analyze_tiled_page(tiles, partial(analyze_image, page_num=page_num, tile=True), device_keys)
+
+    if mode == "tiled":
+        pipeline_kwargs = {
+            "dpi": tiling["dpi"],
+            "encode": partial(split_into_tiles, tile_size=tiling["tile_size"], overlap=tiling["overlap"]),
+        }
+        analyze_page = analyze_tiled
+    else:
+        pipeline_kwargs = {}
+        analyze_page = analyze_single
+
+    started = time.perf_counter()
+    results = dict(run_page_pipeline(pdf_path, pages, analyze_page, max_in_flight=max_in_flight,
+                                     cleanup=client.close, **pipeline_kwargs))
+    elapsed = time.perf_counter() - started
+    return {"mode": mode, "seconds": elapsed, "model_calls": calls["count"], "results": results}
+
+
+def score(results: Dict[int, Dict], truth: Dict[int, Dict[str, int]]) -> Dict:
+    """Absolute counting error against the hand counts."""
+    abs_error = 0
+    true_total = 0
+    cells = 0
+    failed = 0
+    for page_num, expected in truth.items():
+        result = results.get(page_num, {})
+        if "error" in result:
+            failed += 1
+        counted = result.get("devices", {})
+        for key, true_count in expected.items():
+            abs_error += abs(counted.get(key, 0) - true_count)
+            true_total += true_count
+            cells += 1
+    return {
+        "mae": abs_error / cells if cells else 0.0,
+        "abs_error_pct": 100.0 * abs_error / true_total if true_total else 0.0,
+        "failed_pages": failed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tiled vs single-image blueprint analysis")
+    parser.add_argument("pdf")
+    parser.add_argument("--trade", default="sprinkler", choices=list(TRADE_CONFIG.keys()))
+    parser.add_argument("--pages", required=True, help='e.g. "12-18" or "3,5,9"')
+    parser.add_argument("--truth", help="JSON file of hand counts per page")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_MAX_IN_FLIGHT, help="concurrent model calls")
+    parser.add_argument("--base-url", default=os.environ.get("ANTHROPIC_BASE_URL"),
+                        help="point at a stub server instead of the real API")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    pages = parse_pages(args.pages)
+    trade_config = TRADE_CONFIG[args.trade]
+    truth = {}
+    if args.truth:
+        with open(args.truth) as f:
+            truth = {int(page): counts for page, counts in json.load(f).items()}
+
+    api_key = os.environ.get("ANTHROPIC_API_KEY", "")
+    report = []
+    for mode in ("single", "tiled"):
+        run = run_mode(mode, args.pdf, pages, trade_config, api_key, args.base_url, args.jobs)
+        row = {
+            "mode": mode,
+            "seconds": round(run["seconds"], 2),
+            "sec_per_page": round(run["seconds"] / len(pages), 2),
+            "model_calls": run["model_calls"],
+        }
+        if truth:
+            row.update({k: round(v, 2) if isinstance(v, float) else v for k, v in score(run["results"], truth).items()})
+        report.append(row)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    columns = list(report[0].keys())
+    print(" | ".join(f"{c:>14}" for c in columns))
+    for row in report:
+        print(" | ".join(f"{str(row[c]):>14}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+BidSync AI - Command Line
+Runs blueprint takeoffs without the Streamlit app, e.g. from cron
+
+Usage:
+    ANTHROPIC_API_KEY=... python bidsync.py analyze plans.pdf --trade sprinkler \
+        --pages 10-80 --jobs 8 --out result.json
+    python bidsync.py analyze incoming/ --trade fire_alarm,sprinkler --out results/
+    python bidsync.py addendum plans_add1.pdf --previous 3f2a9c01b7e4 --out result_add1.json
+
+A single PDF writes to --out, in the format given by its extension
+(.json or .csv). Several PDFs, or a directory, write both formats per
+PDF into the --out directory using the same file names as the app's
+downloads. The exports are identical to the app's at default prices.
+
+addendum re-analyzes a revised set against an earlier job (its id is
+printed by analyze and shown in the app): only new or changed sheets
+go to the model, and the per-device change against the earlier totals
+is printed and included in the JSON export.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+from addendum import analyze_addendum
+from engine import analyze_pdf, check_pages, find_pdfs, parse_pages, pdf_page_count
+from ensemble import MAX_ENSEMBLE_SIZE
+from exports import (
+    DEFAULT_MISC_COST,
+    DEFAULT_OVERHEAD_PCT,
+    DEFAULT_PROFIT_PCT,
+    calculate_bid,
+    export_csv,
+    export_filename,
+    export_json,
+    export_metrics_csv,
+    export_metrics_json,
+    metrics_filename,
+)
+from job_store import DEFAULT_DB_PATH, JobStore
+from pdf_render import DEFAULT_RENDER_PROFILE, RENDER_PROFILES
+from pipeline import DEFAULT_MAX_IN_FLIGHT, MAX_IN_FLIGHT_LIMIT
+from trades import MULTI_TRADE_KEY, TRADE_CONFIG
+
+EXPORT_FORMATS = ("json", "csv")
+DEFAULT_PARALLEL_FILES = 2
+
+
+def parse_trades(spec: str) -> List[str]:
+    trade_keys = [key.strip() for key in spec.split(",") if key.strip()]
+    unknown = [key for key in trade_keys if key not in TRADE_CONFIG]
+    if unknown or not trade_keys:
+        raise argparse.ArgumentTypeError(
+            f"unknown trade {', '.join(unknown) or spec!r}; choose from {', '.join(TRADE_CONFIG)}"
+        )
+    return trade_keys
+
+
+def parse_page_spec(spec: str) -> List[int]:
+    try:
+        return parse_pages(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def write_exports(results: Dict, out: str, formats: List[str], args) -> List[str]:
+    """Write one export per trade in the results; returns the paths written."""
+    trade_keys = results.get("trades") or [results["trade"]]
+    written = []
+    for trade_key in trade_keys:
+        trade_config = TRADE_CONFIG[trade_key]
+        counts = results["total_devices"]
+        prices = {key: price for key, (_, price) in trade_config["devices"].items()}
+        bid = calculate_bid(trade_config, counts, prices, args.overhead, args.profit, args.misc)
+        for fmt in formats:
+            if os.path.isdir(out):
+                path = os.path.join(out, export_filename(trade_config, results["filename"], fmt))
+            elif len(trade_keys) > 1:
+                stem, extension = os.path.splitext(out)
+                path = f"{stem}_{trade_key}{extension}"
+            else:
+                path = out
+            if fmt == "json":
+                content = export_json(trade_config, results, counts, prices, bid)
+            else:
+                content = export_csv(trade_config, counts, prices)
+            with open(path, "w", newline="") as f:
+                f.write(content)
+            written.append(path)
+
+    if args.metrics:
+        out_dir = out if os.path.isdir(out) else os.path.dirname(out) or "."
+        for fmt in formats:
+            path = os.path.join(out_dir, metrics_filename(results["filename"], fmt))
+            content = export_metrics_json(results) if fmt == "json" else export_metrics_csv(results)
+            with open(path, "w", newline="") as f:
+                f.write(content)
+            written.append(path)
+    return written
+
+
+def run_analyze(args, parser: argparse.ArgumentParser) -> int:
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        print("ANTHROPIC_API_KEY is not set", file=sys.stderr)
+        return 2
+
+    pdfs = find_pdfs(args.inputs)
+    if not pdfs:
+        print("No PDFs found", file=sys.stderr)
+        return 2
+    if args.pages:
+        for pdf_path in pdfs:
+            try:
+                check_pages(args.pages, pdf_page_count(pdf_path))
+            except ValueError as e:
+                parser.error(f"argument --pages: {e} in {pdf_path}")
+
+    single = len(pdfs) == 1 and not os.path.isdir(args.inputs[0])
+    if single and args.out and not os.path.isdir(args.out):
+        extension = os.path.splitext(args.out)[1].lstrip(".").lower()
+        formats = [args.format or (extension if extension in EXPORT_FORMATS else "json")]
+    else:
+        out_dir = args.out or "."
+        os.makedirs(out_dir, exist_ok=True)
+        args.out = out_dir
+        formats = [args.format] if args.format else list(EXPORT_FORMATS)
+
+    trade_keys = args.trade
+    trade_key = trade_keys[0] if len(trade_keys) == 1 else MULTI_TRADE_KEY
+    client_kwargs = {"base_url": args.base_url} if args.base_url else {}
+    # Re-running the same command after a crash resumes each unfinished PDF
+    store = JobStore(args.job_db)
+
+    def analyze(pdf_path: str) -> Dict:
+        def log_page(done: int, total: int, page_num: int, error):
+            if error:
+                print(f"{os.path.basename(pdf_path)}: page {page_num} failed: {error}", file=sys.stderr)
+            elif args.verbose:
+                print(f"{os.path.basename(pdf_path)}: page {page_num} ({done}/{total})", file=sys.stderr)
+
+        def log_resume(job_id: str, pages_done: int):
+            print(f"{os.path.basename(pdf_path)}: resuming job {job_id}, {pages_done} pages already done",
+                  file=sys.stderr)
+
+        return analyze_pdf(
+            pdf_path,
+            trade_key,
+            api_key,
+            pages=args.pages,
+            trade_keys=trade_keys,
+            max_in_flight=args.jobs,
+            use_triage=not args.no_triage,
+            use_vector=not args.no_vector,
+            use_legend=not args.no_legend,
+            tiled=args.tiled,
+            ensemble=args.ensemble,
+            render_profile=args.render_profile,
+            client_kwargs=client_kwargs,
+            store=store,
+            on_resume=log_resume,
+            on_page=log_page
+        )
+
+    failures = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel_files)) as pool:
+        futures = {pool.submit(analyze, pdf_path): pdf_path for pdf_path in pdfs}
+        for future in as_completed(futures):
+            pdf_path = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"{pdf_path}: {e}", file=sys.stderr)
+                continue
+            written = write_exports(results, args.out or "result.json", formats, args)
+            total_found = sum(results["total_devices"].values())
+            failed = len(results["failed_pages"])
+            if failed:
+                failures += 1
+            print(f"{pdf_path}: {total_found} devices on {len(results['page_results'])} pages, "
+                  f"{len(results['skipped_pages'])} skipped, {failed} failed (job {results['job_id']}) "
+                  f"-> {', '.join(written)}")
+
+    print(f"Done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def run_addendum(args) -> int:
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        print("ANTHROPIC_API_KEY is not set", file=sys.stderr)
+        return 2
+
+    out = args.out or "."
+    if os.path.isdir(out):
+        formats = [args.format] if args.format else list(EXPORT_FORMATS)
+    else:
+        extension = os.path.splitext(out)[1].lstrip(".").lower()
+        formats = [args.format or (extension if extension in EXPORT_FORMATS else "json")]
+
+    def log_page(done: int, total: int, page_num: int, error):
+        if error:
+            print(f"page {page_num} failed: {error}", file=sys.stderr)
+        elif args.verbose:
+            print(f"page {page_num} ({done}/{total})", file=sys.stderr)
+
+    started = time.perf_counter()
+    try:
+        results = analyze_addendum(
+            args.input,
+            args.previous,
+            api_key,
+            JobStore(args.job_db),
+            previous_pdf=args.previous_pdf,
+            max_in_flight=args.jobs,
+            client_kwargs={"base_url": args.base_url} if args.base_url else {},
+            on_page=log_page
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    statuses = Counter(sheet["status"] for sheet in results["sheets"])
+    print(f"{args.input}: {statuses['unchanged']} sheets unchanged, {statuses['changed']} changed, "
+          f"{statuses['new']} new, {len(results['removed_sheets'])} removed (job {results['job_id']})")
+    if results["out_of_scope_sheets"]:
+        pages = ", ".join(str(sheet["page"]) for sheet in results["out_of_scope_sheets"])
+        print(f"  Outside the earlier job's pages, not analyzed or compared: {pages}")
+    for delta in results["device_deltas"]:
+        if delta["delta"]:
+            print(f"  {delta['name']}: {delta['previous']} -> {delta['current']} ({delta['delta']:+d})")
+    written = write_exports(results, out, formats, args)
+    print(f"Wrote {', '.join(written)}", file=sys.stderr)
+    print(f"Done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 1 if results["failed_pages"] else 0
+
+
+def add_export_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--overhead", type=int, default=DEFAULT_OVERHEAD_PCT, help="overhead %%")
+    parser.add_argument("--profit", type=int, default=DEFAULT_PROFIT_PCT, help="profit %%")
+    parser.add_argument("--misc", type=int, default=DEFAULT_MISC_COST, help="misc $")
+    parser.add_argument("--metrics", action="store_true",
+                        help="also write per-page timings and tokens next to the exports")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="bidsync", description="BidSync AI blueprint takeoffs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    analyze = commands.add_parser("analyze", help="count devices in one or more PDFs")
+    analyze.add_argument("inputs", nargs="+", help="PDF files or directories of PDFs")
+    analyze.add_argument("--trade", type=parse_trades, required=True,
+                         help="trade key, or several comma-separated for a multi-trade pass")
+    analyze.add_argument("--pages", type=parse_page_spec, help='e.g. "10-80" or "3,5,9" (default: all pages)')
+    analyze.add_argument("--jobs", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                         choices=range(1, MAX_IN_FLIGHT_LIMIT + 1), metavar=f"1-{MAX_IN_FLIGHT_LIMIT}",
+                         help="concurrent model calls per PDF")
+    analyze.add_argument("--parallel-files", type=int, default=DEFAULT_PARALLEL_FILES,
+                         help="PDFs analyzed at the same time")
+    analyze.add_argument("--out", help="output file for one PDF, or output directory")
+    analyze.add_argument("--format", choices=EXPORT_FORMATS, help="export format (default: from --out)")
+    analyze.add_argument("--no-triage", action="store_true", help="analyze every page, even ones triage would skip")
+    analyze.add_argument("--no-vector", action="store_true",
+                         help="send every page to the model, even ones countable from the PDF's vector layer")
+    analyze.add_argument("--no-legend", action="store_true",
+                         help="don't match plan sheets against the symbols of the set's legend")
+    analyze.add_argument("--tiled", action="store_true", help="tiled high-resolution mode for dense sheets")
+    analyze.add_argument("--ensemble", type=int, default=1, choices=range(1, MAX_ENSEMBLE_SIZE + 1),
+                         metavar=f"1-{MAX_ENSEMBLE_SIZE}",
+                         help="analyze each page this many times and reconcile the counts; pages the samples "
+                              "disagree on are re-counted in tiled mode")
+    analyze.add_argument("--render-profile", default=DEFAULT_RENDER_PROFILE, choices=list(RENDER_PROFILES),
+                         help="render pages in color, or as cropped grayscale or black-and-white line art")
+    add_export_arguments(analyze)
+    analyze.add_argument("--base-url", default=os.environ.get("ANTHROPIC_BASE_URL"),
+                         help="point at a stub server instead of the real API")
+    analyze.add_argument("--job-db", default=DEFAULT_DB_PATH, help="SQLite job store used to resume interrupted runs")
+    analyze.add_argument("-v", "--verbose", action="store_true")
+
+    addendum = commands.add_parser("addendum", help="re-analyze only the new or changed sheets of a revised set")
+    addendum.add_argument("input", help="revised PDF")
+    addendum.add_argument("--previous", required=True, help="job id of the earlier analysis")
+    addendum.add_argument("--previous-pdf", help="the earlier PDF, if it is no longer in the upload store")
+    addendum.add_argument("--jobs", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                          choices=range(1, MAX_IN_FLIGHT_LIMIT + 1), metavar=f"1-{MAX_IN_FLIGHT_LIMIT}",
+                          help="concurrent model calls")
+    addendum.add_argument("--out", help="output file, or output directory")
+    addendum.add_argument("--format", choices=EXPORT_FORMATS, help="export format (default: from --out)")
+    add_export_arguments(addendum)
+    addendum.add_argument("--base-url", default=os.environ.get("ANTHROPIC_BASE_URL"),
+                          help="point at a stub server instead of the real API")
+    addendum.add_argument("--job-db", default=DEFAULT_DB_PATH, help="SQLite job store holding the earlier job")
+    addendum.add_argument("-v", "--verbose", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command == "analyze":
+        return run_analyze(args, analyze)
+    if args.command == "addendum":
+        return run_addendum(args)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+BidSync AI - Uploaded Documents
+Stores each upload once under its content hash and reads PDF metadata through
+a memory map, so app reruns never re-read or re-parse the file
+"""
+
+import contextlib
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+from typing import BinaryIO, Dict, Iterator, List
+
+import PyPDF2
+
+DEFAULT_UPLOAD_DIR = os.environ.get(
+    "BIDSYNC_UPLOAD_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "bidsync", "uploads")
+)
+# Uploaded PDFs are kept this long so interrupted jobs can be resumed
+UPLOAD_RETENTION = 7 * 24 * 3600
+POINTS_PER_INCH = 72
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def upload_path(file_hash: str, upload_dir: str = DEFAULT_UPLOAD_DIR) -> str:
+    return os.path.join(upload_dir, f"{file_hash}.pdf")
+
+
+def store_upload(source: BinaryIO, upload_dir: str = DEFAULT_UPLOAD_DIR) -> str:
+    """
+    Spool an uploaded PDF to disk under its content hash and return the path.
+
+    The file is copied and hashed in chunks, so only one chunk is held in
+    memory however large the document is.
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=upload_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        path = upload_path(digest.hexdigest(), upload_dir)
+        if os.path.exists(path):
+            # Touch so retention counts from the latest use
+            os.utime(path)
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def prune_uploads(upload_dir: str = DEFAULT_UPLOAD_DIR, max_age: float = UPLOAD_RETENTION):
+    if not os.path.isdir(upload_dir):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(upload_dir):
+        path = os.path.join(upload_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+def map_document(path: str) -> mmap.mmap:
+    """Read-only memory map of a stored document; the OS pages it in as it is read."""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+@contextlib.contextmanager
+def open_pdf(path: str) -> Iterator[PyPDF2.PdfReader]:
+    """
+    PdfReader over a memory map of the file.
+
+    Given a path, PyPDF2 reads the whole file into a BytesIO first; over
+    the map, only the objects actually parsed are paged in.
+    """
+    document = map_document(path)
+    try:
+        yield PyPDF2.PdfReader(document)
+    finally:
+        document.close()
+
+
+def _page_size(page) -> List[float]:
+    """Width and height in inches, as displayed."""
+    box = page.mediabox
+    width, height = float(box.width) / POINTS_PER_INCH, float(box.height) / POINTS_PER_INCH
+    if (page.get('/Rotate') or 0) % 180:
+        width, height = height, width
+    return [round(width, 1), round(height, 1)]
+
+
+def document_info(path: str) -> Dict:
+    """Page count and per-page sizes of a stored PDF."""
+    with open_pdf(path) as reader:
+        page_sizes = [_page_size(page) for page in reader.pages]
+    return {
+        "size_bytes": os.path.getsize(path),
+        "page_count": len(page_sizes),
+        "page_sizes": page_sizes,
+    }
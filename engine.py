@@ -0,0 +1,355 @@
+"""
+BidSync AI - Analysis Engine
+Render -> analyze -> aggregate for a whole PDF, usable without Streamlit
+"""
+
+import asyncio
+import os
+from concurrent.futures import Executor
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from analysis import add_page_result, analyze_blueprint_page_cached_async, confirm_symbols_cached_async, new_aggregate
+from documents import open_pdf
+from ensemble import analyze_ensemble, ensemble_samples, escalated_result
+from job_store import JobStore, file_sha256
+from model_client import AsyncModelClient
+from legend_index import add_model_counts, build_legend_index, confirm_legend_matches, legend_page_encode
+from page_pool import MIN_PAGES_FOR_POOL, pool_workers, process_pool
+from pdf_render import DEFAULT_DPI, DEFAULT_RENDER_PROFILE, encode_page_image
+from pipeline import DEFAULT_MAX_IN_FLIGHT, DEFAULT_RENDER_WORKERS, run_page_pipeline
+from result_cache import ResultCache
+from tiling import analyze_tiled_page, split_into_tiles
+from trades import resolve_trade_config
+from triage import triage_pages
+from vector_takeoff import read_vector_takeoffs
+
+
+class JobCancelled(Exception):
+    """Raised when a stored job was cancelled while it was running."""
+
+
+def parse_pages(spec: str) -> List[int]:
+    """"3-7,10" -> [3, 4, 5, 6, 7, 10]; raises ValueError for empty, malformed or reversed ranges."""
+    pages = []
+    for part in spec.split(','):
+        part = part.strip()
+        try:
+            first, last = part.split('-') if '-' in part else (part, part)
+            first, last = int(first), int(last)
+        except ValueError:
+            raise ValueError(f"{part!r} is not a page number or range") from None
+        if first < 1 or first > last:
+            raise ValueError(f"{part!r} is not a page range: pages start at 1 and ranges run low to high")
+        pages.extend(range(first, last + 1))
+    return list(dict.fromkeys(pages))
+
+
+def check_pages(pages: List[int], page_count: int):
+    """Raise ValueError if pages reach past the PDF's page_count."""
+    outside = sorted(page_num for page_num in pages if not 1 <= page_num <= page_count)
+    if outside:
+        raise ValueError(f"page {outside[0]} is past the end of the PDF ({page_count} pages)")
+
+
+def pdf_page_count(pdf_path: str) -> int:
+    with open_pdf(pdf_path) as reader:
+        return len(reader.pages)
+
+
+def find_pdfs(paths: List[str]) -> List[str]:
+    """Expand directories into the PDFs they contain, sorted by name."""
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdfs.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(".pdf")
+            )
+        else:
+            pdfs.append(path)
+    return pdfs
+
+
+def analyze_pdf(pdf_path: str, trade_key: str, api_key: str,
+                pages: Optional[List[int]] = None,
+                trade_keys: Optional[List[str]] = None,
+                max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                use_triage: bool = True,
+                use_vector: bool = True,
+                use_legend: bool = True,
+                tiled: bool = False,
+                ensemble: int = 1,
+                render_profile: str = DEFAULT_RENDER_PROFILE,
+                cache: Optional[ResultCache] = None,
+                filename: Optional[str] = None,
+                client_kwargs: Optional[Dict] = None,
+                store: Optional[JobStore] = None,
+                job_id: Optional[str] = None,
+                call_gate=None,
+                on_triage: Optional[Callable[[Dict, List[int]], None]] = None,
+                on_resume: Optional[Callable[[str, int], None]] = None,
+                on_page: Optional[Callable[[int, int, int, Optional[str]], None]] = None) -> Dict:
+    """
+    Analyze a PDF for one trade (or a multi-trade pass) and total the counts.
+
+    Returns the same results dict the app keeps in session state. pages
+    defaults to the whole document. on_triage(skipped_pages, pages_left)
+    is called once triage has run; on_page(done, total, page_num, error)
+    after every page, in completion order. render_profile picks how pages
+    are rasterized (see pdf_render.RENDER_PROFILES). With use_vector,
+    pages whose device tags can be read from the PDF's vector layer are
+    counted locally and never rendered. With use_legend, plan sheets are
+    matched against the symbols of the set's legend; only uncertain
+    matches and devices the legend lacks are left to the model (see
+    legend_index). With ensemble > 1, each page is analyzed that many
+    times at once and the counts reconciled; pages whose samples disagree
+    get a tiled pass (ignored when tiled is already set).
+
+    With a job store, every page result is saved as it completes. An
+    unfinished job for the same file, trade and options (or the given
+    job_id) is resumed: its successful pages are reused (on_resume(job_id,
+    pages_done) is called) and only the rest are sent to the model. A
+    cancel requested through the store raises JobCancelled after the
+    page in progress. call_gate caps model calls across processes.
+    """
+    trade_config = resolve_trade_config(trade_key, trade_keys)
+    trade_keys = trade_config.get("trades")
+    page_count = pdf_page_count(pdf_path)
+    if pages is None:
+        pages = list(range(1, page_count + 1))
+    check_pages(pages, page_count)
+    cache = cache if cache is not None else ResultCache()
+    filename = filename or os.path.basename(pdf_path)
+
+    done_results = {}
+    if store is not None:
+        if job_id is None:
+            file_hash = file_sha256(pdf_path)
+            options = {"pages": sorted(set(pages)), "use_triage": use_triage, "use_vector": use_vector,
+                       "use_legend": use_legend, "tiled": tiled, "ensemble": ensemble,
+                       "render_profile": render_profile}
+            job = store.find_resumable(file_hash, trade_key, trade_keys, options)
+            job_id = job["id"] if job is not None else store.create_job(
+                filename, file_hash, trade_key, trade_keys, options
+            )
+        store.claim_job(job_id)
+        done_results = store.page_results(job_id, include_failed=False)
+        if done_results and on_resume is not None:
+            on_resume(job_id, len(done_results))
+
+        report_page = on_page
+
+        def on_page(done: int, total: int, page_num: int, error: Optional[str]):
+            if report_page is not None:
+                report_page(done, total, page_num, error)
+            if store.cancel_requested(job_id):
+                raise JobCancelled(f"Job {job_id} was cancelled")
+
+    try:
+        results = _run_job(pdf_path, trade_key, trade_config, pages, max_in_flight, use_triage, use_vector,
+                           use_legend, tiled, ensemble, render_profile, cache, client_kwargs, api_key, call_gate,
+                           store, job_id, done_results, on_triage, on_page)
+    except JobCancelled:
+        store.set_status(job_id, "cancelled", cache.stats())
+        raise
+    except BaseException:
+        if store is not None:
+            store.set_status(job_id, "interrupted", cache.stats())
+        raise
+
+    if store is not None:
+        store.set_status(job_id, "completed", cache.stats())
+    return {
+        **results,
+        "filename": filename,
+        "trade": trade_key,
+        "trades": trade_keys,
+        "cache_stats": cache.stats(),
+        "job_id": job_id,
+    }
+
+
+def _model_pass(pdf_path: str, pages: List[int], trade_key: str, trade_config: dict, max_in_flight: int,
+                tiled: bool, ensemble: int, render_profile: str, cache: ResultCache, client_kwargs: Optional[Dict],
+                api_key: str, call_gate, legend: Optional[Dict] = None) -> Iterator[Tuple[int, Dict]]:
+    """
+    Send pages through the render -> model pipeline: one image per page, its
+    tiles, or `ensemble` samples of it. With a legend index, plan sheets are
+    first matched against it on their render: pages whose matches are all
+    certain are counted locally, uncertain matches go to the model as one
+    confirmation grid, devices the legend has no symbol for are counted
+    by the model on the page image, and pages without matches are
+    analyzed as usual.
+    Each pass has its own client, as each pipeline runs its own event loop.
+    """
+    # Rate limiting, backoff and retries are handled by the async client
+    client = AsyncModelClient(api_key, call_gate=call_gate, **(client_kwargs or {}))
+    tiling = trade_config["tiling"]
+    device_keys = list(trade_config["devices"].keys())
+    # Tiles and ensemble samples of every in-flight page share the same
+    # model call budget, so no page's extra calls starve the others
+    call_slots = asyncio.Semaphore(max_in_flight)
+
+    async def analyze_page(page_num: int, image_data: bytes) -> Dict:
+        return await analyze_blueprint_page_cached_async(
+            cache, client, image_data, trade_key, trade_config, page_num
+        )
+
+    async def analyze_page_tiled(page_num: int, tiles: List[Dict]) -> Dict:
+        async def analyze_tile(tile_image: bytes) -> Dict:
+            async with call_slots:
+                return await analyze_blueprint_page_cached_async(
+                    cache, client, tile_image, trade_key, trade_config, page_num, tile=True
+                )
+        return await analyze_tiled_page(tiles, analyze_tile, device_keys)
+
+    async def analyze_page_ensemble(page_num: int, samples: List[Dict]) -> Dict:
+        async def analyze_sample(sample: Dict) -> Dict:
+            async with call_slots:
+                return await analyze_page(page_num, sample["image"])
+        return await analyze_ensemble(samples, analyze_sample, device_keys)
+
+    if tiled:
+        analyze, dpi = analyze_page_tiled, tiling["dpi"]
+        encode = partial(split_into_tiles, tile_size=tiling["tile_size"], overlap=tiling["overlap"])
+    elif ensemble > 1:
+        analyze, dpi, encode = analyze_page_ensemble, DEFAULT_DPI, partial(ensemble_samples, size=ensemble)
+    else:
+        analyze, dpi, encode = analyze_page, DEFAULT_DPI, encode_page_image
+
+    encode_overrides = None
+    render_workers = DEFAULT_RENDER_WORKERS
+    match_pool = None
+    if legend is not None:
+        analyze_rendered = analyze
+        match_metrics = {}
+        legend_pages = set(legend["legend_pages"])
+        plan_pages = [page_num for page_num in pages if page_num not in legend_pages]
+        # Matching is CPU-bound; large sets match one page per process, with
+        # a render worker feeding each
+        workers = pool_workers()
+        if workers > 1 and len(plan_pages) >= MIN_PAGES_FOR_POOL:
+            match_pool = process_pool(workers)
+            render_workers = max(render_workers, workers)
+        match = partial(legend_page_encode, index=legend, device_keys=device_keys, dpi=dpi, encode=encode,
+                        match_metrics=match_metrics, pool=match_pool)
+        encode_overrides = {page_num: partial(match, page_num=page_num) for page_num in plan_pages}
+
+        async def analyze(page_num: int, image_data) -> Dict:
+            # A legend takeoff stands in for the image of a matched page
+            if not isinstance(image_data, dict):
+                result = await analyze_rendered(page_num, image_data)
+                if page_num in match_metrics:
+                    result = {**result, "metrics": {**result.get("metrics", {}), **match_metrics[page_num]}}
+                return result
+            result = image_data["result"]
+            uncovered = image_data["uncovered"]
+            confirm = image_data["confirm"]
+            if confirm is not None:
+                # Cells can only show devices the legend has a symbol for. The
+                # grid and the page image share the pipeline's call budget
+                covered = {key: device for key, device in trade_config["devices"].items() if key not in uncovered}
+                confirmation = await confirm_symbols_cached_async(
+                    cache, client, confirm["image"], confirm["cells"], trade_key,
+                    {**trade_config, "devices": covered}, page_num
+                )
+                result = confirm_legend_matches(result, confirmation)
+                if "error" in result:
+                    return result
+            if uncovered:
+                result = add_model_counts(result, await analyze_rendered(page_num, image_data["image"]), uncovered)
+            return result
+
+    results = run_page_pipeline(
+        pdf_path,
+        pages,
+        analyze,
+        max_in_flight=max_in_flight,
+        render_workers=render_workers,
+        cleanup=client.close,
+        dpi=dpi,
+        encode=encode,
+        render_profile=render_profile,
+        encode_overrides=encode_overrides
+    )
+    if match_pool is None:
+        return results
+    return _closing_pool(results, match_pool)
+
+
+def _closing_pool(results: Iterator[Tuple[int, Dict]], pool: Executor) -> Iterator[Tuple[int, Dict]]:
+    """Yield the pipeline's results, shutting the matching pool down once the pipeline is done or abandoned."""
+    try:
+        yield from results
+    finally:
+        results.close()
+        pool.shutdown(cancel_futures=True)
+
+
+def _run_job(pdf_path: str, trade_key: str, trade_config: dict, pages: List[int], max_in_flight: int,
+             use_triage: bool, use_vector: bool, use_legend: bool, tiled: bool, ensemble: int,
+             render_profile: str, cache: ResultCache, client_kwargs: Optional[Dict], api_key: str, call_gate,
+             store: Optional[JobStore], job_id: Optional[str], done_results: Dict[int, Dict], on_triage,
+             on_page) -> Dict:
+    skipped_pages = {}
+    if use_triage:
+        triage = triage_pages(pdf_path, pages, trade_config.get("trades", [trade_key]))
+        pages = triage["analyze"]
+        skipped_pages = triage["skipped"]
+        if store is not None:
+            store.set_skipped(job_id, skipped_pages)
+        if on_triage is not None:
+            on_triage(skipped_pages, pages)
+
+    aggregate = new_aggregate(trade_config)
+    # Pages finished by an earlier, interrupted run of this job
+    for page_num in sorted(done_results):
+        if page_num in pages:
+            add_page_result(aggregate, page_num, done_results[page_num])
+    pages_done = len(aggregate["page_results"])
+    remaining = [page_num for page_num in pages if page_num not in done_results]
+
+    def record_page(page_num: int, result: Dict):
+        nonlocal pages_done
+        pages_done += 1
+        if store is not None:
+            store.record_page(job_id, page_num, result)
+        error = add_page_result(aggregate, page_num, result)
+        if on_page is not None:
+            on_page(pages_done, len(pages), page_num, error)
+
+    # CAD-exported sheets with tagged symbols are counted from the vector
+    # layer; scans and ambiguous sheets go on to the model
+    if use_vector and remaining:
+        takeoffs = read_vector_takeoffs(pdf_path, remaining, trade_config)
+        counted = [page_num for page_num in remaining if "fallback" not in takeoffs[page_num]]
+        for page_num in counted:
+            record_page(page_num, takeoffs[page_num])
+        remaining = [page_num for page_num in remaining if page_num not in counted]
+
+    # With a symbol legend in the set, plan sheets are matched against its
+    # templates as they come out of the renderer (see _model_pass)
+    legend = build_legend_index(pdf_path, trade_config) if use_legend and remaining else None
+    if legend and not legend["templates"]:
+        legend = None
+
+    # Pages render while earlier ones are still with the model;
+    # results come back in completion order
+    flagged = {}
+    for page_num, result in _model_pass(pdf_path, remaining, trade_key, trade_config, max_in_flight, tiled, ensemble,
+                                        render_profile, cache, client_kwargs, api_key, call_gate, legend):
+        if result.get("ensemble", {}).get("flagged"):
+            flagged[page_num] = result
+            continue
+        record_page(page_num, result)
+
+    # Pages whose samples disagree are counted again in tiled mode
+    if flagged:
+        for page_num, result in _model_pass(pdf_path, sorted(flagged), trade_key, trade_config, max_in_flight, True,
+                                            1, render_profile, cache, client_kwargs, api_key, call_gate):
+            record_page(page_num, escalated_result(flagged[page_num], result))
+
+    aggregate["page_results"].sort(key=lambda pr: pr["page"])
+    aggregate["page_metrics"].sort(key=lambda row: row["page"])
+    return {**aggregate, "skipped_pages": skipped_pages}
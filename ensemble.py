@@ -0,0 +1,143 @@
+"""
+BidSync AI - Ensemble Analysis
+Analyzes a page several times at once (shifted against the model's image
+patches), reconciles the counts and flags pages the samples disagree on
+"""
+
+import asyncio
+import statistics
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List
+
+from PIL import Image
+
+from analysis import add_usage
+from metrics import merge_metrics
+from pdf_render import encode_page_image, is_color, model_size
+
+DEFAULT_ENSEMBLE_SIZE = 3
+# Sample i trims ENSEMBLE_SHIFTS[i] pixels off the left and top of
+# the page once it is scaled to the model's size, so every symbol lands
+# elsewhere on the grid of patches the model reads the image in. Drawings
+# keep a margin, so no device is lost. The first sample is the page image
+# itself, so it is the regular analysis and shares its cache entry.
+ENSEMBLE_SHIFTS = [(0, 0), (14, 0), (0, 14), (14, 14), (7, 21), (21, 7), (21, 21)]
+# Every sample needs a shift of its own: a repeated one is the same image,
+# the same cache entry and the same answer counted twice in the median
+MAX_ENSEMBLE_SIZE = len(ENSEMBLE_SHIFTS)
+# A device's counts disagree when their spread (max - min) is more than
+# this share of the median, and more than MIN_SPREAD
+SPREAD_TOLERANCE = 0.2
+MIN_SPREAD = 2
+
+
+def ensemble_samples(img: Image.Image, size: int = DEFAULT_ENSEMBLE_SIZE) -> List[Dict]:
+    """Pipeline encode step: one model-ready image per sample, scaled once and shifted after scaling."""
+    img = img.convert('RGB' if is_color(img) else 'L')
+    scaled = model_size(*img.size)
+    if scaled != img.size:
+        img = img.resize(scaled, Image.LANCZOS, reducing_gap=3.0)
+    samples = []
+    for dx, dy in ENSEMBLE_SHIFTS[:size]:
+        # Already within the model's limits, so encoding does not resize again
+        shifted = img.crop((dx, dy, img.width, img.height)) if dx or dy else img
+        samples.append({"image": encode_page_image(shifted)})
+    return samples
+
+
+def disagreement(counts: List[int]) -> bool:
+    """True if a device's sample counts are too far apart to trust their median."""
+    spread = max(counts) - min(counts)
+    return spread > MIN_SPREAD and spread > SPREAD_TOLERANCE * statistics.median(counts)
+
+
+def reconcile(results: List[Dict], device_keys: List[str]) -> Dict:
+    """
+    One page result from several successful samples.
+
+    Each device gets the median of its counts (the lower one for an even
+    number of samples, so it is always a count some sample gave) and the
+    page type is voted on. Description and notes come from the sample
+    closest to the reconciled counts. "ensemble" records the sample count,
+    per-device ranges and the devices the samples disagree on ("flagged").
+    """
+    devices = {key: statistics.median_low([r["devices"].get(key, 0) for r in results]) for key in device_keys}
+    ranges = {}
+    flagged = []
+    for key in device_keys:
+        counts = [r["devices"].get(key, 0) for r in results]
+        if min(counts) != max(counts):
+            ranges[key] = [min(counts), max(counts)]
+        if disagreement(counts):
+            flagged.append(key)
+    closest = min(results, key=lambda r: sum(abs(r["devices"].get(key, 0) - devices[key]) for key in device_keys))
+    notes = closest.get("notes", "")
+    if flagged:
+        spreads = ", ".join(f"{key} {ranges[key][0]}-{ranges[key][1]}" for key in flagged)
+        notes = " | ".join(filter(None, [notes, f"Samples disagree: {spreads}"]))
+    return {
+        "page_type": Counter(r.get("page_type", "unknown") for r in results).most_common(1)[0][0],
+        "description": closest.get("description", ""),
+        "devices": devices,
+        "notes": notes,
+        "ensemble": {"samples": len(results), "ranges": ranges, "flagged": flagged},
+    }
+
+
+async def analyze_ensemble(samples: List[Dict], analyze_sample: Callable[[Dict], Awaitable[Dict]],
+                           device_keys: List[str]) -> Dict:
+    """
+    Analyze every sample concurrently and reconcile the counts.
+
+    If any sample failed with a retryable error the page is reported as
+    retryable, so the pipeline requeues it (samples that succeeded come back
+    from the result cache). Otherwise failed samples are left out, and the
+    page fails only if every sample did.
+    """
+    sample_results = await asyncio.gather(*(analyze_sample(sample) for sample in samples))
+    bookkeeping = {"usage": {}, "retries": 0, "reasks": 0,
+                   "metrics": {**merge_metrics([r.get("metrics", {}) for r in sample_results]),
+                               "samples": len(samples)}}
+    for result in sample_results:
+        add_usage(bookkeeping["usage"], result.get("usage", {}))
+        bookkeeping["retries"] += result.get("retries", 0)
+        bookkeeping["reasks"] += result.get("reasks", 0)
+
+    failed = [r for r in sample_results if "error" in r]
+    retryable = [r for r in failed if r.get("retryable")]
+    if retryable or len(failed) == len(sample_results):
+        error = (retryable or failed)[0]
+        return {"error": error["error"], "retryable": bool(retryable), **bookkeeping}
+    return {**reconcile([r for r in sample_results if "error" not in r], device_keys), **bookkeeping}
+
+
+def escalated_result(ensemble_result: Dict, escalation: Dict) -> Dict:
+    """
+    The page result after a flagged ensemble page was analyzed again in
+    tiled mode: the tiled counts, unless that pass failed. Devices counted
+    from the set's legend keep their legend count.
+    """
+    usage = add_usage(dict(ensemble_result.get("usage", {})), escalation.get("usage", {}))
+    if "error" in escalation:
+        notes = f"{ensemble_result.get('notes', '')} | Tiled re-count failed: {escalation['error']}"
+        return {**ensemble_result, "notes": notes, "usage": usage}
+    metrics = {**escalation.get("metrics", {}), "samples": ensemble_result["metrics"].get("samples")}
+    for field in ("match_ms", "match_mpx_per_s"):
+        if field in ensemble_result["metrics"]:
+            metrics[field] = ensemble_result["metrics"][field]
+    for field in ("base64_ms", "model_ms"):
+        metrics[field] = round(ensemble_result["metrics"].get(field, 0) + metrics.get(field, 0), 1)
+    ensemble = ensemble_result["ensemble"]
+    legend = ensemble_result.get("legend", {})
+    return {
+        **escalation,
+        **({"legend": legend} if legend else {}),
+        "devices": {**escalation["devices"], **legend.get("devices", {})},
+        "notes": " | ".join(filter(None, [ensemble_result.get("notes", ""), "Re-counted in tiled mode",
+                                          escalation.get("notes", "")])),
+        "ensemble": {**ensemble, "escalated": True, "ensemble_devices": ensemble_result["devices"]},
+        "usage": usage,
+        "retries": ensemble_result.get("retries", 0) + escalation.get("retries", 0),
+        "reasks": ensemble_result.get("reasks", 0) + escalation.get("reasks", 0),
+        "metrics": metrics,
+    }
@@ -0,0 +1,135 @@
+"""
+BidSync AI - Bid Exports
+Bid math and the CSV / JSON / text summary downloads, shared by the app and the CLI
+"""
+
+import json
+from typing import Dict, List
+
+import pandas as pd
+
+from metrics import METRIC_FIELDS, summarize_metrics
+
+DEFAULT_OVERHEAD_PCT = 10
+DEFAULT_PROFIT_PCT = 15
+DEFAULT_MISC_COST = 0
+
+
+def calculate_bid(trade_config: dict, counts: Dict[str, int], prices: Dict[str, float],
+                  overhead_pct: float = DEFAULT_OVERHEAD_PCT, profit_pct: float = DEFAULT_PROFIT_PCT,
+                  misc_cost: float = DEFAULT_MISC_COST) -> Dict:
+    """Material cost plus overhead, profit (on material + overhead) and misc."""
+    material_cost = sum(
+        counts.get(key, 0) * prices.get(key, dp)
+        for key, (_, dp) in trade_config["devices"].items()
+    )
+
+    overhead_amount = material_cost * (overhead_pct / 100)
+    profit_amount = (material_cost + overhead_amount) * (profit_pct / 100)
+    return {
+        "material_cost": material_cost,
+        "overhead_pct": overhead_pct,
+        "overhead_amount": overhead_amount,
+        "profit_pct": profit_pct,
+        "profit_amount": profit_amount,
+        "misc_cost": misc_cost,
+        "total_bid": material_cost + overhead_amount + profit_amount + misc_cost,
+    }
+
+
+def export_rows(trade_config: dict, counts: Dict[str, int], prices: Dict[str, float]) -> List[Dict]:
+    """One row per device that was found."""
+    rows = []
+    for key, (display_name, default_price) in trade_config["devices"].items():
+        count = counts.get(key, 0)
+        price = prices.get(key, default_price)
+        if count > 0:
+            rows.append({
+                "Device": display_name,
+                "Count": count,
+                "Unit Price": price,
+                "Total": count * price
+            })
+    return rows
+
+
+def export_filename(trade_config: dict, filename: str, extension: str) -> str:
+    return f"bidsync_{trade_config['name'].lower()}_{filename.split('.')[0]}.{extension}"
+
+
+def metrics_filename(filename: str, extension: str) -> str:
+    return f"bidsync_metrics_{filename.split('.')[0]}.{extension}"
+
+
+def export_csv(trade_config: dict, counts: Dict[str, int], prices: Dict[str, float]) -> str:
+    return pd.DataFrame(export_rows(trade_config, counts, prices)).to_csv(index=False)
+
+
+def export_json(trade_config: dict, results: Dict, counts: Dict[str, int], prices: Dict[str, float],
+                bid: Dict) -> str:
+    """Device rows, bid and the per-page breakdown for one trade."""
+    device_keys = trade_config["devices"]
+    page_results = [
+        {**pr, "devices": {k: v for k, v in pr.get("devices", {}).items() if k in device_keys}}
+        for pr in results["page_results"]
+    ]
+    export = {
+        "filename": results["filename"],
+        "trade": trade_config["name"],
+        "pages": len(results["page_results"]),
+        "devices": export_rows(trade_config, counts, prices),
+        "bid": bid,
+        "page_results": page_results,
+        "failed_pages": {str(page): error for page, error in sorted(results.get("failed_pages", {}).items())},
+        "skipped_pages": {str(page): reason for page, reason in sorted(results.get("skipped_pages", {}).items())},
+    }
+    if results.get("device_deltas") is not None:
+        export["addendum"] = {
+            "previous_job_id": results.get("previous_job_id"),
+            "device_deltas": [delta for delta in results["device_deltas"] if delta["device"] in device_keys],
+            "out_of_scope_pages": [sheet["page"] for sheet in results.get("out_of_scope_sheets", [])]
+            or results.get("out_of_scope_pages", []),
+        }
+    return json.dumps(export, indent=2)
+
+
+def export_summary(trade_config: dict, results: Dict, counts: Dict[str, int], prices: Dict[str, float],
+                   bid: Dict) -> str:
+    """Plain-text bid summary."""
+    summary = f"""BidSync AI - {trade_config['name']} Analysis
+File: {results['filename']}
+Pages: {len(results['page_results'])}
+
+DEVICES:
+"""
+    for key, (display_name, dp) in trade_config["devices"].items():
+        count = counts.get(key, 0)
+        price = prices.get(key, dp)
+        if count > 0:
+            summary += f"- {display_name}: {count} @ ${price} = ${count * price:,.2f}\n"
+
+    summary += f"""
+BID:
+- Material: ${bid['material_cost']:,.2f}
+- Overhead ({bid['overhead_pct']}%): ${bid['overhead_amount']:,.2f}
+- Profit ({bid['profit_pct']}%): ${bid['profit_amount']:,.2f}
+- Misc: ${bid['misc_cost']:,.2f}
+- TOTAL: ${bid['total_bid']:,.2f}
+"""
+    return summary
+
+
+def export_metrics_csv(results: Dict) -> str:
+    """Per-page timings and tokens, one row per analyzed page."""
+    return pd.DataFrame(results.get("page_metrics", []), columns=METRIC_FIELDS).to_csv(index=False)
+
+
+def export_metrics_json(results: Dict) -> str:
+    """Per-page timings and tokens with totals and percentiles, for capacity planning."""
+    rows = results.get("page_metrics", [])
+    return json.dumps({
+        "filename": results["filename"],
+        "usage": results.get("usage"),
+        "summary": summarize_metrics(rows),
+        "pages": rows,
+    }, indent=2)
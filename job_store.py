@@ -0,0 +1,280 @@
+"""
+BidSync AI - Job Store
+SQLite record of every analysis job and its per-page results, so interrupted
+jobs resume where they stopped and finished jobs reopen without model calls
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from analysis import add_page_result, new_aggregate
+from trades import resolve_trade_config
+
+DEFAULT_DB_PATH = os.environ.get(
+    "BIDSYNC_JOB_DB",
+    os.path.join(os.path.expanduser("~"), ".cache", "bidsync", "jobs.sqlite3")
+)
+
+# queued: waiting for a worker; running: owned by the process in `pid`;
+# cancelling: the owner should stop after its current pages; interrupted
+# or cancelled: stopped early; failed: the job itself errored; completed:
+# every page has a result, though some may have failed
+ACTIVE_STATUSES = ("queued", "running", "cancelling")
+RESUMABLE_STATUSES = ("interrupted", "cancelled", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    file_sha256 TEXT NOT NULL,
+    trade TEXT NOT NULL,
+    trades TEXT,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL,
+    pid INTEGER,
+    error TEXT,
+    previous_job_id TEXT,
+    skipped_pages TEXT NOT NULL DEFAULT '{}',
+    cache_stats TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_file ON jobs (file_sha256, trade);
+CREATE TABLE IF NOT EXISTS page_results (
+    job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    page INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, page)
+);
+"""
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _options_json(options: Dict) -> str:
+    # Canonical form so equal options compare equal as text
+    return json.dumps(options, sort_keys=True)
+
+
+class JobStore:
+    """Jobs and their page results in one SQLite database, safe to share across threads."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            # WAL lets the app read past jobs while a CLI run is writing pages
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(SCHEMA)
+
+    def _execute(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    def create_job(self, filename: str, file_hash: str, trade_key: str,
+                   trade_keys: Optional[List[str]], options: Dict, status: str = "running",
+                   previous_job_id: Optional[str] = None) -> str:
+        """previous_job_id links an addendum job to the job for the set it revises."""
+        job_id = uuid.uuid4().hex[:12]
+        now = _now()
+        self._execute(
+            "INSERT INTO jobs (id, filename, file_sha256, trade, trades, options, status, pid, previous_job_id, "
+            "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, filename, file_hash, trade_key, json.dumps(trade_keys), _options_json(options),
+             status, os.getpid(), previous_job_id, now, now),
+        )
+        return job_id
+
+    def find_resumable(self, file_hash: str, trade_key: str, trade_keys: Optional[List[str]],
+                       options: Dict) -> Optional[Dict]:
+        """
+        The newest unfinished job for the same file, trade and options, if any.
+
+        Jobs still marked active count only if their owning process has
+        died; a job that is really running elsewhere is left alone.
+        """
+        return self._first_resumable(self._execute(
+            "SELECT * FROM jobs WHERE file_sha256 = ? AND trade = ? AND trades = ? AND options = ? "
+            "AND previous_job_id IS NULL AND status != 'completed' ORDER BY created_at DESC",
+            (file_hash, trade_key, json.dumps(trade_keys), _options_json(options)),
+        ))
+
+    def find_resumable_addendum(self, file_hash: str, previous_job_id: str) -> Optional[Dict]:
+        """The newest unfinished addendum job for the same file against the same earlier job, if any."""
+        # Trade and options all follow from the earlier job
+        return self._first_resumable(self._execute(
+            "SELECT * FROM jobs WHERE file_sha256 = ? AND previous_job_id = ? AND status != 'completed' "
+            "ORDER BY created_at DESC",
+            (file_hash, previous_job_id),
+        ))
+
+    def _first_resumable(self, rows: List[sqlite3.Row]) -> Optional[Dict]:
+        for row in rows:
+            if row["status"] in RESUMABLE_STATUSES or not _process_alive(row["pid"]):
+                return self._job(row)
+        return None
+
+    def set_options(self, job_id: str, options: Dict):
+        """Replace the job's options, e.g. once an addendum's pages are known."""
+        self._execute(
+            "UPDATE jobs SET options = ?, updated_at = ? WHERE id = ?",
+            (_options_json(options), _now(), job_id),
+        )
+
+    def queue_job(self, job_id: str):
+        """Mark the job as waiting for a worker of this process's pool."""
+        self._execute(
+            "UPDATE jobs SET status = 'queued', pid = ?, error = NULL, updated_at = ? WHERE id = ?",
+            (os.getpid(), _now(), job_id),
+        )
+
+    def claim_job(self, job_id: str):
+        """Mark the job as running in this process."""
+        self._execute(
+            "UPDATE jobs SET status = 'running', pid = ?, error = NULL, updated_at = ? WHERE id = ?",
+            (os.getpid(), _now(), job_id),
+        )
+
+    def request_cancel(self, job_id: str):
+        self._execute(
+            "UPDATE jobs SET status = 'cancelling', updated_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+            (_now(), job_id),
+        )
+
+    def cancel_requested(self, job_id: str) -> bool:
+        rows = self._execute("SELECT status FROM jobs WHERE id = ?", (job_id,))
+        return bool(rows) and rows[0]["status"] == "cancelling"
+
+    def record_page(self, job_id: str, page_num: int, result: Dict):
+        """Save a page result as soon as it completes."""
+        self._execute(
+            "INSERT OR REPLACE INTO page_results (job_id, page, result) VALUES (?, ?, ?)",
+            (job_id, page_num, json.dumps(result)),
+        )
+        self._execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (_now(), job_id))
+
+    def set_skipped(self, job_id: str, skipped_pages: Dict):
+        self._execute(
+            "UPDATE jobs SET skipped_pages = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(skipped_pages), _now(), job_id),
+        )
+
+    def set_status(self, job_id: str, status: str, cache_stats: Optional[Dict] = None, error: Optional[str] = None):
+        self._execute(
+            "UPDATE jobs SET status = ?, cache_stats = COALESCE(?, cache_stats), error = ?, updated_at = ? WHERE id = ?",
+            (status, json.dumps(cache_stats) if cache_stats is not None else None, error, _now(), job_id),
+        )
+
+    def page_results(self, job_id: str, include_failed: bool = True) -> Dict[int, Dict]:
+        results = {}
+        for row in self._execute("SELECT page, result FROM page_results WHERE job_id = ?", (job_id,)):
+            result = json.loads(row["result"])
+            if include_failed or "error" not in result:
+                results[row["page"]] = result
+        return results
+
+    def job_progress(self, job_id: str) -> Optional[Dict]:
+        """Status and page counts for polling a job from another process."""
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+        rows = self._execute(
+            "SELECT COUNT(*) AS done, COALESCE(SUM(json_extract(result, '$.error') IS NOT NULL), 0) AS failed "
+            "FROM page_results WHERE job_id = ?",
+            (job_id,),
+        )
+        status = job["status"]
+        if status in ACTIVE_STATUSES and not _process_alive(job["pid"]):
+            # The owning worker died without recording why
+            status = "interrupted"
+        return {
+            "status": status,
+            "error": job["error"],
+            "pages_done": rows[0]["done"],
+            "pages_failed": rows[0]["failed"],
+            "pages_skipped": len(job["skipped_pages"]),
+            "pages_total": len(job["options"]["pages"]) - len(job["skipped_pages"]),
+        }
+
+    def _job(self, row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["trades"] = json.loads(job["trades"]) if job["trades"] else None
+        job["options"] = json.loads(job["options"])
+        job["skipped_pages"] = {int(page): reason for page, reason in json.loads(job["skipped_pages"]).items()}
+        job["cache_stats"] = json.loads(job["cache_stats"]) if job["cache_stats"] else None
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._job(rows[0]) if rows else None
+
+    def list_jobs(self, trade_key: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Newest jobs first, with how many pages have results so far."""
+        where = "WHERE j.trade = ?" if trade_key else ""
+        rows = self._execute(
+            f"SELECT j.*, COUNT(p.page) AS pages_done FROM jobs j "
+            f"LEFT JOIN page_results p ON p.job_id = j.id {where} "
+            f"GROUP BY j.id ORDER BY j.created_at DESC LIMIT ?",
+            ((trade_key, limit) if trade_key else (limit,)),
+        )
+        return [self._job(row) for row in rows]
+
+    def delete_job(self, job_id: str):
+        self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def load_results(self, job_id: str) -> Optional[Dict]:
+        """Rebuild the app's results dict for a job from its stored page results."""
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+        trade_config = resolve_trade_config(job["trade"], job["trades"])
+        aggregate = new_aggregate(trade_config)
+        for page_num, result in sorted(self.page_results(job_id).items()):
+            add_page_result(aggregate, page_num, result)
+        return {
+            **aggregate,
+            "filename": job["filename"],
+            "trade": job["trade"],
+            "trades": job["trades"],
+            "cache_stats": job["cache_stats"] or {"hits": 0, "misses": 0},
+            "skipped_pages": job["skipped_pages"],
+            "job_id": job_id,
+            "status": job["status"],
+            "previous_job_id": job["previous_job_id"],
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
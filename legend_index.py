@@ -0,0 +1,378 @@
+"""
+BidSync AI - Legend Symbol Index
+Finds the symbol legend of a drawing set, cuts its symbols out as templates
+and counts matching symbols on every plan sheet locally; only uncertain
+matches go to the model
+"""
+
+import re
+from concurrent.futures import Executor
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from analysis import add_usage
+from documents import POINTS_PER_INCH, open_pdf
+from metrics import merge_metrics
+from page_pool import map_page_chunks
+from pdf_render import CROP_INK_LEVEL, encode_page_image, iter_pdf_pages
+from pipeline import plan_render_ranges
+from symbol_counter import MATCH_DPI, find_symbols, match_encode, match_scores
+from triage import page_text
+
+LEGEND_HEADING = "LEGEND"
+# Legend entries sit below the heading, within this many inches of it
+LEGEND_MAX_WIDTH = 8.0
+LEGEND_MAX_HEIGHT = 12.0
+# A legend symbol is drawn within this many inches left of its label
+LEGEND_SYMBOL_WIDTH = 1.0
+LEGEND_ROW_HEIGHT = 0.5
+# Crop rows/columns this dark are table rules, not part of the symbol
+TABLE_RULE_FRACTION = 0.9
+TEMPLATE_MIN_SIZE = 6
+# Normalized cross-correlation: matches at or above MATCH_THRESHOLD count
+# locally, weaker ones (down to symbol_counter.MIN_SCORE) and close calls
+# between two devices are confirmed by the model
+MATCH_THRESHOLD = 0.75
+CONFIRM_MARGIN = 0.05
+# Legends repeated across sheets give one template per symbol
+SAME_SYMBOL_SCORE = 0.9
+# Above this many uncertain matches the whole page goes to the model
+MAX_CONFIRMATIONS = 60
+MONTAGE_COLUMNS = 8
+MONTAGE_SCALE = 3
+# Pixels (at MATCH_DPI) kept around a candidate symbol in its cell
+CELL_MARGIN = 2
+CAPTION_SIZE = 14
+
+
+def _label_words(text: str) -> set:
+    """Upper-case words without parenthesized qualifiers, plural s dropped."""
+    words = set()
+    for word in re.split(r"[^A-Z0-9]+", re.sub(r"\(.*?\)", " ", text.upper())):
+        if len(word) > 3 and word.endswith("S"):
+            word = word[:-1]
+        if word:
+            words.add(word)
+    return words
+
+
+def device_for_label(label: str, trade_config: dict) -> Optional[str]:
+    """
+    The trade device a legend label describes: every word of the device's
+    name appears in the label, and no other device with as many name
+    words does ("ADDRESSABLE SMOKE DETECTOR" -> smoke_detectors).
+    """
+    label_words = _label_words(label)
+    best, best_size, tied = None, 0, False
+    for key, (display_name, _) in trade_config["devices"].items():
+        name_words = _label_words(display_name)
+        if not name_words or not name_words <= label_words:
+            continue
+        if len(name_words) > best_size:
+            best, best_size, tied = key, len(name_words), False
+        elif len(name_words) == best_size:
+            tied = True
+    return None if tied else best
+
+
+def _display_size(page) -> Tuple[float, float]:
+    """Page width and height in inches, as displayed."""
+    width = float(page.mediabox.width) / POINTS_PER_INCH
+    height = float(page.mediabox.height) / POINTS_PER_INCH
+    rotation = (page.get('/Rotate') or 0) % 360
+    return (height, width) if rotation in (90, 270) else (width, height)
+
+
+def find_legend_rows(page, trade_config: dict) -> List[Dict]:
+    """Legend entries for the trade's devices on a PyPDF2 page: device key, label and label position."""
+    try:
+        fragments = page_text(page)
+    except Exception:
+        return []
+    width, height = _display_size(page)
+    rows = {}
+    for heading, (hu, hv) in fragments:
+        if LEGEND_HEADING not in heading.upper():
+            continue
+        for text, (u, v) in fragments:
+            if not (0 < (hv - v) * height <= LEGEND_MAX_HEIGHT
+                    and -LEGEND_SYMBOL_WIDTH <= (u - hu) * width <= LEGEND_MAX_WIDTH):
+                continue
+            device = device_for_label(text, trade_config)
+            if device is not None:
+                rows[(round(u, 4), round(v, 4))] = {"device": device, "label": " ".join(text.upper().split()),
+                                                    "u": u, "v": v}
+    return list(rows.values())
+
+
+def _read_legend_rows(pdf_path: str, pages: List[int], trade_config: dict) -> Dict[int, List[Dict]]:
+    with open_pdf(pdf_path) as reader:
+        legends = {page_num: find_legend_rows(reader.pages[page_num - 1], trade_config) for page_num in pages}
+    return {page_num: rows for page_num, rows in legends.items() if rows}
+
+
+def read_legend_rows(pdf_path: str, trade_config: dict, workers: Optional[int] = None) -> Dict[int, List[Dict]]:
+    """Legend entries of every page of the set that has any, spreading large sets over a process pool."""
+    with open_pdf(pdf_path) as reader:
+        pages = list(range(1, len(reader.pages) + 1))
+    return map_page_chunks(_read_legend_rows, pdf_path, pages, trade_config, workers=workers)
+
+
+def _ink_runs(ink: np.ndarray) -> List[Tuple[int, int]]:
+    """[start, end) runs of True in a 1-D mask."""
+    edges = np.diff(np.concatenate(([0], ink.astype(np.int8), [0])))
+    return list(zip(np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0]))
+
+
+def _cut_template(gray: np.ndarray, left: int, top: int, right: int, bottom: int) -> Optional[np.ndarray]:
+    """
+    The symbol inside a crop box: the band of ink nearest the box's middle
+    row, trimmed to its inked part, ignoring table rules along the box.
+    """
+    top, left = max(0, top), max(0, left)
+    region = gray[top:max(top, bottom), left:max(left, right)]
+    if region.size == 0:
+        return None
+    ink = region < CROP_INK_LEVEL / 255
+    ink[ink.mean(axis=1) > TABLE_RULE_FRACTION, :] = False
+    ink[:, ink.mean(axis=0) > TABLE_RULE_FRACTION] = False
+    runs = _ink_runs(ink.any(axis=1))
+    if not runs:
+        return None
+    middle = region.shape[0] / 2
+    first_row, last_row = min(runs, key=lambda run: 0 if run[0] <= middle < run[1] else
+                              min(abs(run[0] - middle), abs(run[1] - middle)))
+    cols = np.nonzero(ink[first_row:last_row].any(axis=0))[0]
+    template = region[max(0, first_row - 1):last_row + 1, max(0, cols[0] - 1):cols[-1] + 2]
+    if min(template.shape) < TEMPLATE_MIN_SIZE:
+        return None
+    return template.copy()
+
+
+def _template_crops(img: Image.Image, rows: List[Dict]) -> List[Dict]:
+    """Cut the symbol left of each legend label out of the legend page rendered at MATCH_DPI."""
+    gray = np.asarray(img.convert("L"), dtype=np.float32) / 255
+    height, width = gray.shape
+    templates = []
+    for row in rows:
+        x, y = row["u"] * width, (1 - row["v"]) * height
+        # Half the distance to the nearest row of the same legend column
+        half = LEGEND_ROW_HEIGHT * MATCH_DPI / 2
+        for other in rows:
+            dy = abs(other["v"] - row["v"]) * height
+            if other is not row and dy and abs(other["u"] - row["u"]) * width < LEGEND_SYMBOL_WIDTH * MATCH_DPI:
+                half = min(half, dy / 2)
+        # Symbols are centered on the label's middle, a little above its baseline
+        middle = y - 0.05 * MATCH_DPI
+        template = _cut_template(gray, int(x - LEGEND_SYMBOL_WIDTH * MATCH_DPI), int(middle - half),
+                                 int(x - 0.03 * MATCH_DPI), int(middle + half))
+        if template is not None:
+            templates.append({"device": row["device"], "label": row["label"], "image": template})
+    return templates
+
+
+def _same_symbol(a: Dict, b: Dict) -> bool:
+    """True for templates of the same device that are the same drawing (legends repeated across sheets)."""
+    if a["device"] != b["device"] or any(abs(m - n) > 2 for m, n in zip(a["image"].shape, b["image"].shape)):
+        return False
+    # Renders of the same symbol can be a pixel or two apart
+    padded = np.pad(b["image"], 2, constant_values=1.0)
+    return float(next(match_scores(padded, [a["image"]])).max()) >= SAME_SYMBOL_SCORE
+
+
+def build_legend_index(pdf_path: str, trade_config: dict) -> Dict:
+    """
+    Symbol templates from every legend in the set.
+
+    Returns {"templates": [{"device", "label", "page", "image"}],
+    "legend_pages": [...]}; images are float arrays (0 = black) at
+    MATCH_DPI. Legend pages themselves are never matched.
+    """
+    legends = read_legend_rows(pdf_path, trade_config)
+    templates = []
+    for first_page, last_page in plan_render_ranges(sorted(legends), 1):
+        for page_num, img in iter_pdf_pages(pdf_path, first_page, last_page, dpi=MATCH_DPI,
+                                            encode=lambda page: page.convert("L")):
+            if page_num in legends:
+                for template in _template_crops(img, legends[page_num]):
+                    if not any(_same_symbol(template, kept) for kept in templates):
+                        templates.append({**template, "page": page_num})
+    return {"templates": templates, "legend_pages": sorted(legends)}
+
+
+def missing_devices(index: Dict, device_keys: List[str]) -> List[str]:
+    """Trade devices the legend has no symbol for; the model counts those on every matched page."""
+    covered = {template["device"] for template in index["templates"]}
+    return [key for key in device_keys if key not in covered]
+
+
+def _symbol_box(symbol: Dict, margin: int = 0) -> Tuple[int, int, int, int]:
+    """(left, top, right, bottom) of a find_symbols match, whose x/y is the template's center."""
+    height, width = symbol["size"]
+    left, top = symbol["x"] - width // 2, symbol["y"] - height // 2
+    return left - margin, top - margin, left + width + margin, top + height + margin
+
+
+def _grid(cells: List[Tuple[str, Image.Image]], cell: int, top: int, sheet: Image.Image, font) -> int:
+    """Paste captioned cells in rows of MONTAGE_COLUMNS from y = top; returns the y below the last row."""
+    column_width = max([cell] + [int(font.getlength(caption)) for caption, _ in cells]) + MONTAGE_SCALE * 4
+    row_height = cell + CAPTION_SIZE + MONTAGE_SCALE * 4
+    draw = ImageDraw.Draw(sheet)
+    for idx, (caption, img) in enumerate(cells):
+        row, column = divmod(idx, MONTAGE_COLUMNS)
+        x, y = MONTAGE_SCALE * 4 + column * column_width, top + row * row_height
+        draw.text((x, y), caption, fill=0, font=font)
+        sheet.paste(img.resize((cell, cell), Image.LANCZOS), (x, y + CAPTION_SIZE + 2))
+        draw.rectangle([x - 1, y + CAPTION_SIZE + 1, x + cell, y + CAPTION_SIZE + 2 + cell], outline=128)
+    return top + -(-len(cells) // MONTAGE_COLUMNS) * row_height
+
+
+def _montage(page: np.ndarray, uncertain: List[Dict], certain: List[Dict], templates: List[Dict]) -> bytes:
+    """
+    One confirming model call's image: the legend's symbols, captioned with
+    their device key, above the uncertain matches in numbered cells.
+
+    Each cell is cut just around its symbol, and certain matches are blanked
+    out first, so nothing counted locally shows up in a cell.
+    """
+    masked = page.copy()
+    for symbol in certain:
+        left, top, right, bottom = _symbol_box(symbol)
+        masked[max(0, top):max(0, bottom), max(0, left):max(0, right)] = 1.0
+    page_img = Image.fromarray((masked * 255).astype(np.uint8))
+
+    side = max(max(t["image"].shape) for t in templates) + 2 * CELL_MARGIN
+    cell = side * MONTAGE_SCALE
+    legend = {}
+    for template in templates:
+        legend.setdefault(template["device"], Image.fromarray((template["image"] * 255).astype(np.uint8)))
+    candidates = []
+    for number, symbol in enumerate(uncertain, start=1):
+        left, top, right, bottom = _symbol_box(symbol, CELL_MARGIN)
+        # Square cells so every symbol is enlarged by the same factor
+        extra = side - (right - left), side - (bottom - top)
+        crop = page_img.crop((left - extra[0] // 2, top - extra[1] // 2,
+                              right + extra[0] - extra[0] // 2, bottom + extra[1] - extra[1] // 2))
+        candidates.append((str(number), crop))
+
+    font = ImageFont.load_default(size=CAPTION_SIZE)
+    row_height = cell + CAPTION_SIZE + MONTAGE_SCALE * 4
+    widest = max([cell] + [int(font.getlength(device)) for device in legend]) + MONTAGE_SCALE * 4
+    height = (2 + -(-len(legend) // MONTAGE_COLUMNS) + -(-len(candidates) // MONTAGE_COLUMNS)) * row_height
+    sheet = Image.new("L", (MONTAGE_COLUMNS * widest + MONTAGE_SCALE * 8, height), 255)
+    draw = ImageDraw.Draw(sheet)
+    draw.text((MONTAGE_SCALE * 4, MONTAGE_SCALE * 4), "LEGEND", fill=0, font=font)
+    below = _grid(list(legend.items()), cell, MONTAGE_SCALE * 4 + CAPTION_SIZE + 4, sheet, font)
+    draw.line([0, below + MONTAGE_SCALE * 2, sheet.width, below + MONTAGE_SCALE * 2], fill=0, width=2)
+    draw.text((MONTAGE_SCALE * 4, below + MONTAGE_SCALE * 4), "CANDIDATES", fill=0, font=font)
+    below = _grid(candidates, cell, below + MONTAGE_SCALE * 4 + CAPTION_SIZE + 4, sheet, font)
+    return encode_page_image(sheet.crop((0, 0, sheet.width, below)))
+
+
+def legend_takeoff(page: np.ndarray, index: Dict, device_keys: List[str]) -> Dict:
+    """
+    Count a page (float array at MATCH_DPI) against the legend index.
+
+    Returns {"result": page result, "confirm": {"image", "cells"} or None,
+    "uncovered": [...]}, where "confirm" is a grid of the uncertain matches
+    for the model to label on top of the certain ones, or {"fallback":
+    reason} if the model should analyze the whole page. Devices the legend
+    has no symbol for ("uncovered") could be anywhere on the page; they are
+    left at 0 for the model to count on the page image.
+    """
+    uncovered = missing_devices(index, device_keys)
+    symbols = find_symbols(page, index["templates"])
+    certain = [s for s in symbols if s["score"] >= MATCH_THRESHOLD and s["score"] - s["runner_up"] > CONFIRM_MARGIN]
+    uncertain = [s for s in symbols if s not in certain]
+    if not symbols:
+        return {"fallback": "no legend symbols found"}
+    if len(uncertain) > MAX_CONFIRMATIONS:
+        return {"fallback": f"{len(uncertain)} uncertain matches"}
+
+    devices = {key: 0 for key in device_keys}
+    labels = {}
+    for symbol in certain:
+        devices[symbol["device"]] += 1
+        labels[symbol["label"]] = labels.get(symbol["label"], 0) + 1
+    notes = ", ".join(f"{label} x{count}" for label, count in sorted(labels.items()))
+    if uncertain:
+        notes += f"; {len(uncertain)} uncertain matches confirmed by the model"
+    if uncovered:
+        notes += f"; not in the legend, counted by the model: {', '.join(uncovered)}"
+    return {
+        "result": {
+            "page_type": "floor plan",
+            "description": f"{len(certain)} symbols matched against the set's legend",
+            "devices": devices,
+            "notes": notes,
+            "metrics": {"outcome": "legend"},
+        },
+        "confirm": {"image": _montage(page, uncertain, certain, index["templates"]), "cells": len(uncertain)}
+        if uncertain else None,
+        "uncovered": uncovered,
+    }
+
+
+def legend_page_encode(img: Image.Image, index: Dict, device_keys: List[str], dpi: int, encode: Callable,
+                       match_metrics: Dict[int, Dict], page_num: int, pool: Optional[Executor] = None):
+    """
+    Pipeline encode step that matches a page rendered at dpi against the legend index.
+
+    The render is scaled down to MATCH_DPI and matched on the process pool
+    (see symbol_counter.match_encode), so the page is rendered only once.
+    Returns the legend takeoff (see legend_takeoff) in place of the page
+    image, with the encoded page as "image" if the model still has to
+    count its uncovered devices, or encode(img) if the page falls back to
+    the model. match_metrics[page_num] gets the matching time and throughput.
+    """
+    takeoff = match_encode(img, dpi, partial(legend_takeoff, index=index, device_keys=device_keys), pool)
+    match_metrics[page_num] = {field: takeoff.pop(field) for field in ("match_ms", "match_mpx_per_s")}
+    if "fallback" in takeoff:
+        return encode(img)
+    takeoff["result"]["metrics"].update(match_metrics[page_num])
+    if takeoff["uncovered"]:
+        takeoff["image"] = encode(img)
+    return takeoff
+
+
+def confirm_legend_matches(local: Dict, confirmation: Dict) -> Dict:
+    """Add the model's count of the uncertain matches to the certain ones."""
+    if "error" in confirmation:
+        return confirmation
+    devices = {key: count + confirmation.get("devices", {}).get(key, 0) for key, count in local["devices"].items()}
+    metrics = {**confirmation.get("metrics", {}), "match_ms": local["metrics"].get("match_ms"),
+               "match_mpx_per_s": local["metrics"].get("match_mpx_per_s")}
+    return {**confirmation, **{k: v for k, v in local.items() if k not in ("devices", "metrics")},
+            "devices": devices, "metrics": metrics}
+
+
+def add_model_counts(local: Dict, analysis: Dict, uncovered: List[str]) -> Dict:
+    """
+    Take the devices the legend has no symbol for from the model's analysis
+    of the page; the legend's counts stand for the rest. "legend" records
+    those counts, so a tiled re-count of the page keeps them.
+    """
+    if "error" in analysis:
+        return {**analysis, "usage": add_usage(dict(local.get("usage", {})), analysis.get("usage", {}))}
+    counted = {key: count for key, count in local["devices"].items() if key not in uncovered}
+    devices = {**analysis["devices"], **counted}
+    result = {
+        **analysis,
+        "devices": devices,
+        "notes": " | ".join(filter(None, [local.get("notes", ""), analysis.get("notes", "")])),
+        "legend": {"devices": counted},
+        "usage": add_usage(dict(local.get("usage", {})), analysis.get("usage", {})),
+        "retries": local.get("retries", 0) + analysis.get("retries", 0),
+        "reasks": local.get("reasks", 0) + analysis.get("reasks", 0),
+        "metrics": {**analysis.get("metrics", {}), **merge_metrics([local["metrics"], analysis.get("metrics", {})]),
+                    "match_ms": local["metrics"].get("match_ms"),
+                    "match_mpx_per_s": local["metrics"].get("match_mpx_per_s")},
+    }
+    if "ensemble" in analysis:
+        # Samples disagreeing on a device the legend counted don't need a re-count
+        flagged = [key for key in analysis["ensemble"].get("flagged", []) if key in uncovered]
+        result["ensemble"] = {**analysis["ensemble"], "flagged": flagged}
+    return result
@@ -0,0 +1,67 @@
+"""
+BidSync AI - Page Metrics
+Per-page timings and token counts, to see where a run spends its time
+"""
+
+import time
+from typing import Dict, List
+
+METRIC_FIELDS = [
+    "page", "outcome", "vector_ms", "match_ms", "match_mpx_per_s", "render_ms", "encode_ms", "image_bytes",
+    "samples", "base64_ms", "model_ms", "retries", "requeues", "reasks", "input_tokens", "output_tokens",
+    "cache_read_input_tokens", "cache_creation_input_tokens",
+]
+TIMING_FIELDS = ["vector_ms", "match_ms", "render_ms", "encode_ms", "base64_ms", "model_ms"]
+# Outcomes of a page, worst first, so merged tiles report the worst one
+OUTCOMES = ["error", "malformed", "reasked", "ok", "cached", "carried", "vector", "legend"]
+
+
+def elapsed_ms(started: float) -> float:
+    """Milliseconds since a time.perf_counter() reading."""
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def merge_metrics(metrics_list: List[Dict]) -> Dict:
+    """Combine the metrics of several model calls (e.g. tiles) into one."""
+    merged = {"outcome": min((m.get("outcome", "ok") for m in metrics_list), key=OUTCOMES.index, default="ok")}
+    for field in ("base64_ms", "model_ms"):
+        merged[field] = round(sum(m.get(field, 0) for m in metrics_list), 1)
+    return merged
+
+
+def page_metrics(page_num: int, result: Dict) -> Dict:
+    """One metrics row for a page result; fields that were not measured are None."""
+    metrics = result.get("metrics", {})
+    usage = result.get("usage", {})
+    row = {field: None for field in METRIC_FIELDS}
+    row.update({
+        "page": page_num,
+        "outcome": metrics.get("outcome") or ("error" if "error" in result else "ok"),
+        "retries": result.get("retries", 0),
+        "reasks": result.get("reasks", 0),
+        **{field: usage.get(field, 0) for field in METRIC_FIELDS if field.endswith("_tokens")},
+        **{field: value for field, value in metrics.items() if field in row and field != "outcome"},
+    })
+    return row
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize_metrics(rows: List[Dict]) -> Dict:
+    """Total, p50 and p95 of every timing, over the pages where it was measured."""
+    summary = {"pages": len(rows)}
+    for field in TIMING_FIELDS:
+        values = [row[field] for row in rows if row.get(field) is not None]
+        if values:
+            summary[field] = {
+                "total": round(sum(values), 1),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+            }
+    return summary
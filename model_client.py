@@ -0,0 +1,277 @@
+"""
+BidSync AI - Async Model Client
+Rate-limited asyncio wrapper around the Anthropic API with retry and backoff
+"""
+
+import asyncio
+import inspect
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import anthropic
+
+DEFAULT_REQUEST_TIMEOUT = 120.0
+DEFAULT_MAX_ATTEMPTS = 6
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+GATE_POLL_INTERVAL = 0.05
+
+# Until the first response reports the org's real limits
+DEFAULT_REQUESTS_PER_MINUTE = 50
+# Rough input-token cost of one page: a full-size image plus the trade prompt
+DEFAULT_TOKENS_PER_REQUEST = 3000
+
+# 408 timeout, 409 conflict, 429 rate limited, 5xx incl. 529 overloaded
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+# Errors sent as an SSE event mid-stream arrive with the stream's 200 status
+RETRYABLE_ERROR_TYPES = {"overloaded_error", "rate_limit_error", "api_error"}
+
+
+class TransientAPIError(Exception):
+    """Raised when a request kept failing with retryable errors."""
+
+
+class TokenBucket:
+    """Classic token bucket; capacity None means the limit is unknown (unlimited)."""
+
+    def __init__(self, capacity: Optional[float], refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity or 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.capacity is None:
+            return
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated = now
+
+    def delay_for(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available."""
+        if self.capacity is None:
+            return 0.0
+        self._refill(now)
+        # A single request larger than the bucket still has to go through eventually
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def take(self, amount: float):
+        if self.capacity is not None:
+            self.tokens -= amount
+
+    def sync(self, limit: Optional[int], remaining: Optional[int]):
+        """Adopt the server's view of this limit from response headers."""
+        now = time.monotonic()
+        if limit:
+            self._refill(now)
+            if self.capacity is None:
+                self.tokens = float(limit)
+            self.capacity = float(limit)
+            # Anthropic limits are per minute and replenish continuously
+            self.refill_per_second = limit / 60.0
+        if remaining is not None and self.capacity is not None:
+            self._refill(now)
+            self.tokens = min(self.tokens, float(remaining))
+
+
+def _header_int(headers, name: str) -> Optional[int]:
+    value = headers.get(name) if headers is not None else None
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    """Request and input-token buckets driven by anthropic-ratelimit-* response headers."""
+
+    def __init__(self, requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.input_tokens = TokenBucket(None, 0.0)
+        self.blocked_until = 0.0
+
+    async def acquire(self, estimated_tokens: int = DEFAULT_TOKENS_PER_REQUEST):
+        """Wait until a request of roughly this many input tokens may be sent."""
+        while True:
+            now = time.monotonic()
+            wait = max(
+                self.blocked_until - now,
+                self.requests.delay_for(1, now),
+                self.input_tokens.delay_for(estimated_tokens, now),
+            )
+            if wait <= 0:
+                self.requests.take(1)
+                self.input_tokens.take(estimated_tokens)
+                return
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """Correct the token bucket once the real input token count is known."""
+        self.input_tokens.take(actual_tokens - estimated_tokens)
+
+    def update_from_headers(self, headers):
+        if headers is None:
+            return
+        self.requests.sync(
+            _header_int(headers, "anthropic-ratelimit-requests-limit"),
+            _header_int(headers, "anthropic-ratelimit-requests-remaining"),
+        )
+        self.input_tokens.sync(
+            _header_int(headers, "anthropic-ratelimit-input-tokens-limit"),
+            _header_int(headers, "anthropic-ratelimit-input-tokens-remaining"),
+        )
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            try:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + float(retry_after))
+            except ValueError:
+                pass
+
+
+def _usage_dict(usage) -> Dict:
+    """Token counters present on a usage object, skipping fields the event left unset."""
+    if usage is None:
+        return {}
+    fields = usage.model_dump() if hasattr(usage, "model_dump") else dict(usage)
+    return {name: value for name, value in fields.items() if isinstance(value, int)}
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (anthropic.APITimeoutError, anthropic.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        if error.status_code in RETRYABLE_STATUS_CODES:
+            return True
+        body = error.body if isinstance(error.body, dict) else {}
+        details = body.get("error") if isinstance(body.get("error"), dict) else {}
+        return details.get("type") in RETRYABLE_ERROR_TYPES
+    return False
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+
+
+class AsyncModelClient:
+    """Shares one rate limiter across every concurrent request of a job."""
+
+    def __init__(self, api_key: str, request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, limiter: Optional[RateLimiter] = None,
+                 call_gate=None, **client_kwargs):
+        # Retries are handled here so they go through the rate limiter
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=0, **client_kwargs)
+        self.request_timeout = request_timeout
+        self.max_attempts = max_attempts
+        self.limiter = limiter or RateLimiter()
+        # Optional semaphore (e.g. multiprocessing.Semaphore) capping calls across processes
+        self.call_gate = call_gate
+
+    async def _acquire_gate(self):
+        # Poll rather than block so the event loop keeps serving other requests
+        while not self.call_gate.acquire(block=False):
+            await asyncio.sleep(GATE_POLL_INTERVAL)
+
+    async def _with_retries(self, estimated_tokens: int, send: Callable[[], Awaitable[Tuple[object, Optional[int]]]]) -> Tuple[object, Dict]:
+        """
+        Run send() under the rate limiter, retrying transient failures.
+
+        send returns (response, input_tokens). Raises TransientAPIError if
+        every attempt hit a retryable error, or the original exception for
+        anything that retrying cannot fix.
+        """
+        last_error = None
+        for attempt in range(self.max_attempts):
+            await self.limiter.acquire(estimated_tokens)
+            if self.call_gate is not None:
+                await self._acquire_gate()
+            try:
+                response, input_tokens = await send()
+                if input_tokens is not None:
+                    self.limiter.settle(estimated_tokens, input_tokens)
+                return response, {"retries": attempt}
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                last_error = e
+                response = getattr(e, "response", None)
+                self.limiter.update_from_headers(getattr(response, "headers", None))
+            finally:
+                if self.call_gate is not None:
+                    self.call_gate.release()
+            await asyncio.sleep(backoff_delay(attempt))
+
+        raise TransientAPIError(f"Gave up after {self.max_attempts} attempts: {last_error}")
+
+    async def _parse(self, raw):
+        self.limiter.update_from_headers(raw.headers)
+        parsed = raw.parse()
+        if inspect.isawaitable(parsed):
+            parsed = await parsed
+        return parsed
+
+    async def create_message(self, estimated_tokens: int = DEFAULT_TOKENS_PER_REQUEST, **kwargs) -> Tuple[object, Dict]:
+        """
+        Send a messages.create request, retrying transient failures.
+
+        Returns (message, info) where info has the number of retries used.
+        """
+        async def send():
+            raw = await asyncio.wait_for(
+                self.client.messages.with_raw_response.create(timeout=self.request_timeout, **kwargs),
+                timeout=self.request_timeout + 5,
+            )
+            message = await self._parse(raw)
+            usage = getattr(message, "usage", None)
+            return message, getattr(usage, "input_tokens", None) if usage is not None else None
+
+        return await self._with_retries(estimated_tokens, send)
+
+    async def stream_tool_call(self, estimated_tokens: int = DEFAULT_TOKENS_PER_REQUEST, **kwargs) -> Tuple[Dict, Dict]:
+        """
+        Stream a request that is forced to call a tool and collect the tool input.
+
+        Reading stops at the message_delta event that follows the tool
+        block, so nothing after the completed object is waited for. Returns
+        (call, info) where call has the tool_use "id" and "name", the raw
+        "input_json" text, any "text", the "stop_reason" and the "usage".
+        """
+        async def read_stream(stream, call: Dict):
+            async for event in stream:
+                if event.type == "message_start":
+                    call["usage"].update(_usage_dict(event.message.usage))
+                elif event.type == "content_block_start" and event.content_block.type == "tool_use":
+                    call["id"] = event.content_block.id
+                    call["name"] = event.content_block.name
+                elif event.type == "content_block_delta":
+                    if event.delta.type == "input_json_delta":
+                        call["input_json"] += event.delta.partial_json
+                    elif event.delta.type == "text_delta":
+                        call["text"] += event.delta.text
+                elif event.type == "message_delta":
+                    call["stop_reason"] = event.delta.stop_reason
+                    call["usage"].update(_usage_dict(event.usage))
+                    break
+
+        async def send():
+            raw = await asyncio.wait_for(
+                self.client.messages.with_raw_response.create(stream=True, timeout=self.request_timeout, **kwargs),
+                timeout=self.request_timeout + 5,
+            )
+            stream = await self._parse(raw)
+            call = {"id": None, "name": None, "input_json": "", "text": "", "stop_reason": None, "usage": {}}
+            try:
+                await asyncio.wait_for(read_stream(stream, call), timeout=self.request_timeout)
+            finally:
+                await stream.close()
+            return call, call["usage"].get("input_tokens")
+
+        return await self._with_retries(estimated_tokens, send)
+
+    async def close(self):
+        await self.client.close()
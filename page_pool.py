@@ -0,0 +1,48 @@
+"""
+BidSync AI - Page Pools
+Spreads per-page CPU work (text layers, vector takeoffs, symbol matching)
+over a capped pool of spawned processes
+"""
+
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Below this many pages the process pool costs more than it saves
+MIN_PAGES_FOR_POOL = 8
+# Processes per pool by default. Every PDF analyzed at the same time (CLI
+# --parallel-files, app sessions) starts its own pools, so one pool never
+# takes every core
+MAX_POOL_WORKERS = 4
+
+
+def pool_workers(workers: Optional[int] = None) -> int:
+    """The given pool size, or the default: one process per core, up to MAX_POOL_WORKERS."""
+    return max(1, workers or min(os.cpu_count() or 1, MAX_POOL_WORKERS))
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """A process pool started with spawn, not fork: the app and the CLI's parallel files run threads."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+
+
+def map_page_chunks(read_pages: Callable[..., Dict[int, Dict]], pdf_path: str, pages: List[int], *args,
+                    workers: Optional[int] = None) -> Dict[int, Dict]:
+    """
+    read_pages(pdf_path, pages, *args) -> {page_num: ...} over every page,
+    split into one chunk per process for large sets. read_pages and args
+    must be picklable (module-level functions and plain data).
+    """
+    workers = pool_workers(workers)
+    if workers == 1 or len(pages) < MIN_PAGES_FOR_POOL:
+        return read_pages(pdf_path, pages, *args)
+
+    chunk_size = -(-len(pages) // workers)
+    chunks = [pages[i:i + chunk_size] for i in range(0, len(pages), chunk_size)]
+    results = {}
+    with process_pool(workers) as pool:
+        for chunk_results in pool.map(read_pages, [pdf_path] * len(chunks), chunks,
+                                      *[[arg] * len(chunks) for arg in args]):
+            results.update(chunk_results)
+    return results
@@ -0,0 +1,291 @@
+"""
+BidSync AI - PDF Rasterizer
+Renders a page range of a blueprint set with a single poppler process
+"""
+
+import io
+import os
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from PIL import Image, ImageChops, ImageOps
+
+DEFAULT_DPI = 150
+# pdftoppm options per render profile. Drawings are line art, so the gray
+# and mono profiles skip the color planes (a third and a 24th of the raw
+# RGB page) and crop the blank paper outside the sheet border
+RENDER_PROFILES = {
+    "color": {"args": [], "crop": False},
+    "gray": {"args": ["-gray"], "crop": True},
+    "mono": {"args": ["-mono"], "crop": True},
+}
+DEFAULT_RENDER_PROFILE = "color"
+# Pixels darker than this count as ink when cropping; the crop keeps a
+# margin of CROP_PADDING_INCHES around the outermost ink (the sheet border)
+CROP_INK_LEVEL = 192
+CROP_PADDING_INCHES = 0.1
+# The API scales images down to a 1568 px long edge and about 1,600 image
+# tokens (width * height / 750) before the model sees them, so anything
+# larger only costs upload bytes
+MAX_DIMENSION = 1568
+MAX_IMAGE_TOKENS = 1600
+PIXELS_PER_TOKEN = 750
+JPEG_QUALITY = 75
+# Pages are treated as color if this share of pixels has channels this far apart
+COLOR_MIN_SPREAD = 40
+COLOR_MIN_FRACTION = 0.002
+# Line art: nearly all pixels close to white or black. It is sent as 16-level
+# grayscale PNG when that is smaller than JPEG, which blurs thin lines
+LINE_ART_MIN_FRACTION = 0.9
+LINE_ART_DARK = 48
+LINE_ART_LIGHT = 208
+PNG_GRAY_LEVELS = 16
+# Leading bytes of every image format the API accepts
+MEDIA_TYPE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+# pdftoppm names its output <prefix>-<page>.<ext>, zero-padding the page number
+PAGE_FILE_PATTERN = re.compile(r"^page-(\d+)\.(?:ppm|pgm|pbm|png|jpg|tif)$")
+POLL_INTERVAL = 0.02
+# Raw E-size pages are >100 MB each, so poppler is paused while this many
+# rendered pages are waiting to be consumed
+MAX_PENDING_PAGES = 3
+
+
+def image_media_type(image_data: bytes) -> str:
+    """Media type of encoded image bytes, from their signature."""
+    for signature, media_type in MEDIA_TYPE_SIGNATURES:
+        if image_data.startswith(signature):
+            return media_type
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        return "image/webp"
+    raise ValueError("Unsupported image format; use PNG, JPEG, GIF or WebP")
+
+
+def model_size(width: int, height: int) -> Tuple[int, int]:
+    """The largest size within the API's limits, keeping the aspect ratio."""
+    scale = min(1.0, MAX_DIMENSION / max(width, height),
+                (MAX_IMAGE_TOKENS * PIXELS_PER_TOKEN / (width * height)) ** 0.5)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Image tokens the model is billed for, after the API's own downscaling."""
+    width, height = model_size(width, height)
+    return -(-width * height // PIXELS_PER_TOKEN)
+
+
+def is_color(img: Image.Image) -> bool:
+    """True if the page has real color, e.g. red revision clouds, rather than gray line work."""
+    if img.mode in ('1', 'L', 'LA', 'I', 'F'):
+        return False
+    rgb = img.convert('RGB')
+    thumb = rgb.reduce(max(1, max(rgb.size) // 512))
+    red, green, blue = thumb.split()
+    spread = ImageChops.lighter(
+        ImageChops.lighter(ImageChops.difference(red, green), ImageChops.difference(green, blue)),
+        ImageChops.difference(red, blue)
+    )
+    histogram = spread.histogram()
+    return sum(histogram[COLOR_MIN_SPREAD:]) > COLOR_MIN_FRACTION * sum(histogram)
+
+
+def is_line_art(gray: Image.Image) -> bool:
+    histogram = gray.histogram()
+    extremes = sum(histogram[:LINE_ART_DARK]) + sum(histogram[LINE_ART_LIGHT:])
+    return extremes >= LINE_ART_MIN_FRACTION * sum(histogram)
+
+
+def _encode_jpeg(img: Image.Image) -> bytes:
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    return img_byte_arr.getvalue()
+
+
+def _encode_gray_png(gray: Image.Image) -> bytes:
+    """4-bit grayscale PNG: 16 evenly spaced levels, enough for anti-aliased line work."""
+    step = 256 // PNG_GRAY_LEVELS
+    indexed = Image.frombytes('P', gray.size, gray.point(lambda v: v // step).tobytes())
+    indexed.putpalette([min(255, level * 255 // (PNG_GRAY_LEVELS - 1)) for level in range(PNG_GRAY_LEVELS)
+                        for _ in range(3)])
+    img_byte_arr = io.BytesIO()
+    indexed.save(img_byte_arr, format='PNG', optimize=True, bits=4)
+    return img_byte_arr.getvalue()
+
+
+def encode_page_image(img: Image.Image) -> bytes:
+    """
+    Encode a rendered page for the model in as few bytes as legibly possible.
+
+    The page is scaled to the largest size the API passes through
+    unchanged. Gray pages become single-channel; line art is sent as 4-bit
+    grayscale PNG if that beats JPEG, and color pages stay RGB JPEG. Use
+    image_media_type() for the matching media type.
+    """
+    # Drop to one channel before resizing; it is the most expensive step
+    img = img.convert('RGB' if is_color(img) else 'L')
+    size = model_size(*img.size)
+    if size != img.size:
+        img = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+    jpeg = _encode_jpeg(img)
+    if img.mode == 'L' and is_line_art(img):
+        png = _encode_gray_png(img)
+        if len(png) < len(jpeg):
+            return png
+    return jpeg
+
+
+def encode_image_file(image_data: bytes) -> bytes:
+    """Re-encode an uploaded image (any format Pillow reads) the same way as a rendered page."""
+    with Image.open(io.BytesIO(image_data)) as img:
+        return encode_page_image(ImageOps.exif_transpose(img))
+
+
+def crop_to_content(img: Image.Image, dpi: int = DEFAULT_DPI) -> Image.Image:
+    """Cut the blank paper around the drawing; the border and title block stay."""
+    gray = img if img.mode == 'L' else img.convert('L')
+    box = gray.point(lambda v: 255 if v < CROP_INK_LEVEL else 0).getbbox()
+    if box is None:
+        return img
+    padding = int(CROP_PADDING_INCHES * dpi)
+    left, top, right, bottom = box
+    box = (max(0, left - padding), max(0, top - padding),
+           min(img.width, right + padding), min(img.height, bottom + padding))
+    return img if box == (0, 0, img.width, img.height) else img.crop(box)
+
+
+def _scan_rendered_pages(output_dir: str) -> Dict[int, str]:
+    """Map page number -> file path for every page poppler has written so far."""
+    rendered = {}
+    for entry in os.scandir(output_dir):
+        match = PAGE_FILE_PATTERN.match(entry.name)
+        if match:
+            rendered[int(match.group(1))] = entry.path
+    return rendered
+
+
+def _throttle_renderer(process: subprocess.Popen, output_dir: str, stop: threading.Event):
+    """Pause poppler while the consumer is behind so rendered pages don't pile up on disk."""
+    paused = False
+    while not stop.is_set() and process.poll() is None:
+        pending = sum(1 for name in os.listdir(output_dir) if PAGE_FILE_PATTERN.match(name))
+        if not paused and pending > MAX_PENDING_PAGES:
+            process.send_signal(signal.SIGSTOP)
+            paused = True
+        elif paused and pending <= MAX_PENDING_PAGES:
+            process.send_signal(signal.SIGCONT)
+            paused = False
+        time.sleep(POLL_INTERVAL)
+    if paused and process.poll() is None:
+        process.send_signal(signal.SIGCONT)
+
+
+def iter_pdf_pages(pdf_path: str, first_page: int, last_page: int,
+                   dpi: int = DEFAULT_DPI,
+                   encode: Callable[[Image.Image], Any] = encode_page_image,
+                   timings: Optional[Dict[int, Dict]] = None,
+                   profile: str = DEFAULT_RENDER_PROFILE,
+                   encode_overrides: Optional[Dict[int, Callable[[Image.Image], Any]]] = None
+                   ) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield (page_num, encode(image)) for every page in [first_page, last_page].
+
+    The document is opened and parsed once by a single pdftoppm process that
+    renders the whole range; pages are handed out as soon as poppler moves on
+    to the next one, so analysis can start before the range is finished.
+    By default pages come out as model-ready image bytes.
+
+    profile is one of RENDER_PROFILES: "color" renders RGB, "gray" and
+    "mono" have poppler render 8-bit or 1-bit pages and crop them to the
+    drawing before encode sees them. Pages in encode_overrides are passed
+    to their own encode function instead.
+
+    If given, timings[page_num] is set to the page's render_ms (time since
+    poppler finished the previous page, or started, going by file
+    modification times) and encode_ms.
+    """
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile {profile!r}; choose from {', '.join(RENDER_PROFILES)}")
+    render_profile = RENDER_PROFILES[profile]
+    output_dir = tempfile.mkdtemp(prefix="bidsync_render_")
+    stderr_file = tempfile.TemporaryFile()
+    last_written = time.time()
+    process = subprocess.Popen(
+        [
+            "pdftoppm",
+            "-r", str(dpi),
+            *render_profile["args"],
+            "-f", str(first_page),
+            "-l", str(last_page),
+            pdf_path,
+            os.path.join(output_dir, "page"),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=stderr_file,
+    )
+
+    stop_throttle = threading.Event()
+    throttle = None
+    if hasattr(signal, 'SIGSTOP'):
+        throttle = threading.Thread(
+            target=_throttle_renderer,
+            args=(process, output_dir, stop_throttle),
+            daemon=True,
+        )
+        throttle.start()
+
+    try:
+        while True:
+            finished = process.poll() is not None
+            rendered = _scan_rendered_pages(output_dir)
+
+            # poppler renders pages in order, so a page is complete once the
+            # next one has started (or the process has exited)
+            newest = max(rendered) if rendered else None
+            for page_num in sorted(rendered):
+                if not finished and page_num == newest:
+                    break
+                path = rendered[page_num]
+                written = os.path.getmtime(path)
+                encode_started = time.perf_counter()
+                page_encode = (encode_overrides or {}).get(page_num, encode)
+                with Image.open(path) as img:
+                    encoded = page_encode(crop_to_content(img, dpi) if render_profile["crop"] else img)
+                if timings is not None:
+                    timings[page_num] = {
+                        "render_ms": round(max(0.0, written - last_written) * 1000, 1),
+                        "encode_ms": round((time.perf_counter() - encode_started) * 1000, 1),
+                    }
+                last_written = max(last_written, written)
+                os.remove(path)
+                yield page_num, encoded
+
+            if finished and not rendered:
+                break
+            if not finished:
+                time.sleep(POLL_INTERVAL)
+
+        if process.returncode != 0:
+            stderr_file.seek(0)
+            message = stderr_file.read().decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"pdftoppm exited with {process.returncode}: {message[-500:]}")
+    finally:
+        stop_throttle.set()
+        if throttle is not None:
+            throttle.join()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        stderr_file.close()
+        shutil.rmtree(output_dir, ignore_errors=True)
@@ -0,0 +1,231 @@
+"""
+BidSync AI - Page Pipeline
+Overlaps PDF rendering with a bounded pool of in-flight model calls
+"""
+
+import asyncio
+import contextlib
+import inspect
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pdf_render import DEFAULT_DPI, DEFAULT_RENDER_PROFILE, encode_page_image, iter_pdf_pages
+
+DEFAULT_RENDER_WORKERS = 2
+DEFAULT_MAX_IN_FLIGHT = 4
+MAX_IN_FLIGHT_LIMIT = 16
+# Rendering a few unwanted pages is cheaper than starting another poppler
+# process that re-parses the whole document
+MAX_RENDER_GAP = 3
+# Pages whose analysis still fails with a transient error go to the back of
+# the queue and are retried after a growing cool-down
+MAX_REQUEUES = 2
+REQUEUE_DELAY = 30.0
+
+
+def plan_render_ranges(pages: List[int], render_workers: int) -> List[Tuple[int, int]]:
+    """
+    Group the pages into (first, last) ranges, roughly one per render worker.
+
+    Ranges bridge gaps of up to MAX_RENDER_GAP unwanted pages; the renderer
+    drops those pages instead of spawning a new poppler process.
+    """
+    pages = sorted(set(pages))
+    if not pages:
+        return []
+
+    chunk_size = -(-len(pages) // max(1, render_workers))
+    ranges = []
+    run_start = prev = pages[0]
+    run_length = 1
+    for page_num in pages[1:]:
+        if page_num - prev - 1 > MAX_RENDER_GAP or run_length == chunk_size:
+            ranges.append((run_start, prev))
+            run_start = page_num
+            run_length = 0
+        prev = page_num
+        run_length += 1
+    ranges.append((run_start, prev))
+    return ranges
+
+
+def _image_bytes(image_data) -> int:
+    """
+    Size of what was sent for a page: image bytes, the sum over its tiles or
+    samples, or a legend match's confirmation image plus the page image sent
+    for devices the legend lacks.
+    """
+    if isinstance(image_data, (bytes, bytearray)):
+        return len(image_data)
+    if isinstance(image_data, dict):
+        sent = len(image_data["confirm"]["image"]) if image_data.get("confirm") else 0
+        return sent + (_image_bytes(image_data["image"]) if "image" in image_data else 0)
+    return sum(len(tile["image"]) for tile in image_data)
+
+
+def _start_event_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+
+    def run():
+        loop.run_forever()
+        loop.close()
+
+    threading.Thread(target=run, name="bidsync-analyze-loop", daemon=True).start()
+    return loop
+
+
+def _stop_event_loop(loop: asyncio.AbstractEventLoop, cleanup: Optional[Callable[[], Awaitable]]):
+    """Cancel whatever is still in flight, run cleanup, then stop the loop without blocking."""
+    async def drain():
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if cleanup is not None:
+            await cleanup()
+
+    future = asyncio.run_coroutine_threadsafe(drain(), loop)
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(loop.stop))
+
+
+def run_page_pipeline(pdf_path: str, pages: List[int],
+                      analyze_page: Callable[[int, bytes], Dict],
+                      max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                      render_workers: int = DEFAULT_RENDER_WORKERS,
+                      max_requeues: int = MAX_REQUEUES,
+                      cleanup: Optional[Callable[[], Awaitable]] = None,
+                      dpi: int = DEFAULT_DPI,
+                      encode: Callable = encode_page_image,
+                      render_profile: str = DEFAULT_RENDER_PROFILE,
+                      encode_overrides: Optional[Dict[int, Callable]] = None) -> Iterator[Tuple[int, Dict]]:
+    """
+    Yield (page_num, result) for every page as soon as its analysis completes.
+
+    Each render worker drives its own poppler process over a contiguous range,
+    and every rendered page is handed to at most `max_in_flight` concurrent
+    analyze_page calls. Rendering blocks while all analysis slots are busy,
+    so memory stays bounded however far poppler could run ahead. Results
+    arrive in completion order; callers sort by page if they need to.
+
+    analyze_page may be a plain function (run on a thread pool) or a
+    coroutine function (run on a dedicated event loop, with `cleanup`
+    awaited there when the pipeline finishes). Results marked "retryable"
+    are requeued up to `max_requeues` times before being reported.
+    Pages are rendered at `dpi` with `render_profile` and passed through
+    `encode` (or their entry in `encode_overrides`) before analysis.
+    Each result gets "metrics" with the page's render and encode times, its
+    image size and how often it was requeued, on top of any metrics the
+    analysis returned.
+    """
+    pages = sorted(set(pages))
+    wanted = set(pages)
+    results = queue.Queue()
+    retry_queue = queue.Queue()
+    slots = threading.BoundedSemaphore(max_in_flight)
+    cancelled = threading.Event()
+    render_timings = {}
+    # Threads, not processes: the rasterizing already runs in each worker's
+    # pdftoppm subprocess, and the rendered pages stay in this process
+    # without being pickled across
+    render_pool = ThreadPoolExecutor(max_workers=max(1, render_workers), thread_name_prefix="bidsync-render")
+
+    if inspect.iscoroutinefunction(analyze_page):
+        loop = _start_event_loop()
+        analysis_pool = None
+
+        def submit(page_num: int, image_data: bytes):
+            return asyncio.run_coroutine_threadsafe(analyze_page(page_num, image_data), loop)
+    else:
+        loop = None
+        analysis_pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="bidsync-analyze")
+
+        def submit(page_num: int, image_data: bytes):
+            return analysis_pool.submit(analyze_page, page_num, image_data)
+
+    def acquire_slot() -> bool:
+        while not slots.acquire(timeout=0.1):
+            if cancelled.is_set():
+                return False
+        if cancelled.is_set():
+            slots.release()
+            return False
+        return True
+
+    def finish_page(page_num: int, image_data: bytes, attempt: int, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"error": str(e)}
+        slots.release()
+        if result.get("retryable") and attempt < max_requeues and not cancelled.is_set():
+            retry_at = time.monotonic() + REQUEUE_DELAY * (attempt + 1)
+            retry_queue.put((retry_at, page_num, image_data, attempt + 1))
+            return
+        metrics = {
+            **render_timings.get(page_num, {}),
+            "image_bytes": _image_bytes(image_data),
+            "requeues": attempt,
+            **result.get("metrics", {}),
+        }
+        results.put((page_num, {**result, "metrics": metrics}))
+
+    def dispatch(page_num: int, image_data: bytes, attempt: int = 0):
+        future = submit(page_num, image_data)
+        future.add_done_callback(lambda f: finish_page(page_num, image_data, attempt, f))
+
+    def retry_pages():
+        while not cancelled.is_set():
+            try:
+                retry_at, page_num, image_data, attempt = retry_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            while time.monotonic() < retry_at:
+                if cancelled.wait(0.1):
+                    return
+            if not acquire_slot():
+                return
+            dispatch(page_num, image_data, attempt)
+
+    def render_range(first_page: int, last_page: int):
+        rendered = set()
+        try:
+            page_images = iter_pdf_pages(pdf_path, first_page, last_page, dpi, encode, timings=render_timings,
+                                         profile=render_profile, encode_overrides=encode_overrides)
+            with contextlib.closing(page_images):
+                for page_num, image_data in page_images:
+                    if page_num not in wanted:
+                        continue
+                    if not acquire_slot():
+                        return
+                    rendered.add(page_num)
+                    dispatch(page_num, image_data)
+        except Exception as e:
+            if cancelled.is_set():
+                return
+            for page_num in range(first_page, last_page + 1):
+                if page_num in wanted and page_num not in rendered:
+                    results.put((page_num, {"error": f"Could not render page: {e}"}))
+            return
+
+        # Pages poppler silently skipped still need to be accounted for
+        for page_num in range(first_page, last_page + 1):
+            if page_num in wanted and page_num not in rendered:
+                results.put((page_num, {"error": "Page was not rendered"}))
+
+    threading.Thread(target=retry_pages, name="bidsync-retry", daemon=True).start()
+    for first_page, last_page in plan_render_ranges(pages, render_workers):
+        render_pool.submit(render_range, first_page, last_page)
+
+    try:
+        for _ in pages:
+            yield results.get()
+    finally:
+        cancelled.set()
+        render_pool.shutdown(wait=False, cancel_futures=True)
+        if analysis_pool is not None:
+            analysis_pool.shutdown(wait=False, cancel_futures=True)
+        if loop is not None:
+            _stop_event_loop(loop, cleanup)
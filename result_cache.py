@@ -0,0 +1,112 @@
+"""
+BidSync AI - Analysis Result Cache
+Content-addressed, size-bounded on-disk cache of per-page analysis results
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Optional
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "BIDSYNC_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "bidsync", "analysis")
+)
+DEFAULT_MAX_BYTES = int(os.environ.get("BIDSYNC_CACHE_MAX_MB", "100")) * 1024 * 1024
+# Evict down to this fraction of the limit so we don't evict on every write
+EVICT_TARGET = 0.9
+
+
+def cache_key(image_data: bytes, trade_key: str, prompt_focus: str, model: str) -> str:
+    """Hash everything that can change a page's analysis result."""
+    digest = hashlib.sha256()
+    for part in (image_data, trade_key.encode('utf-8'), prompt_focus.encode('utf-8'), model.encode('utf-8')):
+        # Length-prefix each part so different splits can't collide
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """LRU cache of analysis results stored as one JSON file per key."""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(os.path.getsize(path) for path in self._entries())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    yield os.path.join(root, name)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached result for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                result = json.load(f)
+            # Bump mtime so eviction treats this entry as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, key: str, result: Dict):
+        """Store a result, evicting least recently used entries if over the size limit."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps(result).encode('utf-8')
+
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += len(payload) - previous_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TARGET
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total_bytes = total
+
+    def stats(self) -> Dict:
+        """Hit/miss counts for this cache instance."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
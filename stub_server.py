@@ -0,0 +1,479 @@
+"""
+BidSync AI - Stub Anthropic Server
+Local stand-in for the Messages and Message Batches APIs so the pipeline can
+be exercised offline. Counts are deterministic per image, latency and error
+rates are configurable.
+
+Usage:
+    python stub_server.py --port 8765 --latency 0.5 --error-rate 0.05
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ...
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+DEVICES_PATTERN = re.compile(r'"devices":\s*(\{[^{}]*\})')
+CELLS_PATTERN = re.compile(r"\b(\d+) numbered cells\b")
+MAX_FAKE_COUNT = 6
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _request_texts(params: Dict) -> List[str]:
+    texts = []
+    system = params.get("system")
+    if isinstance(system, str):
+        texts.append(system)
+    elif isinstance(system, list):
+        texts.extend(block.get("text", "") for block in system)
+    for message in params.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for block in content or []:
+            if block.get("type") == "text":
+                texts.append(block["text"])
+    return texts
+
+
+def _request_image(params: Dict) -> bytes:
+    for message in params.get("messages", []):
+        for block in message.get("content") or []:
+            if isinstance(block, dict) and block.get("type") == "image":
+                return block["source"].get("data", "").encode("utf-8")
+    return b""
+
+
+def _forced_tool(params: Dict) -> Optional[Dict]:
+    choice = params.get("tool_choice") or {}
+    for tool in params.get("tools") or []:
+        if choice.get("type") == "tool" and tool.get("name") == choice.get("name"):
+            return tool
+    return None
+
+
+def _is_reask(params: Dict) -> bool:
+    """Whether the last user turn is feedback on an earlier, rejected answer."""
+    messages = params.get("messages") or []
+    content = messages[-1].get("content") if messages else None
+    return len(messages) > 1 or (isinstance(content, list) and len(content) > 2)
+
+
+def device_keys_for(params: Dict) -> List[str]:
+    """Device keys the request asks for, from the tool schema or the prompt's JSON template."""
+    tool = _forced_tool(params)
+    if tool is not None:
+        devices = tool.get("input_schema", {}).get("properties", {}).get("devices", {})
+        return list(devices.get("properties", {}).keys())
+    for text in _request_texts(params):
+        match = DEVICES_PATTERN.search(text)
+        if match:
+            try:
+                return list(json.loads(match.group(1)).keys())
+            except ValueError:
+                continue
+    return []
+
+
+def fake_analysis(params: Dict) -> Dict:
+    """Deterministic fake analysis: the same image always gets the same counts."""
+    image = _request_image(params)
+    rng = random.Random(hashlib.sha256(image).digest())
+    return {
+        "page_type": rng.choice(["floor plan", "riser diagram", "schedule", "detail"]),
+        "description": "Stub analysis",
+        "devices": {key: rng.randint(0, MAX_FAKE_COUNT) for key in device_keys_for(params)},
+        "notes": "",
+    }
+
+
+def label_choices_for(tool: Optional[Dict]) -> List[str]:
+    """Labels a forced tool takes one of per grid cell, or [] if it is not a labelling tool."""
+    labels = (tool or {}).get("input_schema", {}).get("properties", {}).get("labels", {})
+    return labels.get("items", {}).get("enum", [])
+
+
+def fake_labels(params: Dict, choices: List[str]) -> Dict:
+    """Deterministic fake labels, one per cell the request's text asks for."""
+    cells = 0
+    for text in _request_texts(params):
+        match = CELLS_PATTERN.search(text)
+        if match:
+            cells = int(match.group(1))
+    rng = random.Random(hashlib.sha256(_request_image(params)).digest())
+    return {"labels": [rng.choice(choices) for _ in range(cells)]}
+
+
+def _cached_prefix_tokens(params: Dict, prompt_cache: Optional[set]) -> Tuple[int, int]:
+    """(cache read, cache write) tokens for system blocks marked with cache_control."""
+    system = params.get("system")
+    if prompt_cache is None or not isinstance(system, list):
+        return 0, 0
+    tools = json.dumps(params.get("tools") or [])
+    prefix_tokens = len(tools) // 4
+    cache_read = cache_write = 0
+    prefix = hashlib.sha256(tools.encode("utf-8"))
+    for block in system:
+        prefix.update(block.get("text", "").encode("utf-8"))
+        prefix_tokens += len(block.get("text", "")) // 4
+        if block.get("cache_control"):
+            digest = prefix.hexdigest()
+            if digest in prompt_cache:
+                cache_read = prefix_tokens
+            else:
+                prompt_cache.add(digest)
+                cache_write = prefix_tokens
+    return cache_read, cache_write
+
+
+def fake_message(params: Dict, prompt_cache: Optional[set] = None, malformed: bool = False) -> Dict:
+    """
+    A complete Messages API response for the request.
+
+    Requests that force a tool get a tool_use block, others a JSON text
+    reply. With a prompt_cache set, the tools and system blocks up to a
+    cache_control marker are reported as cache writes the first time and
+    cache reads afterwards. Labelling tools get one label per grid cell.
+    malformed drops a device key (or a label) from the answer (never on a
+    re-ask) to exercise response validation.
+    """
+    tool = _forced_tool(params)
+    choices = label_choices_for(tool)
+    if choices:
+        analysis = fake_labels(params, choices)
+        if malformed and analysis["labels"] and not _is_reask(params):
+            analysis["labels"].pop()
+    else:
+        analysis = fake_analysis(params)
+        if malformed and analysis["devices"] and not _is_reask(params):
+            analysis["devices"].pop(next(iter(analysis["devices"])))
+    text = json.dumps(analysis)
+    if tool is not None:
+        content = [{"type": "tool_use", "id": f"toolu_stub_{uuid.uuid4().hex[:16]}", "name": tool["name"], "input": analysis}]
+        stop_reason = "tool_use"
+    else:
+        content = [{"type": "text", "text": text}]
+        stop_reason = "end_turn"
+
+    input_tokens = sum(len(t) for t in _request_texts(params)) // 4 + (1500 if _request_image(params) else 0)
+    input_tokens += len(json.dumps(params.get("tools") or [])) // 4
+    cache_read, cache_write = _cached_prefix_tokens(params, prompt_cache)
+    input_tokens -= cache_read + cache_write
+    return {
+        "id": f"msg_stub_{uuid.uuid4().hex[:16]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "stub"),
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": input_tokens,
+            "output_tokens": len(text) // 4,
+            "cache_read_input_tokens": cache_read,
+            "cache_creation_input_tokens": cache_write,
+        },
+    }
+
+
+def stream_events(message: Dict, chunk_size: int = 64) -> List[Tuple[str, Dict]]:
+    """The SSE events that stream the given message, tool input in partial JSON chunks."""
+    usage = message["usage"]
+    events = [("message_start", {
+        "type": "message_start",
+        "message": {**message, "content": [], "stop_reason": None, "usage": {**usage, "output_tokens": 1}},
+    })]
+    for index, block in enumerate(message["content"]):
+        if block["type"] == "tool_use":
+            events.append(("content_block_start", {
+                "type": "content_block_start", "index": index, "content_block": {**block, "input": {}},
+            }))
+            partial = json.dumps(block["input"])
+            delta_type, field = "input_json_delta", "partial_json"
+        else:
+            events.append(("content_block_start", {
+                "type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""},
+            }))
+            partial = block["text"]
+            delta_type, field = "text_delta", "text"
+        for start in range(0, len(partial), chunk_size):
+            events.append(("content_block_delta", {
+                "type": "content_block_delta", "index": index,
+                "delta": {"type": delta_type, field: partial[start:start + chunk_size]},
+            }))
+        events.append(("content_block_stop", {"type": "content_block_stop", "index": index}))
+    events.append(("message_delta", {
+        "type": "message_delta",
+        "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+        "usage": {"output_tokens": usage["output_tokens"]},
+    }))
+    events.append(("message_stop", {"type": "message_stop"}))
+    return events
+
+
+class StubState:
+    """Configuration and in-memory batches shared by all request handlers."""
+
+    def __init__(self, latency: float = 0.0, latency_jitter: float = 0.0, error_rate: float = 0.0,
+                 malformed_rate: float = 0.0, batch_delay: float = 1.0, expired_rate: float = 0.0,
+                 requests_per_minute: int = 4000, seed: Optional[int] = None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.batch_delay = batch_delay
+        self.expired_rate = expired_rate
+        self.requests_per_minute = requests_per_minute
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.batches = {}
+        self.prompt_cache = set()
+        self.request_count = 0
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            self.request_count += 1
+            return self.rng.random() < self.error_rate
+
+    def should_malform(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.malformed_rate
+
+    def should_expire(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.expired_rate
+
+    def delay(self) -> float:
+        with self.lock:
+            return max(0.0, self.latency + self.rng.uniform(-self.latency_jitter, self.latency_jitter))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.send_header("request-id", f"req_stub_{uuid.uuid4().hex[:12]}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, error_type: str, message: str, headers: Optional[Dict] = None):
+        self._send_json(status, {"type": "error", "error": {"type": error_type, "message": message}}, headers)
+
+    def _rate_limit_headers(self) -> Dict:
+        limit = self.state.requests_per_minute
+        return {
+            "anthropic-ratelimit-requests-limit": str(limit),
+            "anthropic-ratelimit-requests-remaining": str(limit - 1),
+            "anthropic-ratelimit-input-tokens-limit": str(limit * 4000),
+            "anthropic-ratelimit-input-tokens-remaining": str(limit * 4000 - 4000),
+        }
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("content-length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def do_POST(self):
+        params = self._read_json()
+        if self.path.rstrip("/") == "/v1/messages":
+            self._handle_message(params)
+        elif self.path.rstrip("/") == "/v1/messages/batches":
+            self._handle_batch_create(params)
+        else:
+            self._send_error(404, "not_found_error", f"No route for POST {self.path}")
+
+    def do_GET(self):
+        match = re.match(r"^/v1/messages/batches/([\w-]+)(/results)?/?$", self.path)
+        if not match:
+            self._send_error(404, "not_found_error", f"No route for GET {self.path}")
+            return
+        batch = self.state.batches.get(match.group(1))
+        if batch is None:
+            self._send_error(404, "not_found_error", "Batch not found")
+        elif match.group(2):
+            self._handle_batch_results(batch)
+        else:
+            self._send_json(200, self._batch_object(batch))
+
+    def _handle_message(self, params: Dict):
+        time.sleep(self.state.delay())
+        if self.state.should_fail():
+            if self.state.rng.random() < 0.5:
+                self._send_error(429, "rate_limit_error", "Stub rate limit", {"retry-after": "1"})
+            else:
+                self._send_error(529, "overloaded_error", "Stub overloaded")
+            return
+        malformed = self.state.should_malform()
+        with self.state.lock:
+            message = fake_message(params, self.state.prompt_cache, malformed)
+        if params.get("stream"):
+            self._send_stream(message, self._rate_limit_headers())
+        else:
+            self._send_json(200, message, self._rate_limit_headers())
+
+    def _send_stream(self, message: Dict, headers: Dict):
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("cache-control", "no-cache")
+        self.send_header("connection", "close")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for event, data in stream_events(message):
+                self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading once it had what it needed
+            pass
+
+    def _handle_batch_create(self, params: Dict):
+        batch_id = f"msgbatch_stub_{uuid.uuid4().hex[:16]}"
+        batch = {"id": batch_id, "created_at": _now(), "requests": params.get("requests", []), "results": None}
+        with self.state.lock:
+            self.state.batches[batch_id] = batch
+        self._send_json(200, self._batch_object(batch))
+
+    def _batch_ended(self, batch: Dict) -> bool:
+        return (_now() - batch["created_at"]).total_seconds() >= self.state.batch_delay
+
+    def _batch_results(self, batch: Dict) -> List[Dict]:
+        with self.state.lock:
+            if batch["results"] is not None:
+                return batch["results"]
+        results = []
+        for request in batch["requests"]:
+            if self.state.should_fail():
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "overloaded_error", "message": "Stub overloaded"}}}
+            elif self.state.should_expire():
+                result = {"type": "expired"}
+            else:
+                malformed = self.state.should_malform()
+                with self.state.lock:
+                    message = fake_message(request["params"], self.state.prompt_cache, malformed)
+                result = {"type": "succeeded", "message": message}
+            results.append({"custom_id": request["custom_id"], "result": result})
+        with self.state.lock:
+            batch["results"] = results
+        return results
+
+    def _batch_object(self, batch: Dict) -> Dict:
+        ended = self._batch_ended(batch)
+        total = len(batch["requests"])
+        counts = {"processing": total, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        if ended:
+            counts["processing"] = 0
+            for item in self._batch_results(batch):
+                counts[item["result"]["type"]] += 1
+        created = batch["created_at"]
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": counts,
+            "created_at": created.isoformat(),
+            "expires_at": (created + timedelta(hours=24)).isoformat(),
+            "ended_at": (created + timedelta(seconds=self.state.batch_delay)).isoformat() if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{self._base_url()}/v1/messages/batches/{batch['id']}/results" if ended else None,
+        }
+
+    def _handle_batch_results(self, batch: Dict):
+        if not self._batch_ended(batch):
+            self._send_error(400, "invalid_request_error", "Batch is still processing")
+            return
+        body = "\n".join(json.dumps(item) for item in self._batch_results(batch)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("content-type", "application/binary")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubAnthropicServer:
+    """Runs the stub on a background thread; use .url as the client's base_url."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **state_kwargs):
+        self.state = StubState(**state_kwargs)
+        handler = type("BoundStubHandler", (StubHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubAnthropicServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="bidsync-stub", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the Anthropic Messages and Batches APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per message")
+    parser.add_argument("--latency-jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 429/529")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction of answers missing a device key")
+    parser.add_argument("--batch-delay", type=float, default=5.0, help="seconds until a batch ends")
+    parser.add_argument("--expired-rate", type=float, default=0.0, help="fraction of batch requests that expire")
+    args = parser.parse_args()
+
+    server = StubAnthropicServer(
+        args.host, args.port,
+        latency=args.latency, latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate, malformed_rate=args.malformed_rate, batch_delay=args.batch_delay,
+        expired_rate=args.expired_rate,
+    )
+    print(f"Stub Anthropic API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
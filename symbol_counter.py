@@ -0,0 +1,163 @@
+"""
+BidSync AI - Symbol Counter
+Counts symbol templates on rendered sheets with FFT normalized
+cross-correlation and non-maximum suppression over the whole page, on the
+CPU; the pipeline matches pages on a process pool as they are rendered
+"""
+
+import time
+from concurrent.futures import Executor
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from metrics import elapsed_ms
+
+# Pages are matched at this resolution; a 1/4" symbol is ~19 px
+MATCH_DPI = 75
+# Scores below this are never reported
+MIN_SCORE = 0.55
+# A window needs this share of the template's contrast to be scored, so
+# blank paper and faint hatching never match
+MIN_CONTRAST = 0.25
+# Another device scoring within this many pixels of a symbol makes it a
+# close call
+RUNNER_UP_RADIUS = 1
+
+
+def _fast_length(n: int) -> int:
+    """Smallest length >= n with no prime factor above 5, which FFTs handle fastest."""
+    while True:
+        m = n
+        for factor in (2, 3, 5):
+            while m % factor == 0:
+                m //= factor
+        if m == 1:
+            return n
+        n += 1
+
+
+def _integral(a: np.ndarray) -> np.ndarray:
+    return np.pad(a.astype(np.float64), ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+
+
+def _window_sums(sums: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Sum over every height x width window that fits inside the array, from its integral image."""
+    return sums[height:, width:] - sums[:-height, width:] - sums[height:, :-width] + sums[:-height, :-width]
+
+
+def match_scores(page: np.ndarray, templates: List[np.ndarray]) -> Iterator[np.ndarray]:
+    """
+    Yield the normalized cross-correlation of each template at every
+    position where it fits on the page (top-left corners), computed with
+    one FFT of the page and one per template.
+    """
+    page_height, page_width = page.shape
+    fft_shape = (_fast_length(page_height + max(t.shape[0] for t in templates) - 1),
+                 _fast_length(page_width + max(t.shape[1] for t in templates) - 1))
+    page_fft = np.fft.rfft2(page, fft_shape)
+    sums, square_sums = _integral(page), _integral(page * page)
+    for template in templates:
+        height, width = template.shape
+        zero_mean = template - template.mean()
+        energy = float((zero_mean * zero_mean).sum())
+        window_sums = _window_sums(sums, height, width)
+        variance = _window_sums(square_sums, height, width) - window_sums * window_sums / (height * width)
+        correlation = np.fft.irfft2(page_fft * np.fft.rfft2(zero_mean[::-1, ::-1], fft_shape), fft_shape)
+        correlation = correlation[height - 1:page_height, width - 1:page_width]
+        valid = variance > MIN_CONTRAST * energy
+        score = np.zeros_like(correlation)
+        score[valid] = correlation[valid] / np.sqrt(variance[valid] * energy)
+        yield score
+
+
+def _running_max(a: np.ndarray, size: int, axis: int) -> np.ndarray:
+    """Max over the `size` elements starting at each index along axis, in log2(size) passes."""
+    result = a.copy()
+    span = 1
+    while span < size:
+        step = min(span, size - span)
+        ahead = [slice(None)] * a.ndim
+        behind = [slice(None)] * a.ndim
+        ahead[axis], behind[axis] = slice(step, None), slice(None, -step)
+        np.maximum(result[tuple(behind)], result[tuple(ahead)], out=result[tuple(behind)])
+        span += step
+    return result
+
+
+def max_filter(a: np.ndarray, size: int) -> np.ndarray:
+    """Max over the size x size window centered on every element."""
+    before = size // 2
+    padded = np.pad(a, before, constant_values=a.min() if a.size else 0)
+    for axis in (0, 1):
+        padded = _running_max(padded, size, axis)
+    return padded[:a.shape[0], :a.shape[1]]
+
+
+def find_symbols(page: np.ndarray, templates: List[Dict]) -> List[Dict]:
+    """
+    Symbols on a page (float array, 0 = black): the best-scoring template
+    at every local maximum above MIN_SCORE, with its score and the best
+    score of any other device's template around it ("runner_up").
+
+    Scores of all templates are merged into per-pixel maps centered on the
+    symbol, and a position is kept only if nothing scores higher within
+    the smallest template's size, so no Python loop runs per candidate.
+    """
+    devices = sorted({t["device"] for t in templates})
+    template_device = np.array([devices.index(t["device"]) for t in templates] + [-1])
+    best = np.zeros(page.shape, dtype=np.float32)
+    best_template = np.full(page.shape, len(templates), dtype=np.int16)
+    runner_up = np.zeros(page.shape, dtype=np.float32)
+    centered = np.zeros(page.shape, dtype=np.float32)
+    for idx, score in enumerate(match_scores(page, [t["image"] for t in templates])):
+        height, width = templates[idx]["image"].shape
+        centered[:] = 0
+        centered[height // 2:height // 2 + score.shape[0], width // 2:width // 2 + score.shape[1]] = score
+        other_device = template_device[best_template] != template_device[idx]
+        nearby = max_filter(centered, 2 * RUNNER_UP_RADIUS + 1)
+        # Taking the lead from another device makes the old leader the runner-up
+        np.copyto(runner_up, np.where(centered > best, best, np.maximum(runner_up, nearby)), where=other_device)
+        better = centered > best
+        best[better] = centered[better]
+        best_template[better] = idx
+
+    suppress = min(min(t["image"].shape) for t in templates)
+    ys, xs = np.nonzero((best >= MIN_SCORE) & (best == max_filter(best, suppress)))
+    return [
+        {"device": templates[idx]["device"], "label": templates[idx]["label"], "score": float(value),
+         "runner_up": float(second), "y": int(y), "x": int(x), "size": templates[idx]["image"].shape}
+        for y, x, idx, value, second in zip(ys, xs, best_template[ys, xs], best[ys, xs], runner_up[ys, xs])
+    ]
+
+
+def count_page(page: np.ndarray, count: Callable[[np.ndarray], Dict]) -> Dict:
+    """
+    count(page) on a gray uint8 page array at MATCH_DPI, as a float array
+    (0 = black); the result gets the page's "match_ms" and matching
+    throughput in "match_mpx_per_s". Runs in a process pool worker, so
+    count must be picklable (a module-level function or a partial of one).
+    """
+    started = time.perf_counter()
+    counted = count(page.astype(np.float32) / 255)
+    match_ms = elapsed_ms(started)
+    return {**counted, "match_ms": match_ms,
+            "match_mpx_per_s": round(page.size / 1000 / match_ms, 2) if match_ms else None}
+
+
+def match_encode(img: Image.Image, dpi: int, count: Callable[[np.ndarray], Dict],
+                 pool: Optional[Executor] = None) -> Dict:
+    """
+    Pipeline encode step for local counting: the page rendered at dpi is
+    scaled down to MATCH_DPI and counted with count_page, on the process
+    pool if one is given, so pages rendered by different render workers
+    are matched in parallel.
+    """
+    scale = MATCH_DPI / dpi
+    gray = img.convert("L")
+    gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))), Image.BOX)
+    page = np.asarray(gray)
+    if pool is None:
+        return count_page(page, count)
+    return pool.submit(count_page, page, count).result()
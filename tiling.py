@@ -0,0 +1,146 @@
+"""
+BidSync AI - Tiled Analysis
+Splits high-resolution sheets into overlapping tiles and merges per-tile counts
+"""
+
+import asyncio
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from PIL import Image
+
+from analysis import add_usage
+from metrics import merge_metrics
+from pdf_render import encode_page_image
+
+# Tile results report symbol centers on a 0-1000 grid
+LOCATION_SCALE = 1000.0
+
+
+def tile_spans(length: int, tile_size: int, overlap: int) -> List[Tuple[int, int]]:
+    """Start/end offsets of overlapping tiles covering [0, length]."""
+    if length <= tile_size:
+        return [(0, length)]
+
+    step = max(1, tile_size - overlap)
+    starts = list(range(0, length - tile_size, step))
+    # Last tile is flush with the far edge, possibly overlapping more
+    starts.append(length - tile_size)
+    return [(start, start + tile_size) for start in starts]
+
+
+def core_spans(spans: List[Tuple[int, int]], length: int) -> List[Tuple[int, int]]:
+    """
+    The part of each span that "owns" the devices inside it.
+
+    Neighbouring cores meet in the middle of their overlap, so every point of
+    the sheet belongs to exactly one tile and a device seen by two tiles is
+    counted once.
+    """
+    cores = []
+    for idx, (start, end) in enumerate(spans):
+        core_start = 0 if idx == 0 else (start + spans[idx - 1][1]) / 2
+        core_end = length if idx == len(spans) - 1 else (spans[idx + 1][0] + end) / 2
+        cores.append((core_start, core_end))
+    return cores
+
+
+def split_into_tiles(img: Image.Image, tile_size: int, overlap: int) -> List[Dict]:
+    """Cut a rendered sheet into JPEG tiles with their sheet boxes and ownership cores."""
+    width, height = img.size
+    x_spans = tile_spans(width, tile_size, overlap)
+    y_spans = tile_spans(height, tile_size, overlap)
+    x_cores = core_spans(x_spans, width)
+    y_cores = core_spans(y_spans, height)
+
+    tiles = []
+    for (y0, y1), (cy0, cy1) in zip(y_spans, y_cores):
+        for (x0, x1), (cx0, cx1) in zip(x_spans, x_cores):
+            tiles.append({
+                "box": (x0, y0, x1, y1),
+                "core": (cx0, cy0, cx1, cy1),
+                "image": encode_page_image(img.crop((x0, y0, x1, y1))),
+            })
+    return tiles
+
+
+def _location_points(locations) -> List[Tuple[float, float]]:
+    points = []
+    for point in locations if isinstance(locations, list) else []:
+        try:
+            x, y = float(point[0]), float(point[1])
+        except (TypeError, ValueError, IndexError):
+            continue
+        points.append((x, y))
+    return points
+
+
+def owned_count(tile: Dict, count: int, locations) -> float:
+    """How many of a tile's devices fall inside its core (may be fractional)."""
+    x0, y0, x1, y1 = tile["box"]
+    cx0, cy0, cx1, cy1 = tile["core"]
+    width, height = x1 - x0, y1 - y0
+
+    points = _location_points(locations)
+    if not points:
+        # No positions to go on: assume devices are spread evenly over the tile
+        core_area = (cx1 - cx0) * (cy1 - cy0)
+        return count * core_area / (width * height)
+
+    owned = 0
+    for x, y in points:
+        sheet_x = x0 + x / LOCATION_SCALE * width
+        sheet_y = y0 + y / LOCATION_SCALE * height
+        if cx0 <= sheet_x < cx1 and cy0 <= sheet_y < cy1:
+            owned += 1
+    # Trust the reported count over the number of points the model listed
+    return owned * count / len(points)
+
+
+def merge_tile_results(tiles: List[Dict], tile_results: List[Dict], device_keys: List[str]) -> Dict:
+    """Combine tile results into one page result, de-duplicating devices in the overlaps."""
+    usage = {}
+    for result in tile_results:
+        add_usage(usage, result.get("usage", {}))
+    bookkeeping = {
+        "retries": sum(result.get("retries", 0) for result in tile_results),
+        "reasks": sum(result.get("reasks", 0) for result in tile_results),
+        "usage": usage,
+        "metrics": merge_metrics([result.get("metrics", {}) for result in tile_results]),
+    }
+
+    errors = [result for result in tile_results if "error" in result]
+    if errors:
+        return {
+            "error": f"{len(errors)} of {len(tiles)} tiles failed: {errors[0]['error']}",
+            "retryable": all(result.get("retryable") for result in errors),
+            **bookkeeping,
+        }
+
+    totals = {key: 0.0 for key in device_keys}
+    for tile, result in zip(tiles, tile_results):
+        devices = result.get("devices", {})
+        locations = result.get("locations") or {}
+        for key in device_keys:
+            count = devices.get(key, 0)
+            if count:
+                totals[key] += owned_count(tile, count, locations.get(key) if isinstance(locations, dict) else None)
+
+    page_types = Counter(result.get("page_type", "unknown") for result in tile_results)
+    descriptions = [result["description"] for result in tile_results if result.get("description")]
+    notes = [result["notes"] for result in tile_results if result.get("notes")]
+    return {
+        "page_type": page_types.most_common(1)[0][0] if page_types else "unknown",
+        "description": descriptions[0] if descriptions else "",
+        "devices": {key: int(round(value)) for key, value in totals.items()},
+        "notes": " | ".join(dict.fromkeys(notes)),
+        "tiles": len(tiles),
+        **bookkeeping,
+    }
+
+
+async def analyze_tiled_page(tiles: List[Dict], analyze_tile: Callable[[bytes], Awaitable[Dict]],
+                             device_keys: List[str]) -> Dict:
+    """Analyze every tile concurrently and merge the counts."""
+    tile_results = await asyncio.gather(*(analyze_tile(tile["image"]) for tile in tiles))
+    return merge_tile_results(tiles, tile_results, device_keys)
@@ -0,0 +1,620 @@
+"""
+BidSync AI - Trade Configurations
+Device lists and model prompts for every trade the analyzer supports
+"""
+
+from typing import List, Optional
+
+# ============================================
+# TRADE CONFIGURATIONS
+# ============================================
+# "tiling" sets the render DPI, tile size (px) and tile overlap (px) used by
+# tiled high-resolution mode. Tiles of 1072px go to the model unresized; the
+# overlap must cover the largest symbol so no device is cut in every tile.
+TRADE_CONFIG = {
+    "all": {
+        "name": "All Trades",
+        "icon": "📋",
+        "description": "Show everything - fire alarm, sprinkler, electrical, security",
+        "devices": {
+            # Fire alarm
+            "smoke_detectors": ("Smoke Detectors (FA)", 0),
+            "heat_detectors": ("Heat Detectors", 0),
+            "pull_stations": ("Pull Stations", 0),
+            "horn_strobes": ("Horn/Strobes", 0),
+            "strobes_only": ("Strobes Only", 0),
+            "horns_speakers": ("Horns/Speakers", 0),
+            "duct_detectors": ("Duct Detectors", 0),
+            "facp": ("Fire Alarm Control Panel", 0),
+            "annunciator": ("Annunciator Panel", 0),
+            "monitor_modules": ("Monitor Modules", 0),
+            "relay_modules": ("Relay Modules", 0),
+            # Sprinkler
+            "sprinkler_heads": ("Sprinkler Heads", 0),
+            "risers": ("Risers", 0),
+            "fdc": ("Fire Dept Connection", 0),
+            "flow_switch": ("Flow Switch", 0),
+            "tamper_switch": ("Tamper Switch", 0),
+            # Electrical
+            "smoke_detectors_120v": ("Smoke Detectors (120VAC)", 0),
+            "exit_signs": ("Exit Signs", 0),
+            "emergency_lights": ("Emergency Lights", 0),
+            # Security
+            "cameras": ("Security Cameras", 0),
+            "card_readers": ("Card Readers", 0),
+            "door_contacts": ("Door Contacts", 0),
+            "access_panel": ("Access Control Panel", 0),
+        },
+        "tiling": {"dpi": 100, "tile_size": 1072, "overlap": 128},
+        "prompt_focus": """Count ALL fire protection and life safety devices across all trades.
+
+=== SPRINKLER SYSTEM ===
+SPRINKLER HEADS:
+- Circles connected to piping lines on ceiling plans
+- On pages labeled "FP-", "Sprinkler", or "Fire Protection"
+- Count as sprinkler_heads ONLY - never as smoke detectors
+- Look for pendant, upright, sidewall types
+
+OTHER SPRINKLER:
+- Risers: Vertical pipe assemblies
+- FDC: Fire Department Connection (exterior)
+- Flow switches: On risers, monitors water flow
+- Tamper switches: On valves
+
+=== FIRE ALARM SYSTEM (24VDC Addressable) ===
+Found in corridors, common areas, lobbies - NOT in dwelling units.
+
+DETECTION:
+- Smoke detectors: Circle with "S" or "SD", labeled "Addressable"
+- Heat detectors: Circle with "H" or "HD", or triangle symbol
+- Pull stations: "PS" or "MPS" near exits/stairwells
+- Duct detectors: "DD" in HVAC ductwork
+
+NOTIFICATION:
+- Horn/strobes: "HS" or "H/S" - count as ONE device
+- Strobes: "S" on walls (visual only)
+- Horns/speakers: Speaker symbol
+
+PANELS - COUNT CAREFULLY:
+- FACP: Main Fire Alarm Control Panel - typically ONE per building
+- FARA/Annunciator: Remote display at entrance - count as annunciator NOT facp
+- If you see FACP + FARA = 1 facp + 1 annunciator
+
+MODULES - CHECK RISER DIAGRAMS:
+- Monitor modules (MM): For inputs (flow, tamper, elevator)
+- Relay modules (RM): For outputs (door holders, HVAC)
+- "ER" = Elevator Relay = count as relay_modules
+
+=== ELECTRICAL (120VAC) ===
+RESIDENTIAL SMOKE/CO - IN DWELLING UNITS ONLY:
+- Hardwired to electrical circuits
+- Found in bedrooms, unit hallways
+- NOT labeled "addressable"
+- Count as smoke_detectors_120v
+
+OTHER ELECTRICAL:
+- Exit signs: Illuminated exit signs
+- Emergency lights: Battery backup lights in egress paths
+
+=== SECURITY ===
+- Cameras: Security/surveillance cameras
+- Card readers: Access control at doors
+- Door contacts: Magnetic contacts on doors
+- Access panel: Security control panel (different from FACP)
+
+=== KEY RULES ===
+1. Sprinkler circles ≠ Smoke detectors
+2. Fire alarm smokes (addressable, corridors) ≠ Electrical smokes (120VAC, bedrooms)
+3. FARA = annunciator, NOT a second FACP
+4. Check riser diagrams for module counts
+5. Pull stations at EVERY stairwell on EVERY floor
+6. Count annunciator separately from FACP"""
+    },
+    
+    "fire_alarm": {
+        "name": "Fire Alarm",
+        "icon": "🚨",
+        "description": "Smoke detectors, pull stations, horn/strobes, panels",
+        "devices": {
+            "smoke_detectors": ("Smoke Detectors", 0),
+            "heat_detectors": ("Heat Detectors", 0),
+            "pull_stations": ("Pull Stations", 0),
+            "horn_strobes": ("Horn/Strobes", 0),
+            "strobes_only": ("Strobes Only", 0),
+            "horns_speakers": ("Horns/Speakers", 0),
+            "duct_detectors": ("Duct Detectors", 0),
+            "beam_detectors": ("Beam Detectors", 0),
+            "facp": ("Fire Alarm Control Panel", 0),
+            "annunciator": ("Annunciator Panel", 0),
+            "monitor_modules": ("Monitor Modules", 0),
+            "relay_modules": ("Relay Modules", 0),
+            "door_holders": ("Magnetic Door Holders", 0),
+        },
+        "tiling": {"dpi": 100, "tile_size": 1072, "overlap": 128},
+        "prompt_focus": """Focus ONLY on FIRE ALARM devices. 
+
+CRITICAL: DO NOT count sprinkler heads! Sprinkler heads appear as:
+- Simple circles on ceiling/sprinkler plans
+- Connected to sprinkler piping lines
+- Pages labeled "FP-" or "Sprinkler" or "Fire Protection"
+- No letter designation inside the circle
+
+FIRE ALARM devices have these symbols (count ONLY these):
+
+DETECTION DEVICES:
+- Smoke detectors: Circle with "S" or "SD" inside, or diamond shape. May say "Addressable Smoke Detector". NOTE: Combo devices with built-in horn/strobe still count as ONE smoke detector.
+- Heat detectors: Circle with "H" or "HD" inside, or triangle shape
+- Pull stations: Square/rectangle near exits, labeled "PS" or "MPS" or "Manual Pull Station"
+- Duct detectors: Rectangle with "DD", mounted in ductwork
+- CO detectors: Circle with "CO" inside
+
+NOTIFICATION DEVICES:
+- Horn/strobes: "HS" or "H/S" symbol - counts as ONE device even if combo unit
+- Strobes only: "S" or strobe symbol on walls (visual only, no horn)
+- Horns/speakers: Speaker symbol or "SPK"
+- IMPORTANT: If smoke detectors have BUILT-IN horn/strobes (combo units), do NOT double count. The horn/strobe is part of the smoke detector.
+
+PANELS - COUNT VERY CAREFULLY:
+- FACP (Fire Alarm Control Panel): The MAIN control panel. Typically ONE per building. Located in electrical room, fire command center, or mechanical room. Symbol shows "FACP". This is where all circuits originate.
+- FARA or Annunciator: REMOTE display panel, usually at main entrance, lobby, or fire command. Shows "FARA" or "ANN" or "Remote Annunciator" or "Graphic Annunciator". COUNT THESE AS annunciator, NOT as facp!
+- RULE: If riser diagram shows FACP and FARA, count = 1 facp + 1 annunciator (NOT 2 facp)
+
+MODULES - CHECK RISER DIAGRAMS CAREFULLY:
+- Monitor modules (MM): Used to monitor input signals. Look for connections to:
+  * Sprinkler flow switches
+  * Tamper switches  
+  * Elevator equipment
+  * HVAC systems
+- Relay modules (RM): Used to control output devices. Look for:
+  * Door holder releases
+  * Elevator recall
+  * HVAC shutdown
+  * Stairwell pressurization
+- "ER" symbols = Elevator Relay modules - count these as relay_modules
+- Look at EACH FLOOR on riser diagram - count modules at interface points
+- Typical: 2-4 modules per elevator, 1-2 per floor for door holders, 1-2 for fire pump/sprinkler monitoring
+
+RISER DIAGRAM ANALYSIS - CRITICAL FOR ACCURATE COUNTS:
+- Riser diagrams show the SYSTEM ARCHITECTURE
+- MUST count these from riser diagram:
+
+ANNUNCIATOR (FARA):
+- Look for "FARA" or "Remote Annunciator" box - usually near FACP or at building entry
+- This is SEPARATE from FACP - count as annunciator, NOT as facp
+- Typical: 1 per building at main entrance
+
+PULL STATIONS:
+- Count pull stations at EACH stairwell on EACH floor
+- Riser shows "P" or pull station symbol at stairs
+- Formula: (number of stairs) x (number of floors) = minimum pull stations
+- Example: 2 stairs x 4 floors = 8 pull stations minimum
+
+MONITOR MODULES (MM):
+- Count at each interface point on riser
+- Elevator equipment: 1-2 MM per elevator
+- Fire pump/sprinkler: 1-2 MM for flow/tamper switches
+- HVAC interface: 1 MM per air handler with dampers
+
+RELAY MODULES (RM) / ELEVATOR RELAY (ER):
+- Count at each output interface
+- Elevator recall: 1-2 RM per elevator
+- Door holders: 1 RM per floor with fire doors
+- HVAC shutdown: 1 RM per air handler
+- "ER" symbols = Elevator Relay = count as relay_modules
+
+TYPICAL COUNTS FOR MULTI-STORY RESIDENTIAL:
+- 1 FACP
+- 1 Annunciator (FARA)
+- 8-12 pull stations (2 per floor x 4 floors)
+- 4-8 monitor modules
+- 4-8 relay modules
+
+DOOR HOLDERS:
+- Magnetic door holders keep fire doors open
+- Release on alarm - connected via relay module
+- Symbol may show door with magnet or "DH"
+
+Look at the LEGEND on each page to identify correct symbols.
+If a page is labeled "Sprinkler" or shows piping with circles, those are SPRINKLER HEADS - do NOT count them.
+If you're unsure about a symbol, count 0 rather than guessing."""
+    },
+    
+    "sprinkler": {
+        "name": "Sprinkler",
+        "icon": "💧",
+        "description": "Sprinkler heads, risers, valves, FDC",
+        "devices": {
+            "sprinkler_heads": ("Sprinkler Heads", 0),
+            "risers": ("Risers", 0),
+            "piv": ("PIV (Post Indicator Valve)", 0),
+            "osny": ("OS&Y Valve", 0),
+            "fdc": ("Fire Dept Connection", 0),
+            "flow_switch": ("Flow Switch", 0),
+            "tamper_switch": ("Tamper Switch", 0),
+            "inspectors_test": ("Inspector's Test", 0),
+            "fire_pump": ("Fire Pump", 0),
+        },
+        "tiling": {"dpi": 125, "tile_size": 1072, "overlap": 96},
+        "prompt_focus": """STEP 1: CHECK THE DRAWING NUMBER IN THE TITLE BLOCK (bottom right corner).
+
+RETURN ALL ZEROS IF THE DRAWING NUMBER STARTS WITH:
+- "E" or "E-" (Electrical drawing - NOT sprinkler)
+- "FA" or "FA-" (Fire Alarm - NOT sprinkler)
+- "A" or "A-" (Architectural - NOT sprinkler)
+- "M" or "M-" (Mechanical - NOT sprinkler)
+- "P" or "P-" (Plumbing - may have some overlap but usually NOT sprinkler)
+
+ONLY COUNT SPRINKLERS IF DRAWING NUMBER STARTS WITH:
+- "FP" or "FP-" (Fire Protection)
+- "SP" or "SP-" (Sprinkler)
+- "FS" or "FS-" (Fire Suppression)
+
+ALSO RETURN ALL ZEROS IF:
+- Page title contains "Matrix", "Schedule", "Riser Detail", "Notes"
+- Page shows HVAC equipment (condensers, RTUs) - these are NOT sprinkler heads
+- Page shows smoke detectors or fire alarm devices
+- You see electrical symbols, conduit, panels
+- No actual sprinkler piping is visible
+
+STEP 2: IF AND ONLY IF THIS IS A SPRINKLER DRAWING (FP-, SP-, FS-):
+
+SPRINKLER HEADS: Small circles connected to piping lines running across ceiling
+- Must see actual PIPING (lines with pipe sizes like 1", 1-1/4", 2")
+- Heads are circles attached to the piping
+- No piping = 0 heads
+
+THESE ARE NOT SPRINKLER HEADS:
+- HVAC condensers/equipment on roof plans (rectangles with fans)
+- Smoke detectors (circles with "S" or "SD")
+- Any electrical symbol
+- Circles without piping connections
+
+OTHER DEVICES (count conservatively):
+- Risers: 1-2 per building typically
+- FDC: 1-2 per building
+- Flow/Tamper switches: 1-2 each per building
+- Fire Pump: Usually 0 unless dedicated pump room shown
+
+When in doubt, count 0."""
+    },
+    
+    "electrical": {
+        "name": "Electrical",
+        "icon": "⚡",
+        "description": "120VAC devices, panels, receptacles, lighting",
+        "devices": {
+            "smoke_detectors_120v": ("Smoke Detectors (120VAC)", 0),
+            "co_detectors_120v": ("CO Detectors (120VAC)", 0),
+            "combo_smoke_co": ("Combo Smoke/CO (120VAC)", 0),
+            "receptacles": ("Receptacles", 0),
+            "switches": ("Switches", 0),
+            "junction_boxes": ("Junction Boxes", 0),
+            "panels": ("Electrical Panels", 0),
+            "disconnects": ("Disconnects", 0),
+            "lighting_fixtures": ("Lighting Fixtures", 0),
+            "emergency_lights": ("Emergency Lights", 0),
+            "exit_signs": ("Exit Signs", 0),
+        },
+        "tiling": {"dpi": 100, "tile_size": 1072, "overlap": 128},
+        "prompt_focus": """Focus ONLY on ELECTRICAL (120VAC line voltage) devices.
+
+CRITICAL - SMOKE DETECTOR DISTINCTION:
+DO NOT count fire alarm smoke detectors! Only count 120VAC residential type.
+
+120VAC SMOKE/CO (COUNT THESE):
+- Found in DWELLING UNITS (apartments, condos, bedrooms)
+- Hardwired to electrical circuits (shown on electrical branch circuits)
+- Symbol typically a simple circle with wire connection to circuit
+- Listed in electrical panel schedules
+- Usually 1-3 per dwelling unit in bedrooms/hallways
+- NOT labeled "addressable" or "SD"
+
+FIRE ALARM SMOKES (DO NOT COUNT - wrong trade):
+- Labeled "Addressable Smoke Detector" or "SD" or "S"
+- Connected to fire alarm SLC (signaling line circuit)
+- Found in corridors, common areas, lobbies
+- Part of building fire alarm system
+- Has horn/strobe or connects to notification devices
+- On pages labeled "Fire Alarm" or referenced to FACP
+
+RULE: If legend says "Addressable" = FIRE ALARM = DO NOT COUNT
+RULE: If in common corridor/lobby = likely FIRE ALARM = DO NOT COUNT
+RULE: If in bedroom/unit interior = likely 120VAC = COUNT
+
+RECEPTACLES:
+- Duplex outlets, GFI outlets
+- Count each outlet location (not each plug slot)
+
+SWITCHES:
+- Light switches, dimmers, 3-way switches
+- Count each switch location
+
+ELECTRICAL PANELS:
+- Main panels, sub-panels, load centers
+- Count panels shown in panel schedules or single-line diagrams
+
+DISCONNECTS:
+- HVAC disconnects at condensers/equipment (check ROOF PLANS)
+- Motor disconnects
+- Each piece of HVAC equipment needs a disconnect - count them on roof plans
+
+LIGHTING FIXTURES:
+- All light fixtures shown on reflected ceiling plans
+- Count symbols in fixture schedule
+
+EMERGENCY LIGHTS & EXIT SIGNS:
+- Battery backup lights
+- Illuminated exit signs (often have battery backup)
+- Found at exits, stairwells, corridors
+
+IGNORE: Fire alarm devices (24VDC), sprinkler, security, low voltage"""
+    },
+    
+    "security": {
+        "name": "Security/Access",
+        "icon": "🔐",
+        "description": "Cameras, card readers, door contacts, access control",
+        "devices": {
+            "cameras": ("Security Cameras", 0),
+            "card_readers": ("Card Readers", 0),
+            "door_contacts": ("Door Contacts", 0),
+            "motion_sensors": ("Motion Sensors", 0),
+            "glass_break": ("Glass Break Sensors", 0),
+            "access_panel": ("Access Control Panel", 0),
+            "electric_strike": ("Electric Strikes", 0),
+            "mag_locks": ("Magnetic Locks", 0),
+            "rex": ("REX (Request to Exit)", 0),
+            "keypad": ("Keypads", 0),
+            "intercom": ("Intercom Stations", 0),
+        },
+        "tiling": {"dpi": 100, "tile_size": 1072, "overlap": 128},
+        "prompt_focus": """Focus ONLY on SECURITY and ACCESS CONTROL devices.
+
+=== WHAT TO COUNT ===
+
+CAMERAS:
+- Security/surveillance cameras
+- Symbols: Camera icon, "CAM", "CCTV"
+- Types: Fixed, PTZ, dome, bullet
+- Located at entrances, parking, corridors
+
+CARD READERS:
+- Access control readers at doors
+- Symbols: Rectangle at door with "CR" or "RDR"
+- May show proximity, smart card, or multi-tech
+
+DOOR CONTACTS:
+- Magnetic contacts that detect door open/close
+- Symbol: Small rectangle on door frame
+- Used for security monitoring
+
+MOTION SENSORS:
+- PIR (Passive Infrared) motion detectors
+- For intrusion detection
+- NOT the same as fire alarm heat detectors
+
+GLASS BREAK SENSORS:
+- Detect breaking glass
+- Usually near windows/storefronts
+
+ACCESS CONTROL PANEL:
+- Main security panel (like DSC, Honeywell, Lenel)
+- Different from FACP (fire alarm panel)
+- Usually in IT room or security office
+
+ELECTRIC STRIKES & MAG LOCKS:
+- Electric strike: Releases door latch
+- Mag lock: Electromagnetic lock on door
+- Located at secured doors
+
+REX (Request to Exit):
+- Motion sensor or button to exit
+- Located inside secured doors
+
+KEYPADS:
+- PIN entry devices
+- At secured entrances
+
+INTERCOM:
+- Audio/video stations at entries
+- Lobby panels, unit stations
+
+=== WHAT NOT TO COUNT ===
+DO NOT count these as security:
+- Smoke detectors (fire alarm)
+- Heat detectors (fire alarm)
+- Pull stations (fire alarm)
+- Horn/strobes (fire alarm)
+- FACP (fire alarm panel - different from access panel)
+- Sprinkler heads
+- Exit signs, emergency lights (electrical)
+- Magnetic door HOLDERS (fire alarm - releases doors on alarm)
+
+=== KEY DISTINCTION ===
+- Mag LOCK = Security (holds door locked) ✓ COUNT
+- Mag door HOLDER = Fire alarm (holds door open, releases on alarm) ✗ DON'T COUNT
+
+Look for pages labeled "Security", "Access Control", or "S-" drawings."""
+    },
+    
+    "low_voltage": {
+        "name": "Low Voltage",
+        "icon": "🔌",
+        "description": "All low voltage: fire alarm + security combined",
+        "devices": {
+            # Fire alarm
+            "smoke_detectors": ("Smoke Detectors", 0),
+            "heat_detectors": ("Heat Detectors", 0),
+            "pull_stations": ("Pull Stations", 0),
+            "horn_strobes": ("Horn/Strobes", 0),
+            "strobes_only": ("Strobes Only", 0),
+            "duct_detectors": ("Duct Detectors", 0),
+            "facp": ("Fire Alarm Control Panel", 0),
+            "annunciator": ("Annunciator Panel", 0),
+            "monitor_modules": ("Monitor Modules", 0),
+            "relay_modules": ("Relay Modules", 0),
+            "door_holders": ("Magnetic Door Holders", 0),
+            # Security
+            "cameras": ("Security Cameras", 0),
+            "card_readers": ("Card Readers", 0),
+            "door_contacts": ("Door Contacts", 0),
+            "motion_sensors": ("Motion Sensors", 0),
+            "access_panel": ("Access Control Panel", 0),
+        },
+        "tiling": {"dpi": 100, "tile_size": 1072, "overlap": 128},
+        "prompt_focus": """Focus on ALL LOW VOLTAGE devices (Fire Alarm + Security).
+
+=== FIRE ALARM (24VDC Addressable) ===
+Found in corridors, common areas, lobbies.
+
+DETECTION:
+- Smoke detectors: Circle with "S" or "SD", "Addressable Smoke Detector"
+- Heat detectors: Circle with "H" or "HD", triangle shape
+- Pull stations: "PS" or "MPS" near exits
+- Duct detectors: "DD" in HVAC ductwork
+
+NOTIFICATION:
+- Horn/strobes: "HS" - count as ONE device even if combo
+- Strobes only: "S" on walls
+
+PANELS - CRITICAL:
+- FACP: Main Fire Alarm Control Panel - typically ONE per building
+- FARA/Annunciator: Remote display panel - COUNT AS annunciator NOT facp
+- RULE: FACP + FARA = 1 facp + 1 annunciator (NOT 2 facp)
+
+MODULES - CHECK RISER DIAGRAMS:
+- Monitor modules (MM): Inputs from flow switches, tamper, elevator
+- Relay modules (RM): Outputs to door holders, HVAC shutdown
+- "ER" = Elevator Relay = count as relay_modules
+- Look at each floor on riser - count interface points
+
+DOOR HOLDERS:
+- Magnetic holders keep fire doors open
+- Release on alarm
+- Connected via relay module
+
+=== SECURITY ===
+CAMERAS:
+- Security cameras: "CAM", camera icon
+
+ACCESS CONTROL:
+- Card readers: "CR" or "RDR" at doors
+- Door contacts: Magnetic sensors on doors
+- Motion sensors: PIR for intrusion (not fire alarm heat detectors)
+
+PANELS:
+- Access control panel: Security panel (different from FACP)
+
+=== WHAT NOT TO COUNT ===
+DO NOT count:
+- Sprinkler heads (suppression, not low voltage)
+- 120VAC smoke detectors (electrical, not low voltage)
+- Exit signs, emergency lights (electrical)
+- Receptacles, switches (electrical)
+
+=== KEY RULES ===
+1. Fire alarm smokes (addressable) ≠ Electrical smokes (120VAC)
+2. FARA = annunciator, NOT second FACP
+3. Check riser diagrams for module counts
+4. Mag LOCK (security) ≠ Mag door HOLDER (fire alarm)"""
+    }
+}
+
+# Text tags drawn inside a device's symbol on CAD-exported sheets, used to
+# count symbols from the PDF's vector layer without a vision call. Devices
+# without tags (sprinkler heads, receptacles, fixtures ...) are plain
+# symbols and can only be counted by the model.
+DEVICE_TAGS = {
+    # Fire alarm
+    "smoke_detectors": ["SD", "S"],
+    "heat_detectors": ["HD", "H"],
+    "pull_stations": ["PS", "MPS", "F"],
+    "horn_strobes": ["HS", "H/S"],
+    "strobes_only": ["S", "ST", "V"],
+    "horns_speakers": ["SPK", "SP", "HN"],
+    "duct_detectors": ["DD", "SDD"],
+    "beam_detectors": ["BD"],
+    "facp": ["FACP"],
+    "annunciator": ["FARA", "ANN", "RA"],
+    "monitor_modules": ["MM"],
+    "relay_modules": ["RM", "ER"],
+    "door_holders": ["DH"],
+    # Sprinkler
+    "piv": ["PIV"],
+    "osny": ["OS&Y", "OSY"],
+    "fdc": ["FDC"],
+    "flow_switch": ["FS", "WF", "VFS"],
+    "tamper_switch": ["TS", "VS"],
+    "inspectors_test": ["ITV", "IT"],
+    "fire_pump": ["FP"],
+    # Electrical
+    "smoke_detectors_120v": ["SA"],
+    "co_detectors_120v": ["CO"],
+    "combo_smoke_co": ["SA/CO", "SCO"],
+    "switches": ["S", "S3", "S4"],
+    "junction_boxes": ["J", "JB"],
+    "emergency_lights": ["EM", "EL"],
+    "exit_signs": ["EX", "EXIT"],
+    # Security
+    "cameras": ["CAM", "CCTV"],
+    "card_readers": ["CR", "RDR"],
+    "door_contacts": ["DC"],
+    "motion_sensors": ["MS", "MD"],
+    "glass_break": ["GB"],
+    "access_panel": ["ACP"],
+    "electric_strike": ["ES"],
+    "mag_locks": ["ML", "EML"],
+    "rex": ["REX"],
+    "keypad": ["KP"],
+    "intercom": ["IC", "INT"],
+}
+
+# Pseudo trade key for a single pass that counts several trades at once
+MULTI_TRADE_KEY = "multi"
+
+def build_multi_trade_config(trade_keys: List[str]) -> dict:
+    """Combine several trades into one config so each page is analyzed once for all of them."""
+    devices = {}
+    sections = []
+    for trade_key in trade_keys:
+        trade = TRADE_CONFIG[trade_key]
+        for key, device in trade["devices"].items():
+            devices.setdefault(key, device)
+        sections.append(f"""=== {trade['name'].upper()} SECTION ===
+Device keys for this section: {", ".join(trade["devices"].keys())}
+
+{trade["prompt_focus"]}""")
+    
+    prompt_focus = """Count devices for EACH trade section below in a single pass.
+
+Apply each section's rules ONLY to the device keys listed for that section.
+A rule like "return all zeros" in one section only zeroes that section's keys.
+If two sections list the same key, it is the same device - report one count for it.
+
+""" + "\n\n".join(sections)
+    
+    # Tile for the densest trade in the set
+    tilings = [TRADE_CONFIG[key]["tiling"] for key in trade_keys]
+    tiling = {
+        "dpi": max(t["dpi"] for t in tilings),
+        "tile_size": min(t["tile_size"] for t in tilings),
+        "overlap": max(t["overlap"] for t in tilings)
+    }
+    
+    names = [TRADE_CONFIG[key]["name"] for key in trade_keys]
+    return {
+        "name": " + ".join(names),
+        "icon": "🧩",
+        "description": f"Single pass for {', '.join(names)}",
+        "devices": devices,
+        "tiling": tiling,
+        "prompt_focus": prompt_focus,
+        "trades": list(trade_keys)
+    }
+
+
+def resolve_trade_config(trade_key: str, trade_keys: Optional[List[str]] = None) -> dict:
+    """Config for a single trade, or the combined config for a multi-trade pass."""
+    if trade_key == MULTI_TRADE_KEY:
+        return build_multi_trade_config(trade_keys or [])
+    return TRADE_CONFIG[trade_key]
@@ -0,0 +1,209 @@
+"""
+BidSync AI - Sheet Triage
+Reads the PDF text layer to skip sheets that cannot hold devices for a trade
+before paying for a vision call
+"""
+
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from documents import open_pdf
+from page_pool import map_page_chunks
+
+# Discipline designators used on sheet numbers (FP-101, E2.01, A-301 ...)
+DISCIPLINE_NAMES = {
+    "A": "Architectural",
+    "AD": "Architectural Demo",
+    "C": "Civil",
+    "E": "Electrical",
+    "FA": "Fire Alarm",
+    "FP": "Fire Protection",
+    "FS": "Fire Suppression",
+    "G": "General",
+    "ID": "Interiors",
+    "L": "Landscape",
+    "LS": "Life Safety",
+    "M": "Mechanical",
+    "P": "Plumbing",
+    "S": "Structural/Security",
+    "SP": "Sprinkler",
+    "T": "Technology",
+}
+SHEET_NUMBER_PATTERN = re.compile(
+    r"^(" + "|".join(sorted(DISCIPLINE_NAMES, key=len, reverse=True)) + r")-?\d{1,3}(?:\.\d{1,3})?[A-Z]?$"
+)
+
+# Drawing disciplines that cannot contain the trade's devices. Anything not
+# listed (or a sheet with no readable number) is always analyzed.
+SKIP_DISCIPLINES = {
+    "all": {"C", "L"},
+    "fire_alarm": {"C", "L", "P", "FP", "SP", "FS", "ID"},
+    "sprinkler": {"A", "AD", "C", "E", "FA", "G", "ID", "L", "LS", "M", "P", "S", "T"},
+    "electrical": {"C", "L", "P", "FP", "SP", "FS", "FA", "T"},
+    "security": {"C", "L", "P", "M", "FP", "SP", "FS", "FA"},
+    "low_voltage": {"C", "L", "P", "FP", "SP", "FS"},
+}
+
+# Sheet titles that never carry countable devices for the trade. A title that
+# also says "PLAN" is never skipped ("FLOOR PLAN & GENERAL NOTES").
+COMMON_SKIP_TITLES = ["COVER SHEET", "TITLE SHEET", "DRAWING INDEX", "SHEET INDEX",
+                      "SPECIFICATIONS", "ABBREVIATIONS"]
+SKIP_TITLES = {
+    "all": COMMON_SKIP_TITLES,
+    "fire_alarm": COMMON_SKIP_TITLES + ["MATRIX", "GENERAL NOTES"],
+    "sprinkler": COMMON_SKIP_TITLES + ["MATRIX", "SCHEDULE", "RISER DETAIL", "NOTES", "HYDRAULIC"],
+    "electrical": COMMON_SKIP_TITLES + ["GENERAL NOTES"],
+    "security": COMMON_SKIP_TITLES + ["MATRIX", "GENERAL NOTES"],
+    "low_voltage": COMMON_SKIP_TITLES + ["GENERAL NOTES"],
+}
+
+# Title block region, in page fractions measured from the bottom-left corner
+TITLE_BLOCK_MIN_X = 0.7
+TITLE_BLOCK_MAX_Y = 0.3
+TITLE_STRIP_MIN_X = 0.85
+
+
+def to_display_coords(x: float, y: float, width: float, height: float, rotation: int) -> Tuple[float, float]:
+    """Convert PDF user space to (u, v) fractions of the page as displayed, v measured upwards."""
+    u, v = x / width, y / height
+    if rotation == 90:
+        return v, 1 - u
+    if rotation == 180:
+        return 1 - u, 1 - v
+    if rotation == 270:
+        return 1 - v, u
+    return u, v
+
+
+def in_title_block(u: float, v: float) -> bool:
+    """True for display coordinates in the title block or the title strip along the right edge."""
+    return (u >= TITLE_BLOCK_MIN_X and v <= TITLE_BLOCK_MAX_Y) or u >= TITLE_STRIP_MIN_X
+
+
+def text_fragments(page) -> List[Tuple[str, float, float]]:
+    """Every text fragment of a PyPDF2 page with its position in PDF user space."""
+    fragments = []
+    # PyPDF2 reports text when it flushes a line, by which time T* may have
+    # moved the text matrix on; keep the matrices of the first text operator
+    # since the last fragment instead
+    shown = []
+
+    def before_operator(operator, operands, cm, tm):
+        if operator in (b"Tj", b"TJ", b"'", b'"') and not shown:
+            shown.append((list(cm), list(tm)))
+
+    def visit(text, cm, tm, font_dict, font_size):
+        if shown:
+            cm, tm = shown.pop()
+        if not text or not text.strip():
+            return
+        # Text position is the text matrix origin mapped through the CTM
+        x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+        y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+        fragments.append((text, x, y))
+
+    page.extract_text(visitor_operand_before=before_operator, visitor_text=visit)
+    return fragments
+
+
+def page_text(page) -> List[Tuple[str, Tuple[float, float]]]:
+    """Every text fragment of a PyPDF2 page with its position in display coordinates."""
+    box = page.mediabox
+    left, bottom = float(box.left), float(box.bottom)
+    width, height = float(box.width) or 1.0, float(box.height) or 1.0
+    rotation = (page.get('/Rotate') or 0) % 360
+    return [
+        (text, to_display_coords(x - left, y - bottom, width, height, rotation))
+        for text, x, y in text_fragments(page)
+    ]
+
+
+def extract_sheet_info(page) -> Dict:
+    """Find the sheet number and title-block text of a PyPDF2 page."""
+    try:
+        fragments = page_text(page)
+    except Exception:
+        return {"drawing_number": None, "discipline": None, "title_text": "", "has_text": False}
+
+    drawing_number = None
+    best_score = None
+    title_parts = []
+    for text, (u, v) in fragments:
+        if in_title_block(u, v):
+            title_parts.append(text)
+        for token in text.split():
+            token = token.strip(".,:;()[]").upper()
+            if not SHEET_NUMBER_PATTERN.match(token):
+                continue
+            # The sheet's own number sits closest to the bottom-right corner;
+            # references to other sheets are scattered across the drawing
+            score = u + (1 - v)
+            if best_score is None or score > best_score:
+                drawing_number, best_score = token, score
+
+    discipline = SHEET_NUMBER_PATTERN.match(drawing_number).group(1) if drawing_number else None
+    return {
+        "drawing_number": drawing_number,
+        "discipline": discipline,
+        "title_text": " ".join(" ".join(title_parts).split()).upper(),
+        "has_text": bool(fragments),
+    }
+
+
+def skip_reason(sheet_info: Dict, trade_key: str) -> Optional[str]:
+    """Why this sheet can be skipped for the trade, or None if it must be analyzed."""
+    discipline = sheet_info.get("discipline")
+    if discipline and discipline in SKIP_DISCIPLINES.get(trade_key, set()):
+        return f"{DISCIPLINE_NAMES[discipline]} sheet ({discipline}-)"
+
+    title = sheet_info.get("title_text", "")
+    if title and "PLAN" not in title:
+        for phrase in SKIP_TITLES.get(trade_key, []):
+            if phrase in title:
+                return f"title mentions \"{phrase.title()}\""
+    return None
+
+
+def _read_sheet_infos(pdf_path: str, pages: List[int]) -> Dict[int, Dict]:
+    with open_pdf(pdf_path) as reader:
+        return {page_num: extract_sheet_info(reader.pages[page_num - 1]) for page_num in pages}
+
+
+def read_sheet_infos(pdf_path: str, pages: List[int], workers: Optional[int] = None) -> Dict[int, Dict]:
+    """Extract sheet info for the given pages, spreading large sets over a process pool."""
+    return map_page_chunks(_read_sheet_infos, pdf_path, pages, workers=workers)
+
+
+def triage_pages(pdf_path: str, pages: List[int], trade_keys: List[str],
+                 sheet_infos: Optional[Dict[int, Dict]] = None) -> Dict:
+    """
+    Split pages into those worth a vision call and those that can be skipped.
+
+    A page is skipped only if every trade in trade_keys would skip it. Pages
+    without a text layer (scans) are always kept. sheet_infos from an earlier
+    read_sheet_infos call saves reading the text layer again.
+    """
+    if sheet_infos is None:
+        sheet_infos = read_sheet_infos(pdf_path, pages)
+
+    analyze = []
+    skipped = {}
+    for page_num in pages:
+        info = sheet_infos.get(page_num, {})
+        reasons = [skip_reason(info, trade_key) for trade_key in trade_keys]
+        if reasons and all(reasons):
+            skipped[page_num] = reasons[0]
+        else:
+            analyze.append(page_num)
+
+    return {
+        "analyze": analyze,
+        "skipped": skipped,
+        "sheet_infos": sheet_infos,
+    }
+
+
+def summarize_skips(skipped: Dict[int, str]) -> List[Tuple[str, int]]:
+    """Group skipped pages by reason, most common first."""
+    return Counter(skipped.values()).most_common()
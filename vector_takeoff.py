@@ -0,0 +1,272 @@
+"""
+BidSync AI - Vector Takeoff
+Counts tagged device symbols straight from the vector paths and text of
+CAD-exported sheets, so those pages skip the vision model
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+from PyPDF2.generic import ContentStream, NameObject
+
+from documents import POINTS_PER_INCH, open_pdf
+from metrics import elapsed_ms
+from page_pool import map_page_chunks
+from trades import DEVICE_TAGS
+from triage import in_title_block, text_fragments, to_display_coords
+
+# A closed path this size on paper (either side, in inches) may be a device symbol
+SYMBOL_MIN_SIZE = 0.06 * POINTS_PER_INCH
+SYMBOL_MAX_SIZE = 0.6 * POINTS_PER_INCH
+SYMBOL_MAX_ASPECT = 1.5
+# A tag's text origin may sit this far (share of the symbol's size) outside
+# the symbol, e.g. a wide tag centered in a small circle
+TAG_TOLERANCE = 0.25
+# Pages with raster images covering more than this share are scans or
+# pasted-in images the vector layer cannot see into
+RASTER_MAX_FRACTION = 0.25
+# Form XObjects (CAD blocks) nested deeper than this are not followed
+MAX_FORM_DEPTH = 8
+IDENTITY = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+# Path painting operators; the ones that close the path first are marked
+PAINT_OPERATORS = {b"S": False, b"s": True, b"f": True, b"F": True, b"f*": True,
+                   b"B": True, b"B*": True, b"b": True, b"b*": True}
+
+
+def symbol_library(trade_config: dict) -> Dict:
+    """
+    The tags of the trade's devices.
+
+    "tags" maps a tag to its device key. "ambiguous" holds tags of the
+    trade that name several devices in any trade (an "S" can be a smoke
+    detector, a strobe or a switch), and "untagged" lists the trade's
+    devices that are drawn as plain symbols.
+    """
+    owners = {}
+    for key, tags in DEVICE_TAGS.items():
+        for tag in tags:
+            owners.setdefault(tag, []).append(key)
+    devices = list(trade_config["devices"].keys())
+    trade_tags = {tag for key in devices for tag in DEVICE_TAGS.get(key, [])}
+    return {
+        "devices": devices,
+        "tags": {tag: owners[tag][0] for tag in trade_tags if len(owners[tag]) == 1},
+        "ambiguous": {tag: owners[tag] for tag in trade_tags if len(owners[tag]) > 1},
+        "untagged": [key for key in devices if not DEVICE_TAGS.get(key)],
+    }
+
+
+def _multiply(m: List[float], n: List[float]) -> List[float]:
+    """Matrix product m x n of two PDF transformation matrices."""
+    a, b, c, d, e, f = m
+    return [
+        a * n[0] + b * n[2], a * n[1] + b * n[3],
+        c * n[0] + d * n[2], c * n[1] + d * n[3],
+        e * n[0] + f * n[2] + n[4], e * n[1] + f * n[3] + n[5],
+    ]
+
+
+def _symbol_box(points: List[Tuple[float, float]]) -> Optional[Tuple[float, float, float, float]]:
+    xs, ys = [x for x, _ in points], [y for _, y in points]
+    width, height = max(xs) - min(xs), max(ys) - min(ys)
+    if not (SYMBOL_MIN_SIZE <= width <= SYMBOL_MAX_SIZE and SYMBOL_MIN_SIZE <= height <= SYMBOL_MAX_SIZE):
+        return None
+    if max(width, height) > SYMBOL_MAX_ASPECT * min(width, height):
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _scan_graphics(content, resources, ctm: List[float], reader, depth: int = 0) -> Tuple[List[Tuple], float]:
+    """
+    Boxes (in user space) of the closed, symbol-sized subpaths this content
+    paints, and the area covered by raster images.
+    """
+    symbols = []
+    raster_area = 0.0
+    stack = []
+    subpaths = []  # [points, closed]
+
+    if not isinstance(content, ContentStream):
+        content = ContentStream(content, reader)
+    for operands, operator in content.operations:
+        if operator == b"q":
+            stack.append(ctm)
+        elif operator == b"Q":
+            ctm = stack.pop() if stack else ctm
+        elif operator == b"cm":
+            ctm = _multiply([float(v) for v in operands], ctm)
+        elif operator in (b"m", b"l", b"c", b"v", b"y"):
+            a, b, c, d, e, f = ctm
+            coords = [float(v) for v in operands]
+            points = [(a * x + c * y + e, b * x + d * y + f) for x, y in zip(coords[::2], coords[1::2])]
+            if operator == b"m" or not subpaths:
+                subpaths.append([points, False])
+            else:
+                subpaths[-1][0].extend(points)
+        elif operator == b"re":
+            x, y, w, h = (float(v) for v in operands)
+            a, b, c, d, e, f = ctm
+            corners = [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+            subpaths.append([[(a * px + c * py + e, b * px + d * py + f) for px, py in corners], True])
+        elif operator == b"h":
+            if subpaths:
+                subpaths[-1][1] = True
+        elif operator in PAINT_OPERATORS or operator == b"n":
+            if operator != b"n":
+                for points, closed in subpaths:
+                    closed = closed or PAINT_OPERATORS[operator] or points[0] == points[-1]
+                    box = _symbol_box(points) if closed and len(points) > 2 else None
+                    if box is not None:
+                        symbols.append(box)
+            subpaths = []
+        elif operator == b"INLINE IMAGE":
+            raster_area += abs(ctm[0] * ctm[3] - ctm[1] * ctm[2])
+        elif operator == b"Do" and resources is not None:
+            xobject = resources.get("/XObject", {}).get(operands[0])
+            if xobject is None:
+                continue
+            xobject = xobject.get_object()
+            if xobject.get("/Subtype") == "/Image":
+                raster_area += abs(ctm[0] * ctm[3] - ctm[1] * ctm[2])
+            elif xobject.get("/Subtype") == "/Form" and depth < MAX_FORM_DEPTH:
+                matrix = [float(v) for v in xobject.get("/Matrix", IDENTITY)]
+                form_resources = xobject.get("/Resources")
+                form_symbols, form_raster = _scan_graphics(
+                    xobject, form_resources.get_object() if form_resources is not None else resources,
+                    _multiply(matrix, ctm), reader, depth + 1
+                )
+                symbols.extend(form_symbols)
+                raster_area += form_raster
+    return symbols, raster_area
+
+
+def _padded(symbol: Tuple) -> Tuple[float, float, float, float]:
+    x0, y0, x1, y1 = symbol
+    pad_x, pad_y = TAG_TOLERANCE * (x1 - x0), TAG_TOLERANCE * (y1 - y0)
+    return x0 - pad_x, y0 - pad_y, x1 + pad_x, y1 + pad_y
+
+
+def _symbol_grid(symbols: List[Tuple]) -> Dict[Tuple[int, int], List[int]]:
+    """Bucket symbols by the SYMBOL_MAX_SIZE grid cells they cover, so a point is only tested against its cell."""
+    grid = {}
+    for idx, symbol in enumerate(symbols):
+        x0, y0, x1, y1 = _padded(symbol)
+        for cx in range(int(x0 // SYMBOL_MAX_SIZE), int(x1 // SYMBOL_MAX_SIZE) + 1):
+            for cy in range(int(y0 // SYMBOL_MAX_SIZE), int(y1 // SYMBOL_MAX_SIZE) + 1):
+                grid.setdefault((cx, cy), []).append(idx)
+    return grid
+
+
+def _containing(symbols: List[Tuple], grid: Dict, x: float, y: float) -> Optional[int]:
+    """Index of the smallest symbol around a point, allowing TAG_TOLERANCE."""
+    best, best_area = None, None
+    for idx in grid.get((int(x // SYMBOL_MAX_SIZE), int(y // SYMBOL_MAX_SIZE)), []):
+        x0, y0, x1, y1 = _padded(symbols[idx])
+        if x0 <= x <= x1 and y0 <= y <= y1:
+            sx0, sy0, sx1, sy1 = symbols[idx]
+            area = (sx1 - sx0) * (sy1 - sy0)
+            if best_area is None or area < best_area:
+                best, best_area = idx, area
+    return best
+
+
+def vector_takeoff(page, library: Dict) -> Dict:
+    """
+    Count the trade's devices on a PyPDF2 page from its text and vector paths.
+
+    A device is a tag from the symbol library ("SD", "FDC" ...) inside a
+    small closed path. Returns a page result like the model's, or
+    {"fallback": reason} when the page needs the vision model: it has no
+    text layer or mostly raster content, a symbol legend, a tag that is
+    ambiguous or outside any symbol, no tags at all, or symbol-sized
+    shapes without a tag.
+    """
+    started = time.perf_counter()
+    box = page.mediabox
+    left, bottom = float(box.left), float(box.bottom)
+    width, height = float(box.width) or 1.0, float(box.height) or 1.0
+    rotation = (page.get('/Rotate') or 0) % 360
+
+    try:
+        content = page.get_contents()
+        if content is not None:
+            # Parsing dominates; text extraction reuses the parsed stream
+            content = ContentStream(content, page.pdf, "bytes")
+            page[NameObject("/Contents")] = content
+        fragments = [(text.strip().upper(), x, y) for text, x, y in text_fragments(page)]
+        resources = page.get("/Resources")
+        symbols, raster_area = _scan_graphics(
+            content, resources.get_object() if resources is not None else None, IDENTITY, page.pdf
+        ) if content is not None else ([], 0.0)
+    except Exception as e:
+        return {"fallback": f"unreadable page content ({e})"}
+
+    if not fragments:
+        return {"fallback": "no text layer"}
+    if raster_area > RASTER_MAX_FRACTION * width * height:
+        return {"fallback": "mostly raster content"}
+
+    def on_plan(x: float, y: float) -> bool:
+        return not in_title_block(*to_display_coords(x - left, y - bottom, width, height, rotation))
+
+    symbols = [s for s in symbols if on_plan((s[0] + s[2]) / 2, (s[1] + s[3]) / 2)]
+    grid = _symbol_grid(symbols)
+    known_tags = set(library["tags"]) | set(library["ambiguous"])
+    counts = {key: 0 for key in library["devices"]}
+    tag_counts = {}
+    labeled = set()
+    for text, x, y in fragments:
+        if "LEGEND" in text:
+            return {"fallback": "sheet has a symbol legend"}
+        if not on_plan(x, y):
+            continue
+        symbol = _containing(symbols, grid, x, y)
+        if symbol is not None:
+            labeled.add(symbol)
+        if text not in known_tags:
+            if "\n" in text and any(line.strip() in known_tags for line in text.split("\n")):
+                return {"fallback": "tags run together in the text layer"}
+            continue
+        if text in library["ambiguous"]:
+            return {"fallback": f"tag \"{text}\" can mean {' or '.join(library['ambiguous'][text])}"}
+        if symbol is None:
+            return {"fallback": f"tag \"{text}\" outside any symbol"}
+        counts[library["tags"][text]] += 1
+        tag_counts[text] = tag_counts.get(text, 0) + 1
+
+    if not tag_counts:
+        return {"fallback": "no device tags"}
+    # A symbol-sized shape with no text in it may be a device drawn without
+    # its tag, so the page can't be counted from tags alone. Outlines drawn
+    # twice, or a circle inside a square, belong to the labeled symbol
+    labeled_boxes = [symbols[idx] for idx in labeled]
+    labeled_grid = _symbol_grid(labeled_boxes)
+    plain = [
+        s for idx, s in enumerate(symbols)
+        if idx not in labeled
+        and _containing(labeled_boxes, labeled_grid, (s[0] + s[2]) / 2, (s[1] + s[3]) / 2) is None
+    ]
+    if plain:
+        reason = f"{len(plain)} symbols without a tag"
+        if library["untagged"]:
+            reason += f"; {', '.join(library['untagged'])} have none"
+        return {"fallback": reason}
+
+    return {
+        "page_type": "floor plan",
+        "description": f"{sum(tag_counts.values())} tagged symbols counted from the PDF's vector layer",
+        "devices": counts,
+        "notes": "Tags: " + ", ".join(f"{tag} x{count}" for tag, count in sorted(tag_counts.items())),
+        "metrics": {"outcome": "vector", "vector_ms": elapsed_ms(started)},
+    }
+
+
+def _read_vector_takeoffs(pdf_path: str, pages: List[int], library: Dict) -> Dict[int, Dict]:
+    with open_pdf(pdf_path) as reader:
+        return {page_num: vector_takeoff(reader.pages[page_num - 1], library) for page_num in pages}
+
+
+def read_vector_takeoffs(pdf_path: str, pages: List[int], trade_config: dict,
+                         workers: Optional[int] = None) -> Dict[int, Dict]:
+    """Vector takeoff of the given pages, spreading large sets over a process pool."""
+    return map_page_chunks(_read_vector_takeoffs, pdf_path, pages, symbol_library(trade_config), workers=workers)
@@ -0,0 +1,187 @@
+"""
+BidSync AI - Background Workers
+Pool of worker processes that run analysis jobs from a queue, so the app only
+submits jobs and polls their progress
+"""
+
+import atexit
+import multiprocessing as mp
+import os
+import queue
+import time
+from typing import Dict, List, Optional
+
+from addendum import analyze_addendum
+from documents import prune_uploads
+from engine import JobCancelled, analyze_pdf
+from job_store import DEFAULT_DB_PATH, JobStore, file_sha256
+from pdf_render import DEFAULT_RENDER_PROFILE
+from pipeline import DEFAULT_MAX_IN_FLIGHT
+from trades import resolve_trade_config
+
+DEFAULT_WORKERS = int(os.environ.get("BIDSYNC_WORKERS", "2"))
+# Model calls in flight across every worker and job at once
+DEFAULT_MAX_MODEL_CALLS = int(os.environ.get("BIDSYNC_MAX_MODEL_CALLS", "8"))
+SHUTDOWN_TIMEOUT = 5.0
+
+
+def _worker_main(job_queue, call_gate, db_path: str, parent_pid: int):
+    """Run jobs until told to stop or the parent process goes away."""
+    store = JobStore(db_path)
+    while os.getppid() == parent_pid:
+        try:
+            job = job_queue.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        if job is None:
+            break
+
+        job_id = job["job_id"]
+        if store.cancel_requested(job_id):
+            store.set_status(job_id, "cancelled")
+            continue
+        try:
+            if job["previous_job_id"] is not None:
+                analyze_addendum(
+                    job["pdf_path"],
+                    job["previous_job_id"],
+                    job["api_key"],
+                    store,
+                    max_in_flight=job["max_in_flight"],
+                    filename=job["filename"],
+                    client_kwargs=job["client_kwargs"],
+                    job_id=job_id,
+                    call_gate=call_gate
+                )
+                continue
+            analyze_pdf(
+                job["pdf_path"],
+                job["trade"],
+                job["api_key"],
+                pages=job["pages"],
+                trade_keys=job["trades"],
+                max_in_flight=job["max_in_flight"],
+                use_triage=job["use_triage"],
+                use_vector=job["use_vector"],
+                use_legend=job["use_legend"],
+                tiled=job["tiled"],
+                ensemble=job["ensemble"],
+                render_profile=job["render_profile"],
+                filename=job["filename"],
+                client_kwargs=job["client_kwargs"],
+                store=store,
+                job_id=job_id,
+                call_gate=call_gate
+            )
+        except JobCancelled:
+            pass
+        except Exception as e:
+            store.set_status(job_id, "failed", error=str(e))
+    store.close()
+
+
+class WorkerPool:
+    """
+    Worker processes fed from one job queue.
+
+    Progress and results go through the job store, so any process (or
+    browser session) can poll a job by id. All workers share one
+    semaphore that caps concurrent model calls across every job.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_model_calls: int = DEFAULT_MAX_MODEL_CALLS,
+                 db_path: str = DEFAULT_DB_PATH):
+        # Spawn, not fork: the app process already runs threads
+        context = mp.get_context("spawn")
+        self.store = JobStore(db_path)
+        self.job_queue = context.Queue()
+        self.call_gate = context.Semaphore(max_model_calls)
+        self.max_model_calls = max_model_calls
+        self.processes = [
+            context.Process(
+                target=_worker_main,
+                args=(self.job_queue, self.call_gate, db_path, os.getpid()),
+                name=f"bidsync-worker-{idx}"
+            )
+            for idx in range(max(1, workers))
+        ]
+        for process in self.processes:
+            process.start()
+        prune_uploads()
+        atexit.register(self.shutdown)
+
+    def submit(self, pdf_path: str, trade_key: str, api_key: str, pages: List[int],
+               trade_keys: Optional[List[str]] = None, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+               use_triage: bool = True, use_vector: bool = True, use_legend: bool = True, tiled: bool = False,
+               ensemble: int = 1, render_profile: str = DEFAULT_RENDER_PROFILE,
+               filename: Optional[str] = None,
+               client_kwargs: Optional[Dict] = None, previous_job_id: Optional[str] = None) -> str:
+        """
+        Queue a job and return its id.
+
+        An unfinished job for the same file, trade and options is queued
+        again instead, so it resumes from its last finished page. The API
+        key only travels through the queue; it is never written to disk.
+
+        With previous_job_id the PDF is an addendum to that job: trade and
+        options come from it, and only new or changed sheets are analyzed.
+        The job starts with the earlier job's options; the worker matches
+        the sheets and narrows its pages to the ones in scope.
+        """
+        filename = filename or os.path.basename(pdf_path)
+        file_hash = file_sha256(pdf_path)
+        if previous_job_id is not None:
+            previous_job = self.store.get_job(previous_job_id)
+            if previous_job is None:
+                raise ValueError(f"No job {previous_job_id}")
+            trade_key, trade_keys = previous_job["trade"], previous_job["trades"]
+            options = previous_job["options"]
+            job = self.store.find_resumable_addendum(file_hash, previous_job_id)
+        else:
+            trade_keys = resolve_trade_config(trade_key, trade_keys).get("trades")
+            options = {"pages": sorted(set(pages)), "use_triage": use_triage, "use_vector": use_vector,
+                       "use_legend": use_legend, "tiled": tiled, "ensemble": ensemble,
+                       "render_profile": render_profile}
+            job = self.store.find_resumable(file_hash, trade_key, trade_keys, options)
+        if job is not None:
+            job_id = job["id"]
+            self.store.queue_job(job_id)
+        else:
+            job_id = self.store.create_job(filename, file_hash, trade_key, trade_keys, options, status="queued",
+                                           previous_job_id=previous_job_id)
+
+        self.job_queue.put({
+            "job_id": job_id,
+            "pdf_path": pdf_path,
+            "trade": trade_key,
+            "trades": trade_keys,
+            "api_key": api_key,
+            "pages": options["pages"],
+            "max_in_flight": max_in_flight,
+            "use_triage": use_triage,
+            "use_vector": use_vector,
+            "use_legend": use_legend,
+            "tiled": tiled,
+            "ensemble": ensemble,
+            "render_profile": render_profile,
+            "filename": filename,
+            "client_kwargs": client_kwargs or {},
+            "previous_job_id": previous_job_id,
+        })
+        return job_id
+
+    def cancel(self, job_id: str):
+        """Ask the job to stop; pages already finished are kept."""
+        self.store.request_cancel(job_id)
+
+    def progress(self, job_id: str) -> Optional[Dict]:
+        return self.store.job_progress(job_id)
+
+    def shutdown(self):
+        for _ in self.processes:
+            self.job_queue.put(None)
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()